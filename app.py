@@ -4,14 +4,36 @@ PaddleOCR Server CPU Optimizado v3.0
 Servidor OCR optimizado para CPU con configuración GANADORA
 """
 
+import io
 import os
+import sys
+import gc
+import copy
+import bisect
+import contextlib
 import json
+import math
+import sqlite3
+import hashlib
+import hmac
+import itertools
 import time
+import queue
 import tempfile
+import threading
+import tracemalloc
+import uuid
+import zipfile
+import zlib
+import urllib.request
 import numpy as np
 import cv2
 from pathlib import Path
-from flask import Flask, request, jsonify, render_template_string
+import multiprocessing
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from flask import Flask, Request, Response, g, request, jsonify, render_template_string
 from werkzeug.utils import secure_filename
 import logging
 from datetime import datetime
@@ -24,19 +46,163 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class InMemoryRequest(Request):
+    """Request que mantiene las subidas en memoria (sin SpooledTemporaryFile a disco)"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= MAX_FILE_SIZE + 1024 * 1024:
+            return io.BytesIO()
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
 app = Flask(__name__)
+app.request_class = InMemoryRequest
 
 # Configuración CPU optimizada
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf', 'bmp', 'tiff', 'tif'}
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
 RATE_LIMIT_WINDOW = 60
 RATE_LIMIT_REQUESTS = 100
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '10000'))
+RATE_LIMIT_DB = os.environ.get('RATE_LIMIT_DB', '')  # p.ej. /app/data/ratelimit.sqlite3 (compartido entre procesos)
+
+# Pool de inferencia: N réplicas por idioma alimentadas desde una cola acotada
+CPU_THREADS = int(os.environ.get('CPU_THREADS', '4'))
+OCR_WORKERS = max(1, int(os.environ.get('OCR_WORKERS', '2')))
+OCR_QUEUE_SIZE = max(1, int(os.environ.get('OCR_QUEUE_SIZE', '16')))
+OCR_EXECUTION_MODE = os.environ.get('OCR_EXECUTION_MODE', 'thread').lower()  # thread | process
+THREADS_PER_WORKER = max(1, CPU_THREADS // OCR_WORKERS)
+HTTP_THREADS = int(os.environ.get('HTTP_THREADS', str(OCR_WORKERS + OCR_QUEUE_SIZE)))
+
+# Modelos por idioma: det/cls compartidos, reconocedores cargados bajo demanda
+OCR_PRELOAD_LANGUAGES = os.environ.get('OCR_PRELOAD_LANGUAGES', '')      # vacío = solo DEFAULT_LANGUAGE
+OCR_MODEL_IDLE_TIMEOUT = float(os.environ.get('OCR_MODEL_IDLE_TIMEOUT', '1800'))  # 0 = no descargar
+OCR_MAX_RECOGNIZERS = int(os.environ.get('OCR_MAX_RECOGNIZERS', '4'))    # por réplica, 0 = sin límite
+
+# Backend de inferencia: paddle (Paddle Inference + MKL-DNN) | onnx (ONNX Runtime, modelos de convert_onnx.py)
+OCR_BACKEND = os.environ.get('OCR_BACKEND', 'paddle').lower()
+ONNX_MODEL_DIR = os.environ.get('ONNX_MODEL_DIR', '/app/.paddleocr/onnx')
+ONNX_INT8 = os.environ.get('ONNX_INT8', 'false').lower() == 'true'  # Modelos cuantizados (model.int8.onnx)
+
+# Arranque: carga de modelos en segundo plano (el servidor ya responde /livez) y calentamiento
+OCR_BACKGROUND_STARTUP = os.environ.get('OCR_BACKGROUND_STARTUP', 'true').lower() == 'true'
+OCR_WARMUP = os.environ.get('OCR_WARMUP', 'true').lower() == 'true'
+
+# Resolución de detección por petición: fixed (det_limit_side_len de cpu_config) | auto | tiled
+DET_RESOLUTION = os.environ.get('DET_RESOLUTION', 'fixed').lower()
+DET_RESOLUTION_BUCKETS = sorted(int(side) for side in os.environ.get('DET_RESOLUTION_BUCKETS', '640,960,1280,1600').split(','))
+DET_MIN_TEXT_HEIGHT = float(os.environ.get('DET_MIN_TEXT_HEIGHT', '12'))  # px de carácter tras el redimensionado
+
+# Detección por teselas (DET_RESOLUTION=tiled o det_limit_side_len=tiled): tickets largos y escaneos enormes
+DET_TILE_OVERLAP = int(os.environ.get('DET_TILE_OVERLAP', '128'))      # Solape entre teselas (> altura de línea)
+DET_TILE_SIZE = max(2 * DET_TILE_OVERLAP + 32, int(os.environ.get('DET_TILE_SIZE', '960')))  # Lado de tesela (se detecta sin reducir)
+DET_TILE_MIN_ASPECT = float(os.environ.get('DET_TILE_MIN_ASPECT', '2.5'))  # Relación de aspecto de un ticket largo
+DET_TILE_MIN_PIXELS = int(os.environ.get('DET_TILE_MIN_PIXELS', '16000000'))  # Escaneos enormes
+DET_TILE_INGEST_MAX_SIDE = int(os.environ.get('DET_TILE_INGEST_MAX_SIDE', '8000'))  # Lado largo tras la ingesta con teselas
+DET_TILE_CONTAINED = 0.6      # Fracción de una caja dentro de otra de otra tesela para descartarla (duplicado)
+DET_TILE_SAME_ROW = 0.6       # Solape vertical para fundir dos trozos de la misma línea cortada por una tesela
+
+# Pre-chequeo de orientación por página: el clasificador de ángulo solo corre en páginas giradas o mixtas
+CLS_PRECHECK = os.environ.get('CLS_PRECHECK', 'true').lower() == 'true'
+CLS_PRECHECK_SAMPLES = int(os.environ.get('CLS_PRECHECK_SAMPLES', '6'))  # Recortes muestreados por página
+CLS_PRECHECK_MAX_VERTICAL = float(os.environ.get('CLS_PRECHECK_MAX_VERTICAL', '0.1'))  # Fracción de cajas verticales tolerada
+
+# Micro-batching de reconocimiento entre peticiones (solo modo thread)
+REC_BATCHING = os.environ.get('REC_BATCHING', 'false').lower() == 'true'
+REC_BATCH_MAX = max(1, int(os.environ.get('REC_BATCH_MAX', '48')))
+REC_BATCH_WAIT_MS = float(os.environ.get('REC_BATCH_WAIT_MS', '5'))
+
+# Caché de resultados OCR (memoria LRU + disco opcional, p.ej. /app/data/cache)
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', '256'))
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', '')
+RESULT_CACHE_DISK_MAX = int(os.environ.get('RESULT_CACHE_DISK_MAX', '10000'))
+
+# Capa de texto nativa de PDF: páginas generadas digitalmente no pasan por OCR
+TEXT_LAYER_MIN_CHARS = int(os.environ.get('TEXT_LAYER_MIN_CHARS', '20'))
+TEXT_LAYER_MAX_IMAGE_COVERAGE = float(os.environ.get('TEXT_LAYER_MAX_IMAGE_COVERAGE', '0.7'))
+
+# Respuesta NDJSON en streaming (stream=true): bloques por registro
+STREAM_BLOCK_CHUNK = max(1, int(os.environ.get('STREAM_BLOCK_CHUNK', '200')))
+
+# Reconstrucción de layout (layout=lines|paragraphs), en unidades de altura de línea
+LAYOUT_MODES = ('lines', 'paragraphs')
+LAYOUT_COLUMN_GAP = float(os.environ.get('LAYOUT_COLUMN_GAP', '1.5'))       # Hueco mínimo entre columnas
+LAYOUT_SECTION_GAP = float(os.environ.get('LAYOUT_SECTION_GAP', '1.5'))     # Hueco vertical que separa secciones
+LAYOUT_PARAGRAPH_GAP = float(os.environ.get('LAYOUT_PARAGRAPH_GAP', '0.8'))  # Interlineado máximo dentro de un párrafo
+LAYOUT_ROW_TOLERANCE = 0.25   # Desfase vertical para considerar dos cajas en la misma fila
+LAYOUT_ALIGNED_ROWS = 0.6     # Fracción de filas alineadas a ambos lados de un hueco que indica tabla, no columnas
+LAYOUT_TABLE_MIN_ROWS = 3     # Filas con celdas a ambos lados del hueco para considerar tabla
+LAYOUT_TABLE_CELL_GAP = 4.0   # Ancho máximo de las celdas del lado más estrecho, en anchos de hueco (más = texto en columnas)
+LAYOUT_MAX_DEPTH = 64
+
+# Ingesta de imágenes: límite de píxeles, reducción al decodificar y presupuesto global en memoria
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', '100000000'))     # Por página, leído de la cabecera
+IMAGE_INGEST_MAX_SIDE = int(os.environ.get('IMAGE_INGEST_MAX_SIDE', '4000'))  # Lado largo tras la ingesta (0 = resolución original)
+PIXEL_BUDGET = int(os.environ.get('PIXEL_BUDGET', '200000000'))             # Píxeles decodificados en vuelo en el servidor (0 = sin límite)
+PIXEL_BUDGET_WAIT = float(os.environ.get('PIXEL_BUDGET_WAIT', '30'))        # Espera máxima por presupuesto antes del 503
+
+# Plazo por petición (timeout_ms= o cabecera X-Timeout-Ms): trabajo en cola caducado se descarta
+REQUEST_TIMEOUT_MS = int(os.environ.get('REQUEST_TIMEOUT_MS', '0'))         # Plazo por defecto (0 = sin plazo)
+
+# Formatos de respuesta (format= o Accept: application/msgpack en /process)
+RESPONSE_FORMATS = ('json', 'columnar', 'msgpack')
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+BLOCK_FIELDS = ('block_id', 'text', 'confidence', 'coordinates', 'orientation', 'page')
+
+# OCR por regiones de interés (rois=[...] en /process y /jobs)
+ROI_MAX_REGIONS = int(os.environ.get('ROI_MAX_REGIONS', '50'))
+ROI_MODES = ('detect', 'line')  # line: una sola línea conocida, solo reconocimiento
+
+# API asíncrona de trabajos (POST /jobs, GET /jobs/<id>)
+JOB_WORKERS = max(1, int(os.environ.get('JOB_WORKERS', '2')))
+JOB_QUEUE_SIZE = max(1, int(os.environ.get('JOB_QUEUE_SIZE', '200')))
+JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', '3600'))
+JOB_MAX_BATCH_FILES = int(os.environ.get('JOB_MAX_BATCH_FILES', '100'))
+JOB_MAX_BATCH_BYTES = int(os.environ.get('JOB_MAX_BATCH_BYTES', str(500 * 1024 * 1024)))  # Descomprimidos por lote (413 si se supera)
+JOB_SPOOL_DIR = os.environ.get('JOB_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'ocr-jobs'))
+JOB_SATURATED_MAX_WAIT = float(os.environ.get('JOB_SATURATED_MAX_WAIT', '600'))  # Espera máxima de un trabajo con el pool lleno (s)
+
+# Perfilado por petición (profile=true|sample con cabecera X-Admin-Token) y trazas lentas (GET /debug/slow)
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')                      # Vacío = perfilado y /debug desactivados
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', '5'))  # Muestreo de pilas (profile=sample)
+PROFILE_TOP_STACKS = 30       # Pilas más frecuentes devueltas
+PROFILE_MAX_DEPTH = 40        # Marcos por pila muestreada
+TRACE_MAX_EVENTS = 500        # Eventos de traza por petición (páginas, teselas, lotes)
+SLOW_TRACE_BUFFER = int(os.environ.get('SLOW_TRACE_BUFFER', '50'))        # Trazas retenidas en /debug/slow
+SLOW_TRACE_MIN_MS = float(os.environ.get('SLOW_TRACE_MIN_MS', '2000'))    # Peticiones más lentas entran en el buffer
+
+# Métricas Prometheus (GET /metrics): buckets de latencia y de bloques por página
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRICS_BLOCK_BUCKETS = (0, 5, 10, 25, 50, 100, 200, 500, 1000)
+
+# 🏆 CONFIGURACIÓN GANADORA OPTIMIZADA PARA CPU
+cpu_config = {
+    'use_angle_cls': True,           # ✅ CRÍTICO: Detección de ángulos
+    'use_gpu': False,                # ✅ CPU forzado
+    'det_db_thresh': 0.1,            # 🏆 CLAVE: MUY sensible (más detección)
+    'det_db_box_thresh': 0.4,        # 🏆 CLAVE: MUY sensible (más cajas)
+    'drop_score': 0.2,               # 🏆 CLAVE: MUY permisivo (más texto)
+    'show_log': False,               # Sin logs verbosos
+    'enable_mkldnn': True,           # ✅ Optimización CPU Intel
+    'cpu_threads': THREADS_PER_WORKER,  # ✅ Threads por réplica (CPU_THREADS / OCR_WORKERS)
+    'det_limit_side_len': 960,       # ✅ Resolución balanceada
+    'rec_batch_num': int(os.environ.get('REC_BATCH_NUM', '6'))  # ✅ Batch CPU optimizado
+}
 
 # Variables globales
-ocr_instances = {}
-supported_languages = ["en", "es"]
-default_lang = "es"
+supported_languages = [lang.strip() for lang in os.environ.get('SUPPORTED_LANGUAGES', 'en,es').split(',') if lang.strip()]
+default_lang = os.environ.get('DEFAULT_LANGUAGE', 'es')
+if default_lang not in supported_languages:
+    supported_languages.append(default_lang)
 ocr_initialized = False
+init_lock = threading.Lock()
+startup_state = {
+    'phase': 'pending',
+    'started_at': None,
+    'finished_at': None,
+    'phases': {},
+    'error': None
+}
+warmed_languages = set()
 server_stats = {
     'startup_time': time.time(),
     'total_requests': 0,
@@ -45,7 +211,479 @@ server_stats = {
     'total_processing_time': 0.0,
     'models_loaded': False
 }
-request_history = []
+rate_limiter = None
+ocr_pool = None
+rec_batcher = None
+result_cache = None
+job_manager = None
+server_stats_lock = threading.Lock()
+
+def update_server_stats(**deltas):
+    """Sumar contadores a server_stats de forma atómica (peticiones concurrentes)"""
+    with server_stats_lock:
+        for key, delta in deltas.items():
+            server_stats[key] += delta
+
+def server_stats_snapshot():
+    """Copia consistente de server_stats para los endpoints de lectura"""
+    with server_stats_lock:
+        return dict(server_stats)
+
+def read_rss_bytes(pid='self'):
+    """Memoria residente (RSS) de un proceso según /proc, 0 si no está disponible"""
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def _format_labels(labels):
+    """Etiquetas en sintaxis Prometheus: {a="x",b="y"}"""
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+class Metric:
+    """Métrica Prometheus (counter | gauge) con etiquetas, segura entre threads.
+    
+    Con set_function() el valor se calcula al exportar (p.ej. profundidad de
+    la cola); la función devuelve un número o {tupla de etiquetas: valor}.
+    """
+    
+    def __init__(self, name, help_text, metric_type, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.type = metric_type
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.callback = None
+        self.lock = threading.Lock()
+    
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+    
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+    
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+    
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+    
+    def set_function(self, callback):
+        self.callback = callback
+    
+    def samples(self):
+        """(sufijo, etiquetas, valor) de cada serie"""
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception as e:
+                logger.debug(f"⚠️ Métrica {self.name} no disponible: {e}")
+                return
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self.lock:
+                values = dict(self.values)
+        for key, value in values.items():
+            yield '', list(zip(self.labelnames, key)), value
+
+class Histogram(Metric):
+    """Histograma Prometheus con buckets fijos y etiquetas"""
+    
+    def __init__(self, name, help_text, buckets, labelnames=()):
+        super().__init__(name, help_text, 'histogram', labelnames)
+        self.buckets = tuple(buckets)
+    
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state['counts'][index] += 1
+            state['sum'] += value
+            state['count'] += 1
+    
+    def samples(self):
+        with self.lock:
+            values = {key: {**state, 'counts': list(state['counts'])} for key, state in self.values.items()}
+        for key, state in values.items():
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                yield '_bucket', labels + [('le', _format_value(bound))], cumulative
+            yield '_bucket', labels + [('le', '+Inf')], state['count']
+            yield '_sum', labels, state['sum']
+            yield '_count', labels, state['count']
+
+class MetricsRegistry:
+    """Registro de métricas exportado en formato de texto Prometheus"""
+    
+    def __init__(self):
+        self.metrics = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def _register(self, metric):
+        with self.lock:
+            self.metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Metric(name, help_text, 'counter', labelnames))
+    
+    def gauge(self, name, help_text, labelnames=()):
+        return self._register(Metric(name, help_text, 'gauge', labelnames))
+    
+    def histogram(self, name, help_text, buckets, labelnames=()):
+        return self._register(Histogram(name, help_text, buckets, labelnames))
+    
+    def render(self):
+        with self.lock:
+            registered = list(self.metrics.values())
+        lines = []
+        for metric in registered:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+metric_requests = metrics.counter('ocr_http_requests_total', 'Peticiones HTTP terminadas',
+                                  ('endpoint', 'status'))
+metric_in_flight = metrics.gauge('ocr_http_requests_in_flight', 'Peticiones (y trabajos) en curso',
+                                 ('endpoint',))
+metric_request_seconds = metrics.histogram('ocr_request_duration_seconds', 'Latencia total por petición',
+                                           METRICS_LATENCY_BUCKETS, ('endpoint', 'language'))
+metric_stage_seconds = metrics.histogram('ocr_stage_duration_seconds',
+                                         'Tiempo por etapa (upload, decode, text_layer, detection, crop, '
+                                         'classification, recognition, tile_merge, postprocess, serialization)',
+                                         METRICS_LATENCY_BUCKETS, ('stage', 'endpoint', 'language'))
+metric_blocks_per_page = metrics.histogram('ocr_blocks_per_page', 'Bloques de texto por página con OCR',
+                                           METRICS_BLOCK_BUCKETS, ('endpoint', 'language'))
+metric_cls_pages = metrics.counter('ocr_cls_pages_total', 'Páginas con OCR según si corrió el clasificador de ángulo',
+                                   ('decision',))
+metric_det_tiles = metrics.counter('ocr_det_tiles_total', 'Detección por teselas: páginas teseladas y teselas detectadas',
+                                   ('kind',))
+metric_deadline_expired = metrics.counter('ocr_deadline_expired_total',
+                                          'Plazos (timeout_ms) agotados: tareas descartadas en cola, documentos '
+                                          'truncados y peticiones respondidas con 504', ('stage',))
+metrics.gauge('ocr_queue_depth', 'Tareas esperando en la cola de inferencia').set_function(
+    lambda: ocr_pool.jobs.qsize() if ocr_pool else 0)
+metrics.gauge('ocr_queue_capacity', 'Capacidad de la cola de inferencia').set_function(
+    lambda: ocr_pool.queue_size if ocr_pool else 0)
+metrics.gauge('ocr_busy_workers', 'Réplicas ejecutando una tarea').set_function(
+    lambda: ocr_pool.busy_workers if ocr_pool else 0)
+metrics.counter('ocr_pool_completed_tasks_total', 'Tareas terminadas por el pool').set_function(
+    lambda: ocr_pool.completed if ocr_pool else 0)
+metrics.counter('ocr_pool_rejected_tasks_total', 'Tareas rechazadas por cola llena').set_function(
+    lambda: ocr_pool.rejected if ocr_pool else 0)
+metrics.gauge('ocr_model_memory_bytes', 'Memoria de los modelos por réplica (RSS añadido al cargar, '
+              'o RSS del proceso worker)', ('replica',)).set_function(
+    lambda: {(str(index),): replica.memory_bytes() for index, replica in enumerate(ocr_pool.replicas)}
+    if ocr_pool else {})
+metrics.gauge('process_resident_memory_bytes', 'Memoria residente del proceso HTTP').set_function(read_rss_bytes)
+metrics.counter('ocr_result_cache_events_total', 'Eventos de la caché de resultados', ('event',)).set_function(
+    lambda: {(event,): count for event, count in result_cache.stats().items()
+             if event in ResultCache.COUNTER_KEYS} if result_cache else {})
+metrics.gauge('ocr_pixel_budget_in_use', 'Píxeles decodificados reservados por documentos en vuelo').set_function(
+    lambda: pixel_budget.in_use if pixel_budget else 0)
+metrics.counter('ocr_pixel_budget_rejected_total', 'Peticiones rechazadas por presupuesto de píxeles agotado').set_function(
+    lambda: pixel_budget.rejected if pixel_budget else 0)
+metrics.counter('ocr_rate_limited_total', 'Peticiones rechazadas con 429').set_function(
+    lambda: rate_limiter.limited if rate_limiter else 0)
+metrics.gauge('ocr_jobs', 'Trabajos asíncronos retenidos por estado', ('status',)).set_function(
+    lambda: {(status,): count for status, count in job_manager.stats()['by_status'].items()}
+    if job_manager else {})
+
+class RequestMetrics:
+    """Tiempos por etapa de una petición.
+    
+    Se asocia al thread de la petición; el pool la propaga a sus workers (y
+    los procesos worker devuelven sus tiempos) para que cada etapa sume aquí.
+    finish() vuelca todo a los histogramas una sola vez.
+    """
+    
+    # Peticiones en curso y arrancadas en total (para saber si un perfilado corrió en solitario)
+    _count_lock = threading.Lock()
+    in_flight = 0
+    started = 0
+    
+    def __init__(self, endpoint, language=''):
+        self.endpoint = endpoint
+        self.language = language
+        self.status = 500
+        self.deferred = False
+        self.stages = {}
+        self.start_time = time.perf_counter()
+        self.deadline = None
+        self.finished = False
+        self.events = []
+        self.info = {}
+        self.threads = set()
+        self.profile = None
+        self.lock = threading.Lock()
+        with RequestMetrics._count_lock:
+            RequestMetrics.in_flight += 1
+            RequestMetrics.started += 1
+        metric_in_flight.inc(endpoint=endpoint)
+    
+    def add(self, stage, seconds):
+        with self.lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+    
+    def merge(self, stages):
+        for stage, seconds in stages.items():
+            self.add(stage, seconds)
+    
+    def trace(self, kind, **fields):
+        """Añadir un evento a la traza (dimensiones, cajas, lotes...), acotado a TRACE_MAX_EVENTS"""
+        with self.lock:
+            if len(self.events) < TRACE_MAX_EVENTS:
+                self.events.append({'event': kind, **fields})
+    
+    def extend_trace(self, events):
+        with self.lock:
+            self.events.extend(events[:max(0, TRACE_MAX_EVENTS - len(self.events))])
+    
+    def start_profile(self, sample=False):
+        """Perfilado de memoria (y muestreo de pilas con sample) hasta stop_profile()"""
+        self.profile = RequestProfile(self, sample)
+    
+    def stop_profile(self):
+        """Parar el perfilado (idempotente); devuelve su resumen o None"""
+        return self.profile.stop() if self.profile is not None else None
+    
+    def trace_summary(self):
+        """Traza de la petición: etapas (ms), eventos y, si se perfiló, memoria y pilas"""
+        with self.lock:
+            stages = dict(self.stages)
+            events = list(self.events)
+        summary = {
+            'endpoint': self.endpoint,
+            'language': self.language,
+            **self.info,
+            'elapsed_ms': round((time.perf_counter() - self.start_time) * 1000, 2),
+            'stages_ms': {stage: round(seconds * 1000, 2) for stage, seconds in stages.items()},
+            'events': events
+        }
+        profile = self.stop_profile()
+        if profile is not None:
+            summary['profile'] = profile
+        return summary
+    
+    def observe_blocks(self, count):
+        metric_blocks_per_page.observe(count, endpoint=self.endpoint, language=self.language)
+    
+    def observe_cls(self, skipped):
+        metric_cls_pages.inc(decision='skipped' if skipped else 'run')
+    
+    def set_timeout(self, timeout_ms):
+        """Plazo de la petición contado desde su llegada"""
+        self.deadline = self.start_time + timeout_ms / 1000.0 if timeout_ms else None
+    
+    def remaining(self):
+        """Segundos hasta el plazo (None sin plazo, puede ser negativo)"""
+        return None if self.deadline is None else self.deadline - time.perf_counter()
+    
+    def expired(self):
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+    
+    def finish(self):
+        with self.lock:
+            if self.finished:
+                return
+            self.finished = True
+            stages = dict(self.stages)
+        with RequestMetrics._count_lock:
+            RequestMetrics.in_flight -= 1
+        metric_in_flight.dec(endpoint=self.endpoint)
+        metric_requests.inc(endpoint=self.endpoint, status=self.status)
+        self.stop_profile()
+        if not stages and self.status >= 400:
+            # Rechazos rápidos (400, 429, 503) no ensucian los histogramas de latencia
+            return
+        elapsed = time.perf_counter() - self.start_time
+        metric_request_seconds.observe(elapsed, endpoint=self.endpoint, language=self.language)
+        slow_traces.record(self, elapsed)
+        for stage, seconds in stages.items():
+            metric_stage_seconds.observe(seconds, stage=stage, endpoint=self.endpoint, language=self.language)
+
+_request_metrics_local = threading.local()
+
+def current_request_metrics():
+    """RequestMetrics asociada al thread actual (o None)"""
+    return getattr(_request_metrics_local, 'context', None)
+
+def bind_request_metrics(context):
+    """Asociar (o soltar con None) una RequestMetrics al thread actual"""
+    previous = current_request_metrics()
+    if previous is not None:
+        previous.threads.discard(threading.get_ident())
+    if context is not None:
+        # Threads que trabajan para la petición (para el muestreo de pilas)
+        context.threads.add(threading.get_ident())
+    _request_metrics_local.context = context
+
+def trace_event(kind, context=None, **fields):
+    """Añadir un evento a la traza de la petición en curso (si la hay)"""
+    context = context or current_request_metrics()
+    if context is not None:
+        context.trace(kind, **fields)
+
+def collapse_stack(frame):
+    """Pila de un thread en formato colapsado (raíz;...;hoja) como en los flame graphs"""
+    names = []
+    while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+        code = frame.f_code
+        names.append(f"{Path(code.co_filename).name}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+class RequestProfile:
+    """Perfilado de una petición (profile=true|sample).
+    
+    tracemalloc mide lo asignado desde Python y NumPy mientras dura, pero es de
+    todo el proceso (se arranca con el primer perfilado activo y se para con
+    el último): la cifra solo es de esta petición si corrió en solitario
+    (exclusive=true, ninguna otra petición en curso ni arrancada mientras
+    tanto); si no, es una aproximación que incluye a las demás. Con sample un thread muestrea cada PROFILE_SAMPLE_INTERVAL_MS las
+    pilas de los threads que trabajan para la petición (en modo process solo
+    las del proceso HTTP).
+    """
+    
+    _lock = threading.Lock()
+    _active = 0
+    _started_tracemalloc = False
+    
+    def __init__(self, context, sample=False):
+        with RequestProfile._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                RequestProfile._started_tracemalloc = True
+            RequestProfile._active += 1
+            if RequestProfile._active == 1:
+                tracemalloc.reset_peak()
+        with RequestMetrics._count_lock:
+            # La propia petición ya cuenta como en curso
+            self.started_requests = RequestMetrics.started
+            self.alone = RequestMetrics.in_flight <= 1
+        self.start_bytes = tracemalloc.get_traced_memory()[0]
+        self.result = None
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.sampler = None
+        if sample:
+            self.sampler = threading.Thread(target=self._sample, args=(context,),
+                                            name='request-profiler', daemon=True)
+            self.sampler.start()
+    
+    def _sample(self, context):
+        interval = PROFILE_SAMPLE_INTERVAL_MS / 1000.0
+        while not self.stopped.wait(interval):
+            frames = sys._current_frames()
+            for ident in list(context.threads):
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[collapse_stack(frame)] += 1
+                    self.samples += 1
+    
+    def stop(self):
+        """Resumen: bytes asignados y pico del proceso (desde el inicio) y pilas más frecuentes"""
+        with RequestMetrics._count_lock:
+            exclusive = self.alone and RequestMetrics.started == self.started_requests
+        with RequestProfile._lock:
+            if self.result is not None:
+                return self.result
+            current, peak = tracemalloc.get_traced_memory()
+            RequestProfile._active -= 1
+            if RequestProfile._active == 0 and RequestProfile._started_tracemalloc:
+                tracemalloc.stop()
+                RequestProfile._started_tracemalloc = False
+            self.result = {
+                'memory_scope': 'process',
+                'exclusive': exclusive,
+                'allocated_bytes': current - self.start_bytes,
+                'peak_allocated_bytes': max(0, peak - self.start_bytes),
+                'concurrent_profiles': RequestProfile._active
+            }
+        if self.sampler is not None:
+            self.stopped.set()
+            self.sampler.join()
+            self.result.update(
+                sample_interval_ms=PROFILE_SAMPLE_INTERVAL_MS,
+                samples=self.samples,
+                stacks=[{'stack': stack, 'samples': count}
+                        for stack, count in self.stacks.most_common(PROFILE_TOP_STACKS)])
+        return self.result
+
+class SlowTraceLog:
+    """Buffer circular de las trazas recientes más lentas (GET /debug/slow).
+    
+    Entran las peticiones por encima de SLOW_TRACE_MIN_MS y todas las
+    perfiladas; al llenarse se descartan las más antiguas.
+    """
+    
+    def __init__(self, size, min_seconds):
+        self.traces = deque(maxlen=max(1, size))
+        self.min_seconds = min_seconds
+        self.lock = threading.Lock()
+        self.recorded = 0
+    
+    def record(self, context, elapsed):
+        if context.profile is None and elapsed < self.min_seconds:
+            return
+        trace = context.trace_summary()
+        trace.update(status=context.status, elapsed_ms=round(elapsed * 1000, 2), finished_at=time.time())
+        with self.lock:
+            self.traces.append(trace)
+            self.recorded += 1
+    
+    def snapshot(self, limit=None):
+        """Trazas de la más lenta a la más rápida"""
+        with self.lock:
+            traces = sorted(self.traces, key=lambda trace: trace['elapsed_ms'], reverse=True)
+        return traces[:limit] if limit else traces
+    
+    def stats(self):
+        return {'size': self.traces.maxlen, 'retained': len(self.traces), 'recorded': self.recorded,
+                'min_ms': self.min_seconds * 1000}
+
+slow_traces = SlowTraceLog(SLOW_TRACE_BUFFER, SLOW_TRACE_MIN_MS / 1000.0)
+
+def record_stage(stage, seconds, context=None):
+    """Sumar tiempo a una etapa de la petición en curso (si la hay)"""
+    context = context or current_request_metrics()
+    if context is not None:
+        context.add(stage, seconds)
+
+@contextlib.contextmanager
+def timed_stage(stage, context=None):
+    """Medir un bloque y sumarlo a la etapa de la petición en curso"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start, context)
 
 def allowed_file(filename):
     """Validar extensión de archivo"""
@@ -58,18 +696,184 @@ def check_file_size(file):
     file.seek(0)
     return size <= MAX_FILE_SIZE
 
-def rate_limit_check(request_ip):
-    """Rate limiting"""
-    current_time = time.time()
-    global request_history
-    request_history = [req for req in request_history if current_time - req['time'] < RATE_LIMIT_WINDOW]
+class RateLimiter:
+    """Rate limiting por clave con contador de ventana deslizante, O(1) por petición.
     
-    ip_requests = [req for req in request_history if req['ip'] == request_ip]
-    if len(ip_requests) >= RATE_LIMIT_REQUESTS:
-        return False
+    Cada clave guarda [inicio de ventana, peticiones en la ventana actual,
+    peticiones en la anterior]; la anterior pondera según lo que queda de ella.
+    Las claves viven en un LRU acotado a max_keys y las inactivas más de dos
+    ventanas se descartan al pasar por delante.
+    """
+    
+    def __init__(self, limit, window, max_keys):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.limited = 0
+        self.evicted = 0
     
-    request_history.append({'ip': request_ip, 'time': current_time})
-    return True
+    def _slide(self, state, now):
+        """Aplicar una petición a state; devuelve 0 si se admite o los segundos a esperar"""
+        window_start = now - now % self.window
+        if state[0] != window_start:
+            state[2] = state[1] if state[0] == window_start - self.window else 0
+            state[1] = 0
+            state[0] = window_start
+        
+        weight = 1.0 - (now - window_start) / self.window
+        if state[2] * weight + state[1] + 1 <= self.limit:
+            state[1] += 1
+            return 0
+        
+        # Momento en que la estimación vuelve a dejar hueco para una petición
+        allowed = self.limit - 1
+        if state[1] <= allowed and state[2] > 0:
+            wait_until = window_start + self.window * (1.0 - (allowed - state[1]) / state[2])
+        else:
+            wait_until = window_start + self.window * (2.0 - allowed / state[1] if state[1] else 1.0)
+        return max(1, math.ceil(wait_until - now))
+    
+    def hit(self, key):
+        """Registrar una petición de key; 0 si se admite, si no Retry-After en segundos"""
+        now = time.time()
+        with self.lock:
+            state = self.entries.get(key)
+            if state is None:
+                state = self.entries[key] = [0.0, 0, 0]
+            else:
+                self.entries.move_to_end(key)
+            retry_after = self._slide(state, now)
+            
+            # Expiración perezosa por el lado frío del LRU y cota de memoria
+            while self.entries:
+                oldest_key, oldest = next(iter(self.entries.items()))
+                if len(self.entries) <= self.max_keys and oldest[0] > now - 2 * self.window:
+                    break
+                self.entries.popitem(last=False)
+                if oldest[0] > now - 2 * self.window:
+                    self.evicted += 1
+            
+            if retry_after:
+                self.limited += 1
+        return retry_after
+    
+    def stats(self):
+        """Estado del rate limiting para /stats"""
+        with self.lock:
+            return {
+                'backend': 'memory',
+                'limit': self.limit,
+                'window_seconds': self.window,
+                'tracked_keys': len(self.entries),
+                'max_keys': self.max_keys,
+                'limited': self.limited,
+                'evicted_keys': self.evicted
+            }
+
+class SqliteRateLimiter(RateLimiter):
+    """Mismo contador deslizante en un SQLite local compartido entre procesos.
+    
+    Permite que varios procesos del servidor (o contenedores con el mismo
+    volumen /app/data) apliquen un único límite. Si la base de datos falla se
+    deja pasar la petición en lugar de tumbar el servicio.
+    """
+    
+    PRUNE_EVERY = 1000
+    
+    def __init__(self, limit, window, max_keys, path):
+        super().__init__(limit, window, max_keys)
+        self.path = path
+        self.local = threading.local()
+        self.calls = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS rate_limits '
+            '(key TEXT PRIMARY KEY, window_start REAL, current INTEGER, previous INTEGER)')
+    
+    def _connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+        return connection
+    
+    def hit(self, key):
+        now = time.time()
+        try:
+            connection = self._connection()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = connection.execute('SELECT window_start, current, previous FROM rate_limits WHERE key = ?',
+                                         (key,)).fetchone()
+                state = list(row) if row else [0.0, 0, 0]
+                retry_after = self._slide(state, now)
+                connection.execute('INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?, ?)', (key, *state))
+                with self.lock:
+                    self.calls += 1
+                    prune = self.calls % self.PRUNE_EVERY == 0
+                    if retry_after:
+                        self.limited += 1
+                if prune:
+                    self._prune(connection, now)
+                connection.execute('COMMIT')
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Rate limiting SQLite no disponible, admitiendo petición: {e}")
+            return 0
+        return retry_after
+    
+    def _prune(self, connection, now):
+        """Borrar claves inactivas y recortar a max_keys (las menos recientes)"""
+        connection.execute('DELETE FROM rate_limits WHERE window_start <= ?', (now - 2 * self.window,))
+        cursor = connection.execute(
+            'DELETE FROM rate_limits WHERE key IN (SELECT key FROM rate_limits '
+            'ORDER BY window_start DESC LIMIT -1 OFFSET ?)', (self.max_keys,))
+        with self.lock:
+            self.evicted += max(0, cursor.rowcount)
+    
+    def stats(self):
+        try:
+            tracked = self._connection().execute('SELECT COUNT(*) FROM rate_limits').fetchone()[0]
+        except sqlite3.Error:
+            tracked = None
+        with self.lock:
+            return {
+                'backend': 'sqlite',
+                'path': self.path,
+                'limit': self.limit,
+                'window_seconds': self.window,
+                'tracked_keys': tracked,
+                'max_keys': self.max_keys,
+                'limited': self.limited,
+                'evicted_keys': self.evicted
+            }
+
+def create_rate_limiter():
+    """Rate limiter en memoria, o SQLite compartido si RATE_LIMIT_DB está definido"""
+    if RATE_LIMIT_DB:
+        try:
+            limiter = SqliteRateLimiter(RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW, RATE_LIMIT_MAX_KEYS, RATE_LIMIT_DB)
+            logger.info(f"🚦 Rate limiting compartido en {RATE_LIMIT_DB}")
+            return limiter
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f"❌ No se pudo abrir {RATE_LIMIT_DB}, rate limiting en memoria: {e}")
+    return RateLimiter(RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW, RATE_LIMIT_MAX_KEYS)
+
+rate_limiter = create_rate_limiter()
+
+def rate_limit_check(request_ip):
+    """Rate limiting: None si se admite, si no la respuesta 429 con Retry-After"""
+    retry_after = rate_limiter.hit(request_ip)
+    if not retry_after:
+        return None
+    response = jsonify({'error': 'Rate limit exceeded', 'retry_after': retry_after})
+    return response, 429, {'Retry-After': str(retry_after)}
 
 def setup_cpu_environment():
     """Configurar entorno optimizado para CPU"""
@@ -78,126 +882,2301 @@ def setup_cpu_environment():
     os.environ['FLAGS_allocator_strategy'] = 'auto_growth'
     os.environ['FLAGS_fraction_of_gpu_memory_to_use'] = '0'
     os.environ['CUDA_VISIBLE_DEVICES'] = ''
-    os.environ['OMP_NUM_THREADS'] = '4'
-    os.environ['MKL_NUM_THREADS'] = '4'
+    # Cada réplica usa su propio presupuesto de threads (sin sobre-suscripción)
+    os.environ['OMP_NUM_THREADS'] = str(THREADS_PER_WORKER)
+    os.environ['MKL_NUM_THREADS'] = str(THREADS_PER_WORKER)
+    
+    logger.info("⚙️ Entorno CPU configurado correctamente")
+
+class PaddleBackend:
+    """Backend de inferencia por defecto: Paddle Inference con MKL-DNN (configuración GANADORA).
+    
+    Un backend decide con qué modelos y runtime se construyen det/cls/rec;
+    run_ocr_pipeline usa siempre la interfaz TextDetector/TextClassifier/
+    TextRecognizer de PaddleOCR, así que pre y postproceso no cambian.
+    """
+    
+    name = 'paddle'
+    
+    def engine_config(self, lang):
+        """Parámetros extra de PaddleOCR(...) para el motor base de lang"""
+        return {}
+    
+    def recognizer_config(self, lang):
+        """Parámetros extra para un reconocedor suelto (load_text_recognizer)"""
+        return {}
+    
+    def prepare_engine(self, engine, lang):
+        """Ajustes tras construir el motor base (det + cls + rec) de lang"""
+        return engine
+    
+    def prepare_recognizer(self, recognizer, lang):
+        """Ajustes tras construir un reconocedor suelto"""
+        return recognizer
+    
+    def cache_key(self):
+        """Identificador para la clave de la caché de resultados"""
+        return self.name
+    
+    def stats(self):
+        return {'name': self.name, 'mkldnn': cpu_config['enable_mkldnn']}
+
+class OnnxBackend(PaddleBackend):
+    """ONNX Runtime en CPU con los modelos convertidos por convert_onnx.py (FP32 o INT8).
+    
+    Los .onnx siguen la misma estructura que la caché de PaddleOCR
+    (det/<det_lang>/<modelo>/model.onnx, rec/<rec_lang>/..., cls/<modelo>/...).
+    PaddleOCR abre las sesiones con los threads por defecto de ORT (todos los
+    núcleos); prepare() las reabre con THREADS_PER_WORKER por réplica.
+    """
+    
+    name = 'onnx'
+    
+    def __init__(self, model_dir, int8=False):
+        self.model_dir = model_dir
+        self.int8 = int8
+        self.filename = 'model.int8.onnx' if int8 else 'model.onnx'
+    
+    def model_paths(self, lang):
+        """Rutas .onnx de det, rec y cls de un idioma (mismos modelos que elegiría PaddleOCR)"""
+        from paddleocr import paddleocr as ppocr_module
+        
+        version = ppocr_module.parse_args(mMain=False).ocr_version
+        rec_lang, det_lang = ppocr_module.parse_lang(lang)
+        paths = {}
+        for stage, model_lang in (('det', det_lang), ('rec', rec_lang), ('cls', 'ch')):
+            url = ppocr_module.get_model_config('OCR', version, stage, model_lang)['url']
+            # Mismo nombre de directorio que confirm_model_dir_url: 'xxx_infer.tar' -> 'xxx_infer'
+            parts = (stage, url.split('/')[-1][:-4]) if stage == 'cls' else (stage, model_lang, url.split('/')[-1][:-4])
+            paths[stage] = os.path.join(self.model_dir, *parts, self.filename)
+        return paths
+    
+    def _checked_paths(self, lang):
+        paths = self.model_paths(lang)
+        missing = [path for path in paths.values() if not os.path.exists(path)]
+        if missing:
+            raise FileNotFoundError(f"Modelos ONNX no encontrados ({', '.join(missing)}); "
+                                    f"generarlos con: python convert_onnx.py{' --int8' if self.int8 else ''}")
+        return paths
+    
+    def engine_config(self, lang):
+        paths = self._checked_paths(lang)
+        return {'use_onnx': True, 'det_model_dir': paths['det'], 'rec_model_dir': paths['rec'],
+                'cls_model_dir': paths['cls']}
+    
+    def recognizer_config(self, lang):
+        return {'use_onnx': True, 'rec_model_dir': self._checked_paths(lang)['rec']}
+    
+    def create_session(self, model_path):
+        """Sesión ORT limitada al presupuesto de threads de la réplica"""
+        import onnxruntime as ort
+        
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = THREADS_PER_WORKER
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        return ort.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+    
+    def _replace_session(self, predictor, model_path):
+        session = self.create_session(model_path)
+        predictor.predictor = session
+        predictor.input_tensor = session.get_inputs()[0]
+    
+    def prepare_engine(self, engine, lang):
+        paths = self.model_paths(lang)
+        self._replace_session(engine.text_detector, paths['det'])
+        if getattr(engine, 'text_classifier', None) is not None:
+            self._replace_session(engine.text_classifier, paths['cls'])
+        self._replace_session(engine.text_recognizer, paths['rec'])
+        return engine
+    
+    def prepare_recognizer(self, recognizer, lang):
+        self._replace_session(recognizer, self.model_paths(lang)['rec'])
+        return recognizer
+    
+    def cache_key(self):
+        return 'onnx-int8' if self.int8 else 'onnx'
+    
+    def stats(self):
+        return {'name': self.name, 'int8': self.int8, 'model_dir': self.model_dir}
+
+def create_inference_backend(name=None, model_dir=None, int8=None):
+    """Backend según OCR_BACKEND (o los argumentos, para los benchmarks)"""
+    name = name or OCR_BACKEND
+    if name == 'onnx':
+        return OnnxBackend(model_dir or ONNX_MODEL_DIR, ONNX_INT8 if int8 is None else int8)
+    if name != 'paddle':
+        logger.warning(f"⚠️ OCR_BACKEND desconocido '{name}', usando paddle")
+    return PaddleBackend()
+
+inference_backend = create_inference_backend()
+
+def load_text_recognizer(lang, backend=None):
+    """Construir solo el reconocedor de un idioma (mismos pasos que PaddleOCR.__init__ 2.8.1)"""
+    from paddleocr import paddleocr as ppocr_module
+    
+    backend = backend or inference_backend
+    params = ppocr_module.parse_args(mMain=False)
+    params.__dict__.update(lang=lang, **cpu_config)
+    params.__dict__.update(backend.recognizer_config(lang))
+    rec_lang, _ = ppocr_module.parse_lang(lang)
+    rec_config = ppocr_module.get_model_config('OCR', params.ocr_version, 'rec', rec_lang)
+    params.rec_model_dir, rec_url = ppocr_module.confirm_model_dir_url(
+        params.rec_model_dir, os.path.join(ppocr_module.BASE_DIR, 'whl', 'rec', rec_lang), rec_config['url'])
+    if params.ocr_version in ('PP-OCRv3', 'PP-OCRv4'):
+        params.rec_image_shape = '3, 48, 320'
+    else:
+        params.rec_image_shape = '3, 32, 320'
+    if not getattr(params, 'use_onnx', False):
+        ppocr_module.maybe_download(params.rec_model_dir, rec_url)
+    if params.rec_char_dict_path is None:
+        params.rec_char_dict_path = str(Path(ppocr_module.__file__).parent / rec_config['dict_path'])
+    return backend.prepare_recognizer(ppocr_module.predict_system.predict_rec.TextRecognizer(params), lang)
+
+class LanguageEngine:
+    """Motor de un idioma con la interfaz de TextSystem que usa run_ocr_pipeline.
+    
+    Detector y clasificador son los del motor base de su det_lang (compartidos
+    entre idiomas); el reconocedor es el de su rec_lang.
+    """
+    
+    def __init__(self, base, text_recognizer, lang):
+        self.text_detector = base.text_detector
+        self.text_classifier = getattr(base, 'text_classifier', None)
+        self.text_recognizer = text_recognizer
+        self.use_angle_cls = base.use_angle_cls
+        self.drop_score = base.drop_score
+        self.args = copy.copy(base.args)
+        self.args.lang = lang
+
+class ReplicaModels:
+    """Modelos PaddleOCR de una réplica, cargados por idioma bajo demanda.
+    
+    Un PaddleOCR completo (det + cls + rec) por det_lang hace de motor base; el
+    resto de idiomas solo añaden su reconocedor, compartido además entre
+    idiomas con el mismo rec_lang (es, fr, de, pt... usan 'latin'). Los
+    reconocedores que no son de un motor base se descargan tras
+    OCR_MODEL_IDLE_TIMEOUT sin uso o por LRU por encima de OCR_MAX_RECOGNIZERS.
+    Solo la usa el worker dueño de la réplica; el lock protege las lecturas
+    de estado desde otros threads.
+    """
+    
+    def __init__(self, label='', backend=None):
+        self.label = label
+        self.backend = backend or inference_backend
+        self.bases = {}
+        self.recognizers = OrderedDict()
+        self.engines = {}
+        self.failed = set()
+        self.loads = 0
+        self.unloads = 0
+        self.lock = threading.Lock()
+    
+    def preload(self, languages):
+        for lang in languages:
+            self._load(lang)
+    
+    def get(self, lang):
+        """Motor de lang cargándolo si hace falta (si falla, el del idioma por defecto)"""
+        entry = self.engines.get(lang)
+        if entry is None:
+            entry = self._load(lang)
+            if entry is None:
+                if lang == default_lang:
+                    raise RuntimeError('OCR model not available')
+                return self.get(default_lang)
+        engine, rec_lang = entry
+        with self.lock:
+            self.recognizers[rec_lang]['last_used'] = time.time()
+            self.recognizers.move_to_end(rec_lang)
+        self.evict_idle(keep=rec_lang)
+        return engine
+    
+    def _load(self, lang):
+        if lang in self.failed:
+            return None
+        
+        logger.info(f"📚 Cargando OCR CPU GANADOR para {lang.upper()}{self.label}...")
+        rss_before = read_rss_bytes()
+        try:
+            import paddleocr
+            from paddleocr.paddleocr import parse_lang
+            
+            rec_lang, det_lang = parse_lang(lang)
+            base = self.bases.get(det_lang)
+            if base is None:
+                engine = self.backend.prepare_engine(
+                    paddleocr.PaddleOCR(lang=lang, **cpu_config, **self.backend.engine_config(lang)), lang)
+                recognizer = {'model': engine.text_recognizer, 'pinned': True}
+                with self.lock:
+                    self.bases[det_lang] = engine
+            else:
+                recognizer = self.recognizers.get(rec_lang)
+                if recognizer is None:
+                    recognizer = {'model': load_text_recognizer(lang, self.backend), 'pinned': False}
+                engine = LanguageEngine(base, recognizer['model'], lang)
+        except (Exception, SystemExit) as e:
+            # get_model_config() hace sys.exit() con idiomas sin modelo
+            logger.error(f"   ❌ Error cargando {lang}: {e}")
+            self.failed.add(lang)
+            return None
+        
+        with self.lock:
+            if rec_lang not in self.recognizers:
+                recognizer.update(memory=max(0, read_rss_bytes() - rss_before), last_used=time.time())
+                self.recognizers[rec_lang] = recognizer
+                self.loads += 1
+            self.engines[lang] = (engine, rec_lang)
+        logger.info(f"   ✅ OCR CPU GANADOR configurado para {lang} (det {det_lang}, rec {rec_lang})")
+        return self.engines[lang]
+    
+    def evict_idle(self, keep=None):
+        """Descargar reconocedores inactivos o por encima del máximo (LRU)"""
+        now = time.time()
+        with self.lock:
+            candidates = [rec_lang for rec_lang, recognizer in self.recognizers.items()
+                          if not recognizer['pinned'] and rec_lang != keep]
+            victims = [rec_lang for rec_lang in candidates if OCR_MODEL_IDLE_TIMEOUT > 0
+                       and now - self.recognizers[rec_lang]['last_used'] > OCR_MODEL_IDLE_TIMEOUT]
+            if OCR_MAX_RECOGNIZERS > 0:
+                excess = len(self.recognizers) - len(victims) - OCR_MAX_RECOGNIZERS
+                for rec_lang in candidates:
+                    if excess <= 0:
+                        break
+                    if rec_lang not in victims:
+                        victims.append(rec_lang)
+                        excess -= 1
+            for rec_lang in victims:
+                del self.recognizers[rec_lang]
+                for lang in [lang for lang, (_, engine_rec) in self.engines.items() if engine_rec == rec_lang]:
+                    del self.engines[lang]
+                self.unloads += 1
+        
+        if victims:
+            gc.collect()
+            logger.info(f"🧹 Reconocedores descargados{self.label}: {', '.join(victims)}")
+    
+    def languages(self):
+        with self.lock:
+            return list(self.engines)
+    
+    def memory_bytes(self):
+        """RSS añadido al cargar los modelos que siguen en memoria"""
+        with self.lock:
+            return sum(recognizer['memory'] for recognizer in self.recognizers.values())
+    
+    def stats(self):
+        with self.lock:
+            return {
+                'loaded_languages': list(self.engines),
+                'recognizers': list(self.recognizers),
+                'detectors': list(self.bases),
+                'loads': self.loads,
+                'unloads': self.unloads
+            }
+
+def preload_languages():
+    """Idiomas a cargar al arrancar (siempre incluye el idioma por defecto)"""
+    languages = [lang.strip() for lang in OCR_PRELOAD_LANGUAGES.split(',') if lang.strip() in supported_languages]
+    return [default_lang] + [lang for lang in languages if lang != default_lang]
+
+def warmup_image():
+    """Página sintética tipo factura para el calentamiento (kernels MKL-DNN, buffers)"""
+    img = np.full((1754, 1240, 3), 255, np.uint8)
+    lines = ('FACTURA N. 2024-0001', 'Fecha: 15/03/2024', 'CIF: B12345678',
+             'Concepto          Cantidad      Importe', 'Mantenimiento     1             120,00',
+             'Base imponible: 120,00 EUR', 'IVA 21%: 25,20 EUR', 'TOTAL: 145,20 EUR')
+    for row, text in enumerate(lines):
+        cv2.putText(img, text, (90, 180 + row * 110), cv2.FONT_HERSHEY_SIMPLEX, 1.4, (0, 0, 0), 3)
+    return img
+
+def warmup_task(ocr):
+    """Tarea de réplica: una inferencia completa det → cls → rec sobre la página sintética"""
+    page_result = run_ocr_pipeline(ocr, warmup_image(), cls=True)
+    return len(page_result or [])
+
+@contextlib.contextmanager
+def startup_phase(name):
+    """Medir una fase del arranque para /stats"""
+    start = time.time()
+    startup_state['phase'] = name
+    try:
+        yield
+    finally:
+        startup_state['phases'][name] = round(time.time() - start, 3)
+
+def initialize_ocr_cpu(wait=False):
+    """Inicializar OCR con configuración CPU GANADORA.
+    
+    Si otro thread ya está inicializando devuelve False al instante (las
+    peticiones responden 503 mientras tanto en lugar de cargar modelos dos
+    veces); con wait=True espera a que termine.
+    """
+    global ocr_initialized, ocr_pool, rec_batcher, result_cache, job_manager, server_stats
+    
+    if ocr_initialized:
+        return True
+    if not init_lock.acquire(blocking=wait):
+        return False
+    
+    try:
+        if ocr_initialized:
+            return True
+        startup_state.update(phase='starting', started_at=time.time(), finished_at=None, error=None)
+        
+        with startup_phase('import'):
+            setup_cpu_environment()
+            
+            logger.info("🚀 Inicializando PaddleOCR CPU con configuración GANADORA...")
+            logger.info("💻 Modo: CPU optimizado (sin CUDA)")
+            logger.info(f"🧵 Pool ({OCR_EXECUTION_MODE}): {OCR_WORKERS} réplicas x {THREADS_PER_WORKER} threads, cola {OCR_QUEUE_SIZE}")
+            if OCR_EXECUTION_MODE != 'process':
+                import paddleocr
+                logger.info(f"📦 PaddleOCR version: {paddleocr.__version__}")
+        
+        replicas = []
+        with startup_phase('load_models'):
+            for index in range(OCR_WORKERS):
+                label = f" (réplica {index + 1}/{OCR_WORKERS})"
+                if OCR_EXECUTION_MODE == 'process':
+                    # Los modelos viven en el proceso worker; aquí solo queda el proxy
+                    replica = ProcessReplica(label)
+                else:
+                    models = ReplicaModels(label)
+                    models.preload(preload_languages())
+                    replica = ThreadReplica(models)
+                
+                if default_lang not in replica.languages:
+                    replica.shutdown()
+                    break
+                replicas.append(replica)
+        
+        if not replicas:
+            logger.error("❌ No se pudo cargar ningún modelo OCR")
+            startup_state.update(phase='failed', error='No OCR model could be loaded')
+            return False
+        
+        if OCR_WARMUP:
+            with startup_phase('warmup'):
+                # Primera inferencia por réplica e idioma: el JIT de kernels no lo paga una petición real
+                for lang in preload_languages():
+                    for replica in replicas:
+                        if lang in replica.languages:
+                            replica.execute(lang, warmup_task, ())
+                    warmed_languages.add(lang)
+                    logger.info(f"🔥 Calentamiento completado para {lang}")
+        
+        with startup_phase('services'):
+            if REC_BATCHING and OCR_EXECUTION_MODE == 'thread':
+                rec_batcher = RecognitionBatcher(REC_BATCH_MAX, REC_BATCH_WAIT_MS / 1000.0)
+                logger.info(f"📦 Micro-batching de reconocimiento: hasta {REC_BATCH_MAX} recortes, espera {REC_BATCH_WAIT_MS}ms")
+            if RESULT_CACHE_SIZE > 0:
+                result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_DIR or None, RESULT_CACHE_DISK_MAX)
+                logger.info(f"♻️ Caché de resultados: {RESULT_CACHE_SIZE} entradas en memoria"
+                            + (f", disco en {RESULT_CACHE_DIR}" if RESULT_CACHE_DIR else ""))
+            ocr_pool = OCRWorkerPool(replicas, OCR_QUEUE_SIZE)
+            job_manager = JobManager(JOB_WORKERS, JOB_QUEUE_SIZE, JOB_RESULT_TTL, JOB_SPOOL_DIR)
+        
+        ocr_initialized = True
+        with server_stats_lock:
+            server_stats['models_loaded'] = True
+        startup_state.update(phase='ready', finished_at=time.time())
+        
+        logger.info(f"✅ OCR CPU inicializado con configuración GANADORA en {startup_state['finished_at'] - startup_state['started_at']:.1f}s")
+        logger.info("🏆 Rendimiento esperado: 79+ bloques, 95%+ confianza")
+        logger.info("💻 Optimizado para CPU - Sin dependencias CUDA")
+        
+        return True
+        
+    except Exception as e:
+        logger.error(f"❌ Error crítico inicializando OCR CPU: {e}")
+        import traceback
+        logger.error(traceback.format_exc())
+        startup_state.update(phase='failed', error=str(e))
+        return False
+    
+    finally:
+        init_lock.release()
+
+def language_readiness():
+    """Estado por idioma: ready (cargado y calentado), loaded, on_demand o pending"""
+    loaded = None
+    if ocr_pool is not None:
+        for replica in ocr_pool.replicas:
+            languages = set(replica.languages)
+            loaded = languages if loaded is None else loaded & languages
+    
+    readiness = {}
+    for lang in supported_languages:
+        if loaded and lang in loaded:
+            readiness[lang] = 'ready' if lang in warmed_languages or not OCR_WARMUP else 'loaded'
+        else:
+            readiness[lang] = 'on_demand' if ocr_initialized else 'pending'
+    return readiness
+
+def not_ready_response():
+    """503 mientras los modelos se cargan en segundo plano"""
+    response = jsonify({
+        'error': 'OCR not available',
+        'startup_phase': startup_state['phase'],
+        'retry_after': 5
+    })
+    return response, 503, {'Retry-After': '5'}
+
+def resolve_language(language=None):
+    """Resolver idioma solicitado con fallback al idioma por defecto"""
+    lang = language or default_lang
+    if lang not in supported_languages:
+        logger.warning(f"Idioma {lang} no disponible, usando {default_lang}")
+        lang = default_lang
+    return lang
+
+class ThreadReplica:
+    """Réplica dentro del proceso Flask: sus propios modelos por idioma"""
+    
+    def __init__(self, models):
+        self.models = models
+    
+    @property
+    def languages(self):
+        return self.models.languages()
+    
+    def execute(self, language, task, args):
+        return task(self.models.get(language), *args)
+    
+    def evict_idle(self):
+        self.models.evict_idle()
+    
+    def memory_bytes(self):
+        """RSS que añadió la carga de los modelos de esta réplica"""
+        return self.models.memory_bytes()
+    
+    def stats(self):
+        return self.models.stats()
+    
+    def shutdown(self):
+        self.models = ReplicaModels()
+
+# Estado del proceso worker (solo se usa dentro de los procesos del pool)
+_process_models = None
+
+def _process_worker_init(languages, config, default_language):
+    """Initializer del proceso worker: cargar sus propios modelos"""
+    global supported_languages, cpu_config, default_lang, _process_models
+    supported_languages = languages
+    cpu_config = config
+    default_lang = default_language
+    setup_cpu_environment()
+    _process_models = ReplicaModels(f" (pid {os.getpid()})")
+    _process_models.preload(preload_languages())
+
+def _process_worker_stats():
+    """Estado de los modelos del proceso worker"""
+    return _process_models.stats()
+
+def _process_worker_evict_idle():
+    _process_models.evict_idle()
+    return _process_models.stats()
+
+def _process_worker_execute(language, task, args):
+    """Ejecutar una tarea de pool dentro del proceso worker.
+    
+    Devuelve (resultado, tiempos por etapa, eventos de traza, estado de los
+    modelos) para sumarlos a la petición y reflejar los idiomas cargados.
+    """
+    ocr = _process_models.get(language)
+    context = RequestMetrics('worker')
+    bind_request_metrics(context)
+    try:
+        return task(ocr, *args), context.stages, context.events, _process_models.stats()
+    finally:
+        bind_request_metrics(None)
+        context.finished = True
+
+class ProcessReplica:
+    """Réplica en un proceso worker de larga vida (escapa del GIL).
+    
+    El proceso mantiene sus propios modelos (ReplicaModels); el proceso HTTP
+    solo envía los bytes del archivo y recibe el resultado OCR como listas
+    planas junto con el estado de los modelos.
+    """
+    
+    def __init__(self, label=''):
+        self.label = label
+        self.executor = None
+        self.model_stats = {}
+        self._start()
+    
+    @property
+    def languages(self):
+        return self.model_stats.get('loaded_languages', [])
+    
+    def _start(self):
+        context = multiprocessing.get_context('spawn')
+        self.executor = ProcessPoolExecutor(max_workers=1, mp_context=context,
+                                            initializer=_process_worker_init,
+                                            initargs=(supported_languages, cpu_config, default_lang))
+        logger.info(f"🧩 Arrancando proceso worker OCR{self.label}...")
+        try:
+            self.model_stats = self.executor.submit(_process_worker_stats).result()
+        except Exception as e:
+            logger.error(f"   ❌ Error arrancando proceso worker: {e}")
+            self.model_stats = {}
+    
+    def execute(self, language, task, args):
+        try:
+            result, stages, events, self.model_stats = self.executor.submit(
+                _process_worker_execute, language, task, args).result()
+        except BrokenProcessPool:
+            # El proceso murió (OOM, segfault...): relanzarlo para las siguientes tareas
+            logger.error(f"💥 Proceso worker OCR caído{self.label}, reiniciando...")
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self._start()
+            raise
+        context = current_request_metrics()
+        if context is not None:
+            context.merge(stages)
+            context.extend_trace(events)
+        return result
+    
+    def evict_idle(self):
+        try:
+            self.model_stats = self.executor.submit(_process_worker_evict_idle).result()
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo revisar los modelos del proceso worker{self.label}: {e}")
+    
+    def memory_bytes(self):
+        """RSS del proceso worker (modelos + buffers de inferencia)"""
+        return sum(read_rss_bytes(pid) for pid in list(self.executor._processes or {}))
+    
+    def stats(self):
+        return self.model_stats
+    
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class PoolSaturatedError(Exception):
+    """Cola de inferencia llena: el cliente debe reintentar más tarde"""
+    
+    def __init__(self, retry_after):
+        super().__init__('OCR queue full')
+        self.retry_after = retry_after
+
+class DeadlineExceededError(Exception):
+    """Plazo de la petición (timeout_ms) agotado antes de tener resultado (responder 504)"""
+
+class OCRWorkerPool:
+    """Pool de réplicas PaddleOCR alimentado desde una cola de admisión acotada.
+    
+    Cada worker posee en exclusiva una réplica (un PaddleOCR por idioma con su
+    propio presupuesto de threads, en este proceso o en un proceso worker), así
+    que nunca hay dos peticiones compitiendo por el mismo predictor. Si la cola
+    está llena se rechaza al instante con PoolSaturatedError para responder
+    503 + Retry-After.
+    """
+    
+    IDLE_SWEEP_SECONDS = 30
+    
+    def __init__(self, replicas, queue_size):
+        self.replicas = replicas
+        self.queue_size = queue_size
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.busy_workers = 0
+        self.completed = 0
+        self.rejected = 0
+        self.expired = 0
+        self.avg_task_time = 1.0
+        self.threads = []
+        for index in range(len(replicas)):
+            thread = threading.Thread(target=self._worker, args=(index,),
+                                      name=f"ocr-worker-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+    
+    def submit(self, language, task, *args, block=False, context=None):
+        """Encolar task(ocr, *args) para el idioma dado; devuelve un Future.
+        
+        Con block=False (admisión de peticiones nuevas) una cola llena lanza
+        PoolSaturatedError; block=True lo usan peticiones ya admitidas. Los
+        tiempos por etapa se suman a context (por defecto la RequestMetrics
+        del thread que encola).
+        """
+        future = Future()
+        context = context or current_request_metrics()
+        remaining = context.remaining() if context is not None else None
+        if remaining is not None and remaining <= 0:
+            self._expire()
+            raise DeadlineExceededError('Deadline exceeded before queueing')
+        try:
+            # Las peticiones ya admitidas esperan hueco como mucho hasta su plazo
+            self.jobs.put((language, task, args, future, context), block=block,
+                          timeout=remaining if block else None)
+        except queue.Full:
+            if block:
+                self._expire()
+                raise DeadlineExceededError('Deadline exceeded waiting for the OCR queue')
+            with self.lock:
+                self.rejected += 1
+            raise PoolSaturatedError(self.retry_after())
+        return future
+    
+    def _expire(self):
+        """Contar una tarea descartada por plazo agotado"""
+        with self.lock:
+            self.expired += 1
+        metric_deadline_expired.inc(stage='queue')
+    
+    def wait(self, future, context=None):
+        """future.result() acotado al plazo de la petición.
+        
+        Si el plazo se agota y la tarea sigue en cola se cancela (el worker no
+        llega a ejecutarla); si ya está corriendo termina y su resultado se tira.
+        """
+        context = context or current_request_metrics()
+        remaining = context.remaining() if context is not None else None
+        try:
+            return future.result(timeout=None if remaining is None else max(0.0, remaining))
+        except FutureTimeoutError:
+            if future.cancel():
+                self._expire()
+            raise DeadlineExceededError('Deadline exceeded')
+    
+    def imap(self, language, task, args_list):
+        """Repartir varias tareas de un mismo documento entre los workers.
+        
+        Mantiene como mucho un task en vuelo por worker para no acaparar la
+        cola. La primera tarea pasa por la admisión normal en el momento de la
+        llamada (así PoolSaturatedError llega antes de empezar a responder);
+        devuelve un generador que entrega los resultados en el orden de
+        args_list según van terminando. Con el plazo de la petición agotado no
+        se encolan más tareas y el generador lanza DeadlineExceededError.
+        """
+        window = len(self.replicas)
+        in_flight = deque()
+        # El generador puede consumirse fuera del thread de la petición (streaming)
+        context = current_request_metrics()
+        if args_list:
+            in_flight.append(self.submit(language, task, *args_list[0], context=context))
+        
+        def results():
+            next_index = 1
+            try:
+                while in_flight:
+                    while (next_index < len(args_list) and len(in_flight) < window
+                           and not (context is not None and context.expired())):
+                        in_flight.append(self.submit(language, task, *args_list[next_index],
+                                                     block=True, context=context))
+                        next_index += 1
+                    yield self.wait(in_flight.popleft(), context)
+                if next_index < len(args_list):
+                    raise DeadlineExceededError('Deadline exceeded')
+            finally:
+                for future in in_flight:
+                    future.cancel()
+        
+        return results()
+    
+    def retry_after(self):
+        """Segundos estimados hasta que se libere hueco en la cola"""
+        pending = self.jobs.qsize() + self.busy_workers
+        return max(1, math.ceil(pending * self.avg_task_time / len(self.replicas)))
+    
+    def _worker(self, index):
+        replica = self.replicas[index]
+        while True:
+            try:
+                language, task, args, future, context = self.jobs.get(timeout=self.IDLE_SWEEP_SECONDS)
+            except queue.Empty:
+                # Sin trabajo: momento de descargar reconocedores inactivos
+                replica.evict_idle()
+                continue
+            if not future.set_running_or_notify_cancel():
+                continue
+            if context is not None and context.expired():
+                # Nadie va a leer el resultado: no gastar CPU en él
+                self._expire()
+                future.set_exception(DeadlineExceededError('Deadline exceeded while queued'))
+                continue
+            with self.lock:
+                self.busy_workers += 1
+            task_start = time.time()
+            bind_request_metrics(context)
+            try:
+                future.set_result(replica.execute(language, task, args))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                bind_request_metrics(None)
+                elapsed = time.time() - task_start
+                with self.lock:
+                    self.busy_workers -= 1
+                    self.completed += 1
+                    # Media móvil exponencial para estimar Retry-After
+                    self.avg_task_time = 0.8 * self.avg_task_time + 0.2 * elapsed
+    
+    def stats(self):
+        """Estado del pool para /health y /stats"""
+        return {
+            'mode': OCR_EXECUTION_MODE,
+            'workers': len(self.replicas),
+            'threads_per_worker': THREADS_PER_WORKER,
+            'queue_size': self.queue_size,
+            'queue_depth': self.jobs.qsize(),
+            'busy_workers': self.busy_workers,
+            'completed_tasks': self.completed,
+            'rejected_tasks': self.rejected,
+            'expired_tasks': self.expired,
+            'avg_task_time': round(self.avg_task_time, 3),
+            'models': [replica.stats() for replica in self.replicas]
+        }
+
+def estimate_text_height(img):
+    """Altura mediana de carácter en px de la imagen original (None si no hay texto claro).
+    
+    Componentes conexas sobre una versión reducida binarizada con Otsu; se
+    descartan ruido y componentes enormes (fotos, marcos, tablas).
+    """
+    height, width = img.shape[:2]
+    scale = min(1.0, 1024.0 / max(height, width))
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    if cv2.countNonZero(binary) > binary.size // 2:
+        # Texto claro sobre fondo oscuro
+        binary = cv2.bitwise_not(binary)
+    
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    keep = (heights >= 3) & (heights <= binary.shape[0] * 0.1) & (widths <= binary.shape[1] * 0.5)
+    if np.count_nonzero(keep) < 10:
+        return None
+    return float(np.median(heights[keep])) / scale
+
+def choose_det_limit_side_len(img):
+    """Bucket de resolución de detección para una imagen (política auto).
+    
+    El más pequeño de DET_RESOLUTION_BUCKETS que deja los caracteres con al
+    menos DET_MIN_TEXT_HEIGHT px tras el redimensionado: tickets y fotos con
+    letra grande bajan de resolución, escaneos densos a 300 dpi suben.
+    """
+    long_side = max(img.shape[:2])
+    text_height = estimate_text_height(img)
+    if text_height is None:
+        return cpu_config['det_limit_side_len']
+    
+    for bucket in DET_RESOLUTION_BUCKETS:
+        # limit_type 'max': un bucket >= lado largo ya no reduce la imagen
+        if bucket >= long_side or text_height * bucket / long_side >= DET_MIN_TEXT_HEIGHT:
+            return bucket
+    return DET_RESOLUTION_BUCKETS[-1]
+
+def detector_preprocess_ops(text_detector, limit_side_len):
+    """preprocess_op del detector para un bucket de resolución (cacheado en el detector)"""
+    bucket_ops = text_detector.__dict__.setdefault('_bucket_preprocess_ops', {})
+    ops = bucket_ops.get(limit_side_len)
+    if ops is None:
+        ops = copy.deepcopy(text_detector.preprocess_op)
+        for op in ops:
+            if hasattr(op, 'limit_side_len'):
+                op.limit_side_len = limit_side_len
+        bucket_ops[limit_side_len] = ops
+    return ops
+
+def detect_text(ocr, img, det_limit_side_len=None):
+    """Detección con la resolución pedida ('auto', 'tiled', un entero o None = cpu_config).
+    
+    La réplica es exclusiva de un worker, así que cambiar el preprocess_op del
+    detector durante la llamada no afecta a otras peticiones. Con 'tiled' las
+    páginas que no se tesela (PDF, TIFF multipágina, imágenes normales) usan
+    la resolución fija.
+    """
+    if det_limit_side_len == 'auto':
+        det_limit_side_len = choose_det_limit_side_len(img)
+    elif det_limit_side_len == 'tiled':
+        det_limit_side_len = None
+    detector = ocr.text_detector
+    limit_side_len = det_limit_side_len or ocr.args.det_limit_side_len
+    if limit_side_len == ocr.args.det_limit_side_len:
+        dt_boxes, elapse = detector(img)
+    else:
+        default_ops = detector.preprocess_op
+        detector.preprocess_op = detector_preprocess_ops(detector, limit_side_len)
+        try:
+            dt_boxes, elapse = detector(img)
+        finally:
+            detector.preprocess_op = default_ops
+    
+    trace_event('detection', size=[img.shape[1], img.shape[0]], limit_side_len=limit_side_len,
+                resized=det_resized_size(img, limit_side_len, getattr(ocr.args, 'det_limit_type', 'max')),
+                boxes=0 if dt_boxes is None else len(dt_boxes))
+    return dt_boxes, elapse
+
+def det_resized_size(img, limit_side_len, limit_type='max'):
+    """[ancho, alto] que ve el detector tras DetResizeForTest (múltiplos de 32)"""
+    height, width = img.shape[:2]
+    ratio = 1.0
+    if limit_type == 'max' and max(height, width) > limit_side_len:
+        ratio = float(limit_side_len) / max(height, width)
+    elif limit_type == 'min' and min(height, width) < limit_side_len:
+        ratio = float(limit_side_len) / min(height, width)
+    elif limit_type == 'resize_long':
+        ratio = float(limit_side_len) / max(height, width)
+    return [max(int(round(int(width * ratio) / 32) * 32), 32), max(int(round(int(height * ratio) / 32) * 32), 32)]
+
+def needs_tiling(width, height):
+    """Ticket largo (relación de aspecto alta) o escaneo enorme: la detección a 960 perdería la letra pequeña"""
+    long_side, short_side = max(width, height), max(1, min(width, height))
+    if long_side <= DET_TILE_SIZE + DET_TILE_OVERLAP:
+        return False
+    return long_side / short_side >= DET_TILE_MIN_ASPECT or width * height >= DET_TILE_MIN_PIXELS
+
+def tile_spans(length, size, overlap):
+    """[(inicio, fin)] de teselas de lado size con al menos overlap px de solape, repartidas a lo largo de length"""
+    if length <= size:
+        return [(0, length)]
+    count = math.ceil((length - overlap) / float(size - overlap))
+    step = (length - size) / float(count - 1)
+    return [(int(round(index * step)), int(round(index * step)) + size) for index in range(count)]
+
+def tile_rects(width, height):
+    """Rectángulos (x0, y0, x1, y1) de las teselas de detección de una página, fila a fila"""
+    return [(x0, y0, x1, y1)
+            for y0, y1 in tile_spans(height, DET_TILE_SIZE, DET_TILE_OVERLAP)
+            for x0, x1 in tile_spans(width, DET_TILE_SIZE, DET_TILE_OVERLAP)]
+
+def merge_tile_boxes(tile_boxes):
+    """Unir las cajas de todas las teselas (ya en coordenadas de página) sin duplicados en los solapes.
+    
+    De mayor a menor área: una caja contenida casi entera en otra de otra
+    tesela es la misma línea (completa o cortada por el borde) y se descarta;
+    dos trozos en la misma fila que se tocan, de teselas distintas, son una
+    línea cortada por un borde vertical y se funden en su rectángulo común.
+    """
+    boxes = [np.asarray(tile, dtype=np.float32).reshape(-1, 4, 2) for _, tile in tile_boxes]
+    if not boxes or not sum(len(tile) for tile in boxes):
+        return np.zeros((0, 4, 2), dtype=np.float32)
+    tiles = np.concatenate([np.full(len(tile), index) for (index, _), tile in zip(tile_boxes, boxes)])
+    boxes = np.concatenate(boxes)
+    rects = np.concatenate([boxes.min(axis=1), boxes.max(axis=1)], axis=1)
+    areas = np.maximum(rects[:, 2] - rects[:, 0], 1.0) * np.maximum(rects[:, 3] - rects[:, 1], 1.0)
+    
+    kept_boxes = []
+    kept_rects = np.zeros((len(boxes), 4), dtype=np.float32)
+    kept_tiles = np.zeros(len(boxes), dtype=tiles.dtype)
+    for i in np.argsort(-areas, kind='stable'):
+        count = len(kept_boxes)
+        if count:
+            kept = kept_rects[:count]
+            ix = np.minimum(kept[:, 2], rects[i, 2]) - np.maximum(kept[:, 0], rects[i, 0])
+            iy = np.minimum(kept[:, 3], rects[i, 3]) - np.maximum(kept[:, 1], rects[i, 1])
+            other = kept_tiles[:count] != tiles[i]
+            overlap = np.clip(ix, 0, None) * np.clip(iy, 0, None)
+            if np.any(other & (overlap >= DET_TILE_CONTAINED * areas[i])):
+                continue
+            heights = np.minimum(kept[:, 3] - kept[:, 1], rects[i, 3] - rects[i, 1])
+            same_row = other & (ix >= 0) & (iy >= DET_TILE_SAME_ROW * np.maximum(heights, 1.0))
+            if same_row.any():
+                j = int(np.argmax(same_row))
+                x0, y0 = np.minimum(kept_rects[j, :2], rects[i, :2])
+                x1, y1 = np.maximum(kept_rects[j, 2:], rects[i, 2:])
+                kept_rects[j] = (x0, y0, x1, y1)
+                kept_boxes[j] = np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], dtype=np.float32)
+                continue
+        kept_rects[count] = rects[i]
+        kept_tiles[count] = tiles[i]
+        kept_boxes.append(boxes[i])
+    return np.stack(kept_boxes)
+
+class PageResult(list):
+    """Bloques de una página de run_ocr_pipeline más si se saltó el clasificador de ángulo"""
+    
+    def __init__(self, blocks=(), cls_skipped=False):
+        super().__init__(blocks)
+        self.cls_skipped = cls_skipped
+
+def page_needs_cls(dt_boxes):
+    """Geometría de la página: demasiadas cajas verticales indica página girada o mixta"""
+    boxes = np.asarray(dt_boxes, dtype=np.float32)
+    widths = np.linalg.norm(boxes[:, 1] - boxes[:, 0], axis=1)
+    heights = np.linalg.norm(boxes[:, 3] - boxes[:, 0], axis=1)
+    # Mismo criterio que get_rotate_crop_image para girar un recorte 90°
+    vertical = np.count_nonzero(heights >= 1.5 * widths)
+    return vertical > CLS_PRECHECK_MAX_VERTICAL * len(boxes)
+
+def classify_crops(ocr, img_crop_list, dt_boxes):
+    """Clasificador de ángulo con pre-chequeo por página.
+    
+    Clasifica solo una muestra de los recortes más anchos (las líneas largas
+    dan la predicción más fiable); si ninguno sale girado 180° y la geometría
+    no indica página girada, el resto de recortes se da por derecho.
+    Devuelve (recortes, cls_skipped).
+    """
+    if not CLS_PRECHECK or len(img_crop_list) <= CLS_PRECHECK_SAMPLES or page_needs_cls(dt_boxes):
+        img_crop_list, _, _ = ocr.text_classifier(img_crop_list)
+        trace_event('classification', crops=len(img_crop_list), classified=len(img_crop_list))
+        return img_crop_list, False
+    
+    widths = [crop.shape[1] for crop in img_crop_list]
+    sample = sorted(range(len(img_crop_list)), key=widths.__getitem__, reverse=True)[:CLS_PRECHECK_SAMPLES]
+    sample_crops, cls_res, _ = ocr.text_classifier([img_crop_list[i] for i in sample])
+    img_crop_list = list(img_crop_list)
+    for index, crop in zip(sample, sample_crops):
+        img_crop_list[index] = crop
+    
+    cls_thresh = ocr.text_classifier.cls_thresh
+    if not any('180' in label and score > cls_thresh for label, score in cls_res):
+        trace_event('classification', crops=len(img_crop_list), classified=len(sample))
+        return img_crop_list, True
+    
+    # Página girada o mixta: clasificar también el resto
+    sampled = set(sample)
+    rest = [i for i in range(len(img_crop_list)) if i not in sampled]
+    rest_crops, _, _ = ocr.text_classifier([img_crop_list[i] for i in rest])
+    for index, crop in zip(rest, rest_crops):
+        img_crop_list[index] = crop
+    trace_event('classification', crops=len(img_crop_list), classified=len(img_crop_list))
+    return img_crop_list, False
+
+def recognize_crops(ocr, img_crop_list):
+    """Etapa de reconocimiento: [(texto, confianza)] por recorte"""
+    batch_num = getattr(ocr.text_recognizer, 'rec_batch_num', cpu_config['rec_batch_num'])
+    trace_event('recognition', crops=len(img_crop_list), shared_batch=rec_batcher is not None,
+                batches=[min(batch_num, len(img_crop_list) - start) for start in range(0, len(img_crop_list), batch_num)])
+    # Con micro-batching incluye la espera al lote compartido
+    with timed_stage('recognition'):
+        if rec_batcher is not None:
+            return rec_batcher.recognize(ocr, img_crop_list)
+        rec_res, _ = ocr.text_recognizer(img_crop_list)
+        return rec_res
+
+def run_ocr_pipeline(ocr, img, cls=True, det_limit_side_len=None):
+    """OCR por etapas det → cls → rec sobre una imagen ya decodificada.
+    
+    Reproduce TextSystem.__call__ de PaddleOCR 2.8.1 pero dejando la etapa
+    de reconocimiento accesible para el micro-batching entre peticiones.
+    Devuelve la misma estructura por página que ocr.ocr() (como PageResult).
+    """
+    if img is None:
+        return None
+    
+    ori_im = img.copy()
+    with timed_stage('detection'):
+        dt_boxes, _ = detect_text(ocr, img, det_limit_side_len)
+    return recognize_boxes(ocr, ori_im, dt_boxes, cls)
+
+def recognize_boxes(ocr, img, dt_boxes, cls=True):
+    """Etapas crop → cls → rec sobre cajas ya detectadas (PageResult o None)"""
+    from paddleocr.paddleocr import predict_system
+    
+    if dt_boxes is None or len(dt_boxes) == 0:
+        return None
+    
+    with timed_stage('crop'):
+        dt_boxes = predict_system.sorted_boxes(dt_boxes)
+        img_crop_list = []
+        for box in dt_boxes:
+            tmp_box = box.copy()
+            if ocr.args.det_box_type == 'quad':
+                img_crop_list.append(predict_system.get_rotate_crop_image(img, tmp_box))
+            else:
+                img_crop_list.append(predict_system.get_minarea_rect_crop(img, tmp_box))
+    
+    cls_skipped = True
+    if ocr.use_angle_cls and cls:
+        with timed_stage('classification'):
+            img_crop_list, cls_skipped = classify_crops(ocr, img_crop_list, dt_boxes)
+    
+    rec_res = recognize_crops(ocr, img_crop_list)
+    
+    page_result = PageResult(cls_skipped=cls_skipped)
+    for box, rec_result in zip(dt_boxes, rec_res):
+        if rec_result[1] >= ocr.drop_score:
+            page_result.append([box.tolist(), rec_result])
+    return page_result or None
+
+def normalize_decoded_image(img):
+    """Llevar una imagen decodificada a BGR de 8 bits"""
+    if img.dtype != np.uint8:
+        # TIFF de 16 bits: escalar a 8 bits
+        img = cv2.convertScaleAbs(img, alpha=255.0 / max(1, int(img.max())))
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    elif img.shape[2] == 4:
+        # Transparencia sobre fondo blanco (igual que PaddleOCR)
+        alpha = img[:, :, 3:4].astype(np.float32) / 255.0
+        img = (img[:, :, :3] * alpha + 255.0 * (1.0 - alpha)).astype(np.uint8)
+    return img
+
+def read_exif_orientation(data):
+    """Etiqueta EXIF Orientation (1-8) de una imagen en memoria; 1 si no tiene o no se puede leer"""
+    from PIL import Image
+    
+    try:
+        with Image.open(io.BytesIO(data)) as pil_img:
+            orientation = pil_img.getexif().get(0x0112, 1)
+    except Exception:
+        return 1
+    return orientation if orientation in range(1, 9) else 1
+
+def apply_exif_orientation(img, orientation):
+    """Girar/voltear un ndarray según la orientación EXIF (como ImageOps.exif_transpose)"""
+    if orientation == 2:
+        return cv2.flip(img, 1)
+    if orientation == 3:
+        return cv2.rotate(img, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(img, 0)
+    if orientation == 5:
+        return cv2.transpose(img)
+    if orientation == 6:
+        return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.rotate(cv2.transpose(img), cv2.ROTATE_180)
+    if orientation == 8:
+        return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return img
+
+# Sin IMREAD_IGNORE_ORIENTATION los modos reducidos giran la imagen y
+# IMREAD_UNCHANGED no: la orientación EXIF se aplica aparte en todos los caminos
+_REDUCED_DECODE_FLAGS = {1: cv2.IMREAD_UNCHANGED,
+                         2: cv2.IMREAD_REDUCED_COLOR_2 | cv2.IMREAD_IGNORE_ORIENTATION,
+                         4: cv2.IMREAD_REDUCED_COLOR_4 | cv2.IMREAD_IGNORE_ORIENTATION,
+                         8: cv2.IMREAD_REDUCED_COLOR_8 | cv2.IMREAD_IGNORE_ORIENTATION}
+
+def decode_image_bytes(data, reduction=1, orientation=None):
+    """Decodificar una imagen en memoria a ndarray BGR (sin pasar por disco).
+    
+    reduction 2/4/8 decodifica ya reducida con IMREAD_REDUCED_COLOR_* (en
+    JPEG es escalado DCT: nunca se materializa la imagen completa). La
+    orientación EXIF se aplica siempre (una foto de móvil llega ya derecha);
+    orientation evita releerla si la cabecera ya se ha leído.
+    """
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), _REDUCED_DECODE_FLAGS[reduction])
+    if img is not None:
+        img = apply_exif_orientation(img, read_exif_orientation(data) if orientation is None else orientation)
+    if img is None:
+        # Formatos que OpenCV no decodifica: intentar con Pillow
+        try:
+            from PIL import Image, ImageOps
+            with Image.open(io.BytesIO(data)) as pil_img:
+                if reduction > 1:
+                    pil_img.draft('RGB', (pil_img.width // reduction, pil_img.height // reduction))
+                img = cv2.cvtColor(np.array(ImageOps.exif_transpose(pil_img).convert('RGB')), cv2.COLOR_RGB2BGR)
+        except Exception as e:
+            logger.error(f"⚠️ No se pudo decodificar la imagen: {e}")
+            return None
+    return normalize_decoded_image(img)
+
+def read_image_header(data):
+    """(ancho, alto, páginas, formato, orientación EXIF) leyendo solo la cabecera.
+    
+    Ancho y alto son los de la imagen ya orientada (las orientaciones 5-8
+    intercambian los lados). None si Pillow no reconoce el formato.
+    """
+    from PIL import Image
+    
+    try:
+        with Image.open(io.BytesIO(data)) as pil_img:
+            orientation = pil_img.getexif().get(0x0112, 1)
+            if orientation not in range(1, 9):
+                orientation = 1
+            width, height = (pil_img.height, pil_img.width) if orientation >= 5 else (pil_img.width, pil_img.height)
+            return width, height, getattr(pil_img, 'n_frames', 1), pil_img.format, orientation
+    except Image.DecompressionBombError:
+        raise ImageTooLargeError(f"Image too large (max {IMAGE_MAX_PIXELS} pixels)")
+    except Exception:
+        return None
+
+def read_frame_sizes(data, page_indices=None):
+    """(ancho, alto) ya orientados de las páginas de un TIFF multipágina leyendo solo sus cabeceras.
+    
+    Pillow solo comprueba el límite de píxeles en la primera página: el resto
+    se mide aquí antes de decodificar nada. page_indices None = todas.
+    """
+    from PIL import Image
+    
+    sizes = []
+    with Image.open(io.BytesIO(data)) as pil_img:
+        for index in range(getattr(pil_img, 'n_frames', 1)) if page_indices is None else page_indices:
+            pil_img.seek(index)
+            orientation = pil_img.getexif().get(0x0112, 1)
+            sizes.append((pil_img.height, pil_img.width) if orientation in range(5, 9) else pil_img.size)
+    return sizes
+
+def check_image_pixels(width, height):
+    """Rechazar páginas por encima de IMAGE_MAX_PIXELS antes de decodificarlas"""
+    if width * height > IMAGE_MAX_PIXELS:
+        raise ImageTooLargeError(f"Image too large: {width}x{height} pixels (max {IMAGE_MAX_PIXELS})")
+
+def ingest_size(width, height, image_format, max_side=IMAGE_INGEST_MAX_SIDE):
+    """(factor de reducción al decodificar, ancho, alto) de una página tras la ingesta"""
+    if not max_side or max(width, height) <= max_side:
+        return 1, width, height
+    reduction = 1
+    if image_format == 'JPEG':
+        # Escalado DCT sin bajar del lado máximo (el resto lo hace INTER_AREA)
+        while reduction < 8 and max(width, height) // (reduction * 2) >= max_side:
+            reduction *= 2
+    scale = max_side / max(width, height)
+    return reduction, max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+def decode_tiff_page(data, page_index):
+    """Decodificar una página (ya orientada) de un TIFF multipágina a ndarray BGR"""
+    from PIL import Image, ImageOps
+    
+    with Image.open(io.BytesIO(data)) as pil_img:
+        pil_img.seek(page_index)
+        frame = ImageOps.exif_transpose(pil_img)
+        frame = frame.convert('RGBA' if 'A' in frame.getbands() else 'RGB')
+        img = np.array(frame)
+    img = cv2.cvtColor(img, cv2.COLOR_RGBA2BGRA if img.shape[2] == 4 else cv2.COLOR_RGB2BGR)
+    return normalize_decoded_image(img)
+
+def ingest_image(data, page_index=0, max_side=IMAGE_INGEST_MAX_SIDE):
+    """Etapa de ingesta: cabecera → límite de píxeles → decodificación reducida.
+    
+    Devuelve (ndarray BGR, escala respecto al original) o (None, 1.0) si no se
+    puede decodificar. La escala permite devolver las coordenadas en píxeles
+    de la imagen subida; max_side es el lado largo tras la ingesta.
+    """
+    header = read_image_header(data)
+    if header is None:
+        img = decode_image_bytes(data)
+        if img is None:
+            return None, 1.0
+        width, height, frames, image_format = img.shape[1], img.shape[0], 1, None
+        check_image_pixels(width, height)
+        reduction = 1
+    else:
+        # Dimensiones ya orientadas: objetivo, escala y coordenadas se calculan sobre la imagen derecha
+        width, height, frames, image_format, orientation = header
+        check_image_pixels(width, height)
+        reduction = ingest_size(width, height, image_format, max_side)[0]
+        if frames > 1 or page_index:
+            # Cada página del TIFF tiene su propio tamaño: comprobarlo antes de decodificarla entera
+            width, height = read_frame_sizes(data, [page_index])[0]
+            check_image_pixels(width, height)
+            img = decode_tiff_page(data, page_index)
+            if img is not None:
+                width, height = img.shape[1], img.shape[0]
+        else:
+            img = decode_image_bytes(data, reduction, orientation)
+        if img is None:
+            return None, 1.0
+    
+    _, target_width, target_height = ingest_size(width, height, image_format, max_side)
+    if img.shape[1] > target_width:
+        img = cv2.resize(img, (target_width, target_height), interpolation=cv2.INTER_AREA)
+    return img, img.shape[1] / width
+
+def image_page_count(data):
+    """Páginas de una imagen (TIFF multipágina > 1)"""
+    header = read_image_header(data)
+    return header[2] if header is not None else 1
+
+def map_blocks(result, offset=(0, 0), scale=1.0):
+    """Llevar las cajas de un resultado a coordenadas de la página original ((punto + offset) / escala)"""
+    if not result or (offset == (0, 0) and scale == 1.0):
+        return result
+    dx, dy = offset
+    for block in result:
+        block[0] = [[round((x + dx) / scale, 1), round((y + dy) / scale, 1)] for x, y in block[0]]
+    return result
+
+def pdf_render_matrix(page):
+    """Matriz de rasterizado de PaddleOCR: 2x, o 1x si la página pasaría de 2000 px"""
+    import fitz
+    
+    matrix = fitz.Matrix(2, 2)
+    size = (page.rect * matrix).irect
+    if size.width > 2000 or size.height > 2000:
+        matrix = fitz.Matrix(1, 1)
+    return matrix
+
+def render_pdf_page(page):
+    """Rasterizar una página PyMuPDF a ndarray BGR (2x, o 1x si supera 2000 px)"""
+    pixmap = page.get_pixmap(matrix=pdf_render_matrix(page), alpha=False)
+    img = np.frombuffer(pixmap.samples, np.uint8).reshape(pixmap.height, pixmap.width, pixmap.n)
+    return cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+
+def pdf_page_size(page):
+    """(ancho, alto) en px del rasterizado de una página PDF"""
+    size = (page.rect * pdf_render_matrix(page)).irect
+    return size.width, size.height
+
+def render_pdf_region(page, rect):
+    """Rasterizar solo un rectángulo (x0, y0, x1, y1 en px del rasterizado) de una página PDF"""
+    import fitz
+    
+    x0, y0, x1, y1 = rect
+    if page.rotation:
+        # El clip va en coordenadas sin rotar: rasterizar la página y recortar
+        return render_pdf_page(page)[y0:y1, x0:x1]
+    matrix = pdf_render_matrix(page)
+    pixmap = page.get_pixmap(matrix=matrix, clip=fitz.Rect(x0, y0, x1, y1) * ~matrix, alpha=False)
+    img = np.frombuffer(pixmap.samples, np.uint8).reshape(pixmap.height, pixmap.width, pixmap.n)
+    return cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+
+def extract_text_layer(page):
+    """Leer la capa de texto nativa de una página PDF (PDF generados, no escaneados).
+    
+    Devuelve un resultado por página con el mismo formato que el pipeline OCR
+    ([caja de 4 puntos, (texto, confianza)]) en coordenadas del rasterizado, o
+    None si la página no tiene una capa de texto aprovechable y hay que pasar OCR.
+    """
+    import fitz
+    
+    words = page.get_text('words', sort=True)
+    text = ''.join(word[4] for word in words)
+    if len(text) < TEXT_LAYER_MIN_CHARS:
+        return None
+    
+    # Glifos sin mapeo Unicode (fuentes sin ToUnicode) => texto basura
+    garbage = sum(1 for char in text if char == '\ufffd' or 0xE000 <= ord(char) <= 0xF8FF)
+    if garbage / len(text) > 0.05:
+        return None
+    
+    # Imagen a página completa: escaneo con capa OCR del escáner, mejor nuestro OCR
+    page_area = abs(page.rect) or 1.0
+    image_area = sum(abs(fitz.Rect(info['bbox']) & page.rect) for info in page.get_image_info())
+    if image_area / page_area > TEXT_LAYER_MAX_IMAGE_COVERAGE:
+        return None
+    
+    matrix = page.rotation_matrix * pdf_render_matrix(page)
+    page_result = []
+    current = None
+    for x0, y0, x1, y1, word, block_no, line_no, _ in words:
+        rect = fitz.Rect(x0, y0, x1, y1)
+        line_key = (block_no, line_no)
+        # Partir la línea en huecos grandes (columnas, tablas) como haría el detector
+        if (current is not None and current['key'] == line_key
+                and rect.x0 - current['rect'].x1 <= 1.5 * max(rect.height, 1.0)):
+            current['rect'] |= rect
+            current['words'].append(word)
+            continue
+        if current is not None:
+            page_result.append(text_layer_block(current, matrix))
+        current = {'key': line_key, 'rect': rect, 'words': [word]}
+    if current is not None:
+        page_result.append(text_layer_block(current, matrix))
+    return page_result or None
+
+def text_layer_block(line, matrix):
+    """Convertir una línea de la capa de texto a un bloque estilo PaddleOCR"""
+    quad = line['rect'].quad * matrix
+    box = [[round(point.x, 1), round(point.y, 1)] for point in (quad.ul, quad.ur, quad.lr, quad.ll)]
+    return [box, (' '.join(line['words']), 1.0)]
+
+class _RecBatch:
+    """Lote de reconocimiento en formación"""
+    
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+        self.sealed = False
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+class RecognitionBatcher:
+    """Micro-batching de recortes de texto entre peticiones concurrentes.
+    
+    El primer worker que llega con recortes de un idioma se convierte en líder:
+    espera como mucho REC_BATCH_WAIT_MS a que otros workers aporten recortes
+    (o hasta REC_BATCH_MAX), ejecuta un único reconocimiento sobre todos ellos
+    con su réplica y reparte los resultados. El resto de workers espera su
+    parte (como mucho hasta el plazo de su petición). Sin otros workers
+    ocupados no se espera nada.
+    
+    El lote fusionado corre en una sola pasada: rec_batch_num del reconocedor
+    sube temporalmente hasta el tamaño del lote (máximo max_batch), en lugar
+    de trocearlo en sub-lotes de REC_BATCH_NUM.
+    """
+    
+    def __init__(self, max_batch, max_wait):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.cond = threading.Condition()
+        self.pending = {}
+        self.batches = 0
+        self.crops = 0
+        self.merged_requests = 0
+    
+    def recognize(self, ocr, crops):
+        language = ocr.args.lang
+        with self.cond:
+            batch = self.pending.get(language)
+            if batch is not None and batch.size + len(crops) > self.max_batch:
+                # No cabe: cerrar el lote actual y abrir uno nuevo
+                batch.sealed = True
+                self.cond.notify_all()
+                batch = None
+            leader = batch is None
+            if leader:
+                batch = _RecBatch()
+                self.pending[language] = batch
+            offset = batch.size
+            batch.parts.append(crops)
+            batch.size += len(crops)
+            if batch.size >= self.max_batch:
+                batch.sealed = True
+                self.cond.notify_all()
+        
+        if leader:
+            self._lead(language, batch, ocr)
+        else:
+            self._follow(batch)
+        
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[offset:offset + len(crops)]
+    
+    def _follow(self, batch):
+        """Esperar el resultado del líder sin pasar del plazo de la petición"""
+        context = current_request_metrics()
+        remaining = context.remaining() if context is not None else None
+        if remaining is None:
+            batch.done.wait()
+        elif not batch.done.wait(max(0.0, remaining)):
+            # El líder termina el lote igualmente; esta parte se descarta
+            raise DeadlineExceededError('Deadline exceeded waiting for the shared recognition batch')
+    
+    def _lead(self, language, batch, ocr):
+        with self.cond:
+            if ocr_pool is not None and ocr_pool.busy_workers > 1:
+                self.cond.wait_for(lambda: batch.sealed, timeout=self.max_wait)
+            batch.sealed = True
+            if self.pending.get(language) is batch:
+                del self.pending[language]
+            self.batches += 1
+            self.crops += batch.size
+            self.merged_requests += len(batch.parts)
+        
+        recognizer = ocr.text_recognizer
+        batch_num = getattr(recognizer, 'rec_batch_num', None)
+        try:
+            all_crops = [crop for part in batch.parts for crop in part]
+            if batch_num is not None:
+                # La réplica es exclusiva de este worker: se puede ajustar mientras dura la llamada
+                recognizer.rec_batch_num = max(batch_num, min(len(all_crops), self.max_batch))
+            batch.results, _ = recognizer(all_crops)
+        except Exception as e:
+            batch.error = e
+        finally:
+            if batch_num is not None:
+                recognizer.rec_batch_num = batch_num
+            batch.done.set()
+    
+    def stats(self):
+        """Contadores de micro-batching para /stats"""
+        return {
+            'max_batch': self.max_batch,
+            'max_wait_ms': round(self.max_wait * 1000, 1),
+            'batches': self.batches,
+            'crops': self.crops,
+            'avg_crops_per_batch': round(self.crops / self.batches, 2) if self.batches else 0,
+            'avg_requests_per_batch': round(self.merged_requests / self.batches, 2) if self.batches else 0
+        }
+
+def saturated_response(error):
+    """Respuesta 503 con Retry-After cuando la cola de inferencia (o el presupuesto de píxeles) está lleno"""
+    response = jsonify({
+        'success': False,
+        'error': f'Server busy, {error}',
+        'retry_after': error.retry_after
+    })
+    return response, 503, {'Retry-After': str(error.retry_after)}
+
+class PixelBudgetError(PoolSaturatedError):
+    """Presupuesto de píxeles en vuelo agotado: el cliente debe reintentar más tarde"""
+    
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.args = ('pixel budget exhausted',)
+
+class PixelReservation:
+    """Píxeles reservados por un documento; release() es idempotente"""
+    
+    def __init__(self, budget, pixels):
+        self.budget = budget
+        self.pixels = pixels
+    
+    def release(self):
+        pixels, self.pixels = self.pixels, 0
+        if pixels:
+            self.budget.release(pixels)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.release()
+
+class PixelBudget:
+    """Presupuesto global de píxeles decodificados en vuelo.
+    
+    Cada documento reserva, antes de entrar al pool, los píxeles que puede
+    tener decodificados a la vez (página tras la ingesta × páginas en
+    paralelo). Si no caben se espera hasta PIXEL_BUDGET_WAIT segundos y
+    después se responde 503; un documento solo siempre cabe.
+    """
+    
+    def __init__(self, limit, wait):
+        self.limit = limit
+        self.wait = wait
+        self.in_use = 0
+        self.peak = 0
+        self.waits = 0
+        self.rejected = 0
+        self.condition = threading.Condition()
+    
+    def reserve(self, pixels, timeout=None):
+        """Reservar píxeles esperando como mucho PIXEL_BUDGET_WAIT (o timeout si es menor)"""
+        pixels = min(int(pixels), self.limit)
+        deadline = time.monotonic() + (self.wait if timeout is None else max(0.0, min(self.wait, timeout)))
+        with self.condition:
+            if self.in_use + pixels > self.limit:
+                self.waits += 1
+            while self.in_use + pixels > self.limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.rejected += 1
+                    raise PixelBudgetError(max(1, int(math.ceil(self.wait / 2))))
+                self.condition.wait(remaining)
+            self.in_use += pixels
+            self.peak = max(self.peak, self.in_use)
+        return PixelReservation(self, pixels)
+    
+    def release(self, pixels):
+        with self.condition:
+            self.in_use -= pixels
+            self.condition.notify_all()
+    
+    def stats(self):
+        with self.condition:
+            return {'limit': self.limit, 'in_use': self.in_use, 'peak': self.peak,
+                    'waits': self.waits, 'rejected': self.rejected}
+
+pixel_budget = PixelBudget(PIXEL_BUDGET, PIXEL_BUDGET_WAIT) if PIXEL_BUDGET > 0 else None
+
+def probe_document(data, filename, det_limit_side_len=None):
+    """(píxeles por página tras la ingesta, páginas) leyendo solo cabeceras.
+    
+    Rechaza con ImageTooLargeError las imágenes por encima de IMAGE_MAX_PIXELS
+    (en un TIFF multipágina, cualquiera de sus páginas) antes de que lleguen a
+    un worker. Las imágenes teseladas se ingieren con DET_TILE_INGEST_MAX_SIDE.
+    """
+    if Path(filename).suffix.lower() == '.pdf':
+        import fitz
+        
+        with fitz.open(stream=data, filetype='pdf') as pdf:
+            if not pdf.page_count:
+                return 0, 0
+            sizes = [pdf_page_size(page) for page in pdf]
+        return max(width * height for width, height in sizes), len(sizes)
+    
+    header = read_image_header(data)
+    if header is None:
+        return 0, 1
+    width, height, frames, image_format, _ = header
+    check_image_pixels(width, height)
+    if frames > 1:
+        # Las páginas del TIFF se decodifican a resolución completa: reservar la mayor
+        sizes = read_frame_sizes(data)
+        for width, height in sizes:
+            check_image_pixels(width, height)
+        return max(width * height for width, height in sizes), frames
+    max_side = IMAGE_INGEST_MAX_SIDE
+    if det_limit_side_len == 'tiled' and frames == 1 and needs_tiling(width, height):
+        max_side = DET_TILE_INGEST_MAX_SIDE
+    _, width, height = ingest_size(width, height, image_format, max_side)
+    return width * height, frames
+
+def reserve_pixels(data, filename, pages=None, det_limit_side_len=None):
+    """Reservar en el presupuesto global lo que el documento tendrá decodificado a la vez"""
+    pixels, page_count = probe_document(data, filename, det_limit_side_len)
+    if pages is not None:
+        page_count = min(page_count, pages)
+    if pixel_budget is None:
+        return PixelReservation(None, 0)
+    concurrent_pages = max(1, min(page_count, OCR_WORKERS))
+    context = current_request_metrics()
+    remaining = context.remaining() if context is not None else None
+    try:
+        return pixel_budget.reserve(pixels * concurrent_pages, remaining)
+    except PixelBudgetError:
+        if context is not None and context.expired():
+            raise DeadlineExceededError('Deadline exceeded waiting for the pixel budget')
+        raise
+
+class ResultCache:
+    """Caché de resultados OCR direccionada por contenido.
+    
+    La clave es sha256(bytes del archivo, idioma, umbrales de cpu_config,
+    detailed, páginas y la huella de los ajustes de ingesta, resolución,
+    teselas, capa de texto y pre-chequeo de orientación: cambiar cualquiera
+    de ellos invalida las entradas en disco). Nivel en memoria LRU acotado y nivel opcional en disco (un JSON
+    por entrada) para sobrevivir a reinicios. Guarda la salida de
+    process_ocr_result_cpu, así que un acierto se salta ocr.ocr() por completo.
+    """
+    
+    CONFIG_KEYS = ('det_db_thresh', 'det_db_box_thresh', 'drop_score',
+                   'det_limit_side_len', 'use_angle_cls', 'rec_batch_num')
+    COUNTER_KEYS = ('memory_hits', 'disk_hits', 'misses', 'memory_evictions',
+                    'disk_evictions', 'disk_errors')
+    
+    def __init__(self, max_entries, disk_dir=None, disk_max_entries=0):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(self.COUNTER_KEYS, 0)
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+    
+    @staticmethod
+    def settings_fingerprint():
+        """Ajustes del servidor que cambian el resultado de un mismo archivo (no los de admisión como PIXEL_BUDGET)"""
+        return {
+            'ingest_max_side': IMAGE_INGEST_MAX_SIDE,
+            'det_resolution': [DET_RESOLUTION, DET_RESOLUTION_BUCKETS, DET_MIN_TEXT_HEIGHT],
+            'det_tiles': [DET_TILE_SIZE, DET_TILE_OVERLAP, DET_TILE_MIN_ASPECT, DET_TILE_MIN_PIXELS,
+                          DET_TILE_INGEST_MAX_SIDE],
+            'text_layer': [TEXT_LAYER_MIN_CHARS, TEXT_LAYER_MAX_IMAGE_COVERAGE],
+            'cls_precheck': [CLS_PRECHECK, CLS_PRECHECK_SAMPLES, CLS_PRECHECK_MAX_VERTICAL]
+        }
+    
+    def make_key(self, data, language, detailed, page_ranges=None, use_text_layer=True, det_limit_side_len=None):
+        """Clave de contenido para un archivo y sus parámetros de OCR"""
+        digest = hashlib.sha256(data)
+        params = {k: cpu_config.get(k) for k in self.CONFIG_KEYS}
+        params.update(language=language, detailed=bool(detailed), pages=page_ranges,
+                      text_layer=bool(use_text_layer), backend=inference_backend.cache_key(),
+                      settings=self.settings_fingerprint())
+        if det_limit_side_len is not None:
+            params['det_resolution'] = det_limit_side_len
+        digest.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+    
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+    
+    def get(self, key):
+        """Devolver el resultado cacheado o None"""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return self.entries[key]
+        
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                    value = json.load(f)
+                self._remember(key, value)
+                with self.lock:
+                    self.counters['disk_hits'] += 1
+                return value
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.warning(f"⚠️ Entrada de caché en disco ilegible {key[:12]}: {e}")
+                with self.lock:
+                    self.counters['disk_errors'] += 1
+        
+        with self.lock:
+            self.counters['misses'] += 1
+        return None
+    
+    def put(self, key, value):
+        """Guardar un resultado en memoria y, si está activo, en disco"""
+        self._remember(key, value)
+        if not self.disk_dir:
+            return
+        
+        try:
+            tmp_path = self._disk_path(key) + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(value, f)
+            os.replace(tmp_path, self._disk_path(key))
+            self._evict_disk()
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo escribir la caché en disco: {e}")
+            with self.lock:
+                self.counters['disk_errors'] += 1
+    
+    def _remember(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters['memory_evictions'] += 1
+    
+    def _evict_disk(self):
+        """Borrar las entradas de disco más antiguas por encima del límite"""
+        if self.disk_max_entries <= 0:
+            return
+        files = [entry for entry in os.scandir(self.disk_dir) if entry.name.endswith('.json')]
+        excess = len(files) - self.disk_max_entries
+        if excess <= 0:
+            return
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in files[:excess]:
+            try:
+                os.remove(entry.path)
+                with self.lock:
+                    self.counters['disk_evictions'] += 1
+            except OSError:
+                pass
+    
+    def stats(self):
+        """Contadores de la caché para /stats"""
+        with self.lock:
+            hits = self.counters['memory_hits'] + self.counters['disk_hits']
+            lookups = hits + self.counters['misses']
+            return {
+                **self.counters,
+                'hits': hits,
+                'hit_rate': round(hits / lookups * 100, 1) if lookups else 0.0,
+                'memory_entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'disk_dir': self.disk_dir or None
+            }
+
+class RequestError(Exception):
+    """Parámetros de petición inválidos (responder 400)"""
+
+class ImageTooLargeError(RequestError):
+    """Imagen por encima de IMAGE_MAX_PIXELS (responder 413)"""
+
+class BatchTooLargeError(RequestError):
+    """Lote de /jobs por encima de JOB_MAX_BATCH_BYTES descomprimidos (responder 413)"""
+
+class AdminTokenError(RequestError):
+    """Opción de administración (profile, /debug) sin X-Admin-Token válido (responder 403)"""
+
+def parse_page_range(spec):
+    """Parsear pages=\"1-3,5,8-\" a una lista de rangos (inicio, fin) 1-based"""
+    if not spec or not spec.strip():
+        return None
+    
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if '-' in part:
+                start, end = part.split('-', 1)
+                start = int(start) if start.strip() else 1
+                end = int(end) if end.strip() else None
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise RequestError(f"Invalid page range: {part}")
+        if start < 1 or (end is not None and end < start):
+            raise RequestError(f"Invalid page range: {part}")
+        ranges.append((start, end))
+    return ranges or None
+
+def resolve_page_indices(page_ranges, page_count):
+    """Convertir rangos de páginas a índices 0-based dentro del documento"""
+    if page_ranges is None:
+        return list(range(page_count))
+    
+    indices = set()
+    for start, end in page_ranges:
+        last = page_count if end is None else min(end, page_count)
+        indices.update(range(start - 1, last))
+    if not indices:
+        raise RequestError(f"No pages in range (document has {page_count})")
+    return sorted(indices)
+
+def pdf_page_task(ocr, data, page_index, det_limit_side_len=None):
+    """Tarea de pool: rasterizar una sola página del PDF y pasarle OCR"""
+    import fitz
+    
+    with timed_stage('decode'):
+        with fitz.open(stream=data, filetype='pdf') as pdf:
+            img = render_pdf_page(pdf[page_index])
+    trace_event('decode', page=page_index + 1, size=[img.shape[1], img.shape[0]])
+    return run_ocr_pipeline(ocr, img, cls=True, det_limit_side_len=det_limit_side_len)
+
+def image_task(ocr, data, det_limit_side_len=None, page_index=0):
+    """Tarea de pool: OCR de una imagen (o de una página de un TIFF multipágina)"""
+    with timed_stage('decode'):
+        img, scale = ingest_image(data, page_index)
+    if img is not None:
+        trace_event('decode', page=page_index + 1, size=[img.shape[1], img.shape[0]], scale=round(scale, 4))
+    result = run_ocr_pipeline(ocr, img, cls=True, det_limit_side_len=det_limit_side_len)
+    return map_blocks(result, scale=scale)
+
+def detect_tile_task(ocr, tile):
+    """Tarea de pool: detección sobre una tesela (cajas en coordenadas de la tesela)"""
+    with timed_stage('detection'):
+        dt_boxes, _ = detect_text(ocr, tile, DET_TILE_SIZE)
+    return dt_boxes if dt_boxes is not None else np.zeros((0, 4, 2), dtype=np.float32)
+
+def tiled_image_pages(data, lang, context=None):
+    """Detección por teselas de una imagen (det_limit_side_len=tiled); None si no hace falta.
+    
+    La imagen se decodifica una sola vez (sin bajar de DET_TILE_INGEST_MAX_SIDE),
+    las teselas solapadas se detectan repartidas entre los workers, las cajas
+    se fusionan sin duplicados y crop → cls → rec corre en una única tarea.
+    Devuelve un generador como el de iter_document_pages.
+    """
+    header = read_image_header(data)
+    if header is None or header[2] > 1 or not needs_tiling(header[0], header[1]):
+        return None
+    with timed_stage('decode', context):
+        img, scale = ingest_image(data, max_side=DET_TILE_INGEST_MAX_SIDE)
+    if img is None:
+        return None
+    
+    rects = tile_rects(img.shape[1], img.shape[0])
+    trace_event('decode', context, page=1, size=[img.shape[1], img.shape[0]], scale=round(scale, 4), tiles=len(rects))
+    detections = ocr_pool.imap(lang, detect_tile_task, [(img[y0:y1, x0:x1],) for x0, y0, x1, y1 in rects])
+    metric_det_tiles.inc(kind='page')
+    metric_det_tiles.inc(len(rects), kind='tile')
+    logger.info(f"🧩 Detección por teselas: {img.shape[1]}x{img.shape[0]} en {len(rects)} teselas")
+    
+    def pages():
+        tile_boxes = [(index, np.asarray(dt_boxes, dtype=np.float32).reshape(-1, 4, 2) + (x0, y0))
+                      for index, ((x0, y0, _, _), dt_boxes) in enumerate(zip(rects, detections))]
+        with timed_stage('tile_merge', context):
+            dt_boxes = merge_tile_boxes(tile_boxes)
+        trace_event('tile_merge', context, tiles=len(rects), boxes=sum(len(boxes) for _, boxes in tile_boxes),
+                    merged=len(dt_boxes))
+        result = None
+        if len(dt_boxes):
+            future = ocr_pool.submit(lang, recognize_boxes, img, dt_boxes, block=True, context=context)
+            result = ocr_pool.wait(future, context)
+        yield 1, map_blocks(result, scale=scale), 'ocr'
+    
+    return pages()
+
+def roi_pixel_rect(roi, width, height):
+    """Rectángulo entero (x0, y0, x1, y1) de una ROI recortado a la página; None si queda vacío"""
+    x, y, w, h = roi['x'], roi['y'], roi['width'], roi['height']
+    if roi['units'] == 'relative':
+        x, y, w, h = x * width, y * height, w * width, h * height
+    x0, y0 = max(0, int(math.floor(x))), max(0, int(math.floor(y)))
+    x1, y1 = min(width, int(math.ceil(x + w))), min(height, int(math.ceil(y + h)))
+    if x1 - x0 < 2 or y1 - y0 < 2:
+        return None
+    return x0, y0, x1, y1
+
+def roi_task(ocr, data, page_index, rois, det_limit_side_len=None):
+    """Tarea de pool: OCR solo de las ROIs de una página (page_index None = imagen).
+    
+    Las ROIs 'detect' pasan por det → cls → rec sobre el recorte; las 'line'
+    se reconocen directamente, todas en una sola llamada al reconocedor.
+    Devuelve un PageResult (o None) por ROI, en coordenadas de la página.
+    """
+    scale = 1.0
+    if page_index is None:
+        with timed_stage('decode'):
+            img, scale = ingest_image(data)
+        if img is None:
+            return [None] * len(rois)
+        # ROIs en píxeles de la imagen subida; el recorte sale de la imagen ya reducida
+        width, height = int(round(img.shape[1] / scale)), int(round(img.shape[0] / scale))
+        rects = [roi_pixel_rect(roi, width, height) for roi in rois]
+        with timed_stage('crop'):
+            crops = [img[int(rect[1] * scale):int(math.ceil(rect[3] * scale)),
+                         int(rect[0] * scale):int(math.ceil(rect[2] * scale))] if rect else None
+                     for rect in rects]
+    else:
+        import fitz
+        
+        with timed_stage('decode'):
+            with fitz.open(stream=data, filetype='pdf') as pdf:
+                page = pdf[page_index]
+                width, height = pdf_page_size(page)
+                rects = [roi_pixel_rect(roi, width, height) for roi in rois]
+                crops = [render_pdf_region(page, rect) if rect else None for rect in rects]
+    
+    crops = [crop if crop is not None and min(crop.shape[:2]) >= 2 else None for crop in crops]
+    results = [None] * len(rois)
+    lines = [i for i, roi in enumerate(rois) if roi['mode'] == 'line' and crops[i] is not None]
+    if lines:
+        rec_res = recognize_crops(ocr, [crops[i] for i in lines])
+        for i, rec_result in zip(lines, rec_res):
+            x0, y0, x1, y1 = rects[i]
+            if rec_result[1] >= ocr.drop_score:
+                results[i] = PageResult([[[[x0, y0], [x1, y0], [x1, y1], [x0, y1]], rec_result]], cls_skipped=True)
+    
+    for i, roi in enumerate(rois):
+        if roi['mode'] != 'detect' or crops[i] is None:
+            continue
+        result = run_ocr_pipeline(ocr, crops[i], cls=True, det_limit_side_len=det_limit_side_len)
+        x0, y0 = rects[i][:2]
+        results[i] = map_blocks(result, (int(x0 * scale), int(y0 * scale)), scale)
+    return results
+
+def iter_document_pages(data, filename, lang, page_ranges=None, use_text_layer=True, det_limit_side_len=None):
+    """OCR de un documento página a página; los PDF se reparten entre los workers.
+    
+    Las páginas PDF con capa de texto nativa se leen directamente y solo las
+    escaneadas pasan por OCR. La preparación (rangos, capa de texto, admisión
+    de la primera página) se hace al llamar; devuelve un generador de
+    (número de página, resultado de la página, origen 'text_layer' | 'ocr')
+    en orden de página según van terminando.
+    """
+    if Path(filename).suffix.lower() != '.pdf':
+        page_count = image_page_count(data) if Path(filename).suffix.lower() in ('.tif', '.tiff') else 1
+        if page_count > 1:
+            # TIFF multipágina: cada página es una tarea del pool, como en PDF
+            page_indices = resolve_page_indices(page_ranges, page_count)
+            frame_results = ocr_pool.imap(lang, image_task, [(data, det_limit_side_len, index)
+                                                             for index in page_indices])
+            
+            def frame_pages():
+                for index in page_indices:
+                    yield index + 1, next(frame_results), 'ocr'
+            
+            return frame_pages()
+        
+        context = current_request_metrics()
+        if det_limit_side_len == 'tiled':
+            tiled_pages = tiled_image_pages(data, lang, context)
+            if tiled_pages is not None:
+                return tiled_pages
+        future = ocr_pool.submit(lang, image_task, data, det_limit_side_len, context=context)
+        
+        def image_pages():
+            yield 1, ocr_pool.wait(future, context), 'ocr'
+        
+        return image_pages()
+    
+    import fitz
+    
+    text_pages = {}
+    with fitz.open(stream=data, filetype='pdf') as pdf:
+        page_indices = resolve_page_indices(page_ranges, pdf.page_count)
+        if use_text_layer:
+            with timed_stage('text_layer'):
+                for index in page_indices:
+                    page_result = extract_text_layer(pdf[index])
+                    if page_result is not None:
+                        text_pages[index] = page_result
+    
+    ocr_indices = [index for index in page_indices if index not in text_pages]
+    if text_pages:
+        logger.info(f"📝 {filename}: {len(text_pages)} páginas con capa de texto, {len(ocr_indices)} con OCR")
+    ocr_results = ocr_pool.imap(lang, pdf_page_task, [(data, index, det_limit_side_len) for index in ocr_indices])
+    
+    def pages():
+        for index in page_indices:
+            if index in text_pages:
+                yield index + 1, text_pages[index], 'text_layer'
+            else:
+                yield index + 1, next(ocr_results), 'ocr'
+    
+    return pages()
+
+def page_cls_skipped(result, source):
+    """Si la página se leyó sin clasificador de ángulo (None para páginas con capa de texto)"""
+    if source != 'ocr':
+        return None
+    # Página sin texto detectado: el clasificador no llegó a correr
+    return getattr(result, 'cls_skipped', True)
+
+def document_cls_skipped(page_results):
+    """True si ninguna página con OCR necesitó el clasificador de ángulo"""
+    return all(cls_skipped is not False for _, _, _, cls_skipped in page_results)
+
+def run_cached_ocr(data, filename, lang, detailed, page_ranges=None, use_text_layer=True, det_limit_side_len=None):
+    """OCR con caché: devuelve [(página, salida de process_ocr_result_cpu, origen, cls_skipped)],
+    si fue un acierto y si el plazo de la petición cortó el documento a medias"""
+    key = None
+    if result_cache is not None:
+        key = result_cache.make_key(data, lang, detailed, page_ranges, use_text_layer, det_limit_side_len)
+        cached = result_cache.get(key)
+        if cached is not None:
+            logger.info(f"♻️ Resultado en caché para {filename}")
+            return cached, True, False
     
-    logger.info("⚙️ Entorno CPU configurado correctamente")
+    context = current_request_metrics()
+    page_results = []
+    truncated = False
+    with reserve_pixels(data, filename, det_limit_side_len=det_limit_side_len):
+        try:
+            for page, result, source in iter_document_pages(data, filename, lang, page_ranges, use_text_layer,
+                                                            det_limit_side_len):
+                with timed_stage('postprocess', context):
+                    processed = process_ocr_result_cpu([result])
+                cls_skipped = page_cls_skipped(result, source)
+                if context is not None and source == 'ocr':
+                    context.observe_blocks(len(processed[0]))
+                    context.observe_cls(cls_skipped)
+                page_results.append((page, processed, source, cls_skipped))
+        except DeadlineExceededError:
+            # Plazo agotado entre páginas: devolver las ya leídas
+            if not page_results:
+                raise
+            truncated = True
+            metric_deadline_expired.inc(stage='truncated')
+            logger.warning(f"⏱️ {filename}: plazo agotado, {len(page_results)} páginas devueltas")
+    
+    if key is not None and not truncated:
+        result_cache.put(key, page_results)
+    return page_results, False, truncated
+
+def text_layer_roi(page_result, rect):
+    """Bloques de la capa de texto cuyo centro cae dentro de la ROI"""
+    if rect is None:
+        return None
+    x0, y0, x1, y1 = rect
+    blocks = []
+    for block in page_result:
+        xs = [point[0] for point in block[0]]
+        ys = [point[1] for point in block[0]]
+        center_x, center_y = (min(xs) + max(xs)) / 2, (min(ys) + max(ys)) / 2
+        if x0 <= center_x <= x1 and y0 <= center_y <= y1:
+            blocks.append(block)
+    return blocks or None
 
-def initialize_ocr_cpu():
-    """Inicializar OCR con configuración CPU GANADORA"""
-    global ocr_instances, ocr_initialized, server_stats
+def run_roi_ocr(data, filename, lang, rois, use_text_layer=True, det_limit_side_len=None):
+    """OCR solo de las regiones pedidas, sin pasar la página completa por el detector.
     
-    if ocr_initialized:
-        return True
+    Una tarea de pool por página con ROIs; en PDF con capa de texto las ROIs
+    se leen de ella. Devuelve [(página, salida de process_ocr_result_cpu,
+    origen, cls_skipped)] de las páginas con ROIs y el resumen de cada ROI.
+    """
+    is_pdf = Path(filename).suffix.lower() == '.pdf'
+    by_page = {}
+    for index, roi in enumerate(rois):
+        by_page.setdefault(roi['page'], []).append(index)
+    pages = sorted(by_page)
     
-    try:
-        setup_cpu_environment()
-        
-        logger.info("🚀 Inicializando PaddleOCR CPU con configuración GANADORA...")
-        
-        import paddleocr
-        logger.info(f"📦 PaddleOCR version: {paddleocr.__version__}")
-        logger.info("💻 Modo: CPU optimizado (sin CUDA)")
-        
-        # 🏆 CONFIGURACIÓN GANADORA OPTIMIZADA PARA CPU
-        cpu_config = {
-            'use_angle_cls': True,           # ✅ CRÍTICO: Detección de ángulos
-            'use_gpu': False,                # ✅ CPU forzado
-            'det_db_thresh': 0.1,            # 🏆 CLAVE: MUY sensible (más detección)
-            'det_db_box_thresh': 0.4,        # 🏆 CLAVE: MUY sensible (más cajas)
-            'drop_score': 0.2,               # 🏆 CLAVE: MUY permisivo (más texto)
-            'show_log': False,               # Sin logs verbosos
-            'enable_mkldnn': True,           # ✅ Optimización CPU Intel
-            'cpu_threads': 4,                # ✅ Threads optimizados
-            'det_limit_side_len': 960,       # ✅ Resolución balanceada
-            'rec_batch_num': 6               # ✅ Batch CPU optimizado
-        }
-        
-        for lang in supported_languages:
-            logger.info(f"📚 Cargando OCR CPU GANADOR para {lang.upper()}...")
-            
-            try:
-                ocr_instances[lang] = paddleocr.PaddleOCR(lang=lang, **cpu_config)
-                logger.info(f"   ✅ OCR CPU GANADOR configurado para {lang}")
-            except Exception as e:
-                logger.error(f"   ❌ Error cargando {lang}: {e}")
-                # Continuar con otros idiomas
-                continue
+    text_pages = {}
+    if is_pdf:
+        import fitz
         
-        if not ocr_instances:
-            logger.error("❌ No se pudo cargar ningún modelo OCR")
-            return False
+        with fitz.open(stream=data, filetype='pdf') as pdf:
+            if pages[-1] > pdf.page_count:
+                raise RequestError(f"ROI page {pages[-1]} out of range (document has {pdf.page_count})")
+            if use_text_layer:
+                with timed_stage('text_layer'):
+                    for page in pages:
+                        page_result = extract_text_layer(pdf[page - 1])
+                        if page_result is not None:
+                            width, height = pdf_page_size(pdf[page - 1])
+                            text_pages[page] = [text_layer_roi(page_result, roi_pixel_rect(rois[i], width, height))
+                                                for i in by_page[page]]
+    elif pages != [1]:
+        raise RequestError("ROI pages other than 1 require a PDF")
+    
+    ocr_pages = [page for page in pages if page not in text_pages]
+    reservation = reserve_pixels(data, filename, len(ocr_pages)) if ocr_pages else PixelReservation(None, 0)
+    with reservation:
+        ocr_results = ocr_pool.imap(lang, roi_task, [(data, page - 1 if is_pdf else None,
+                                                      [rois[i] for i in by_page[page]], det_limit_side_len)
+                                                     for page in ocr_pages])
         
-        ocr_initialized = True
-        server_stats['models_loaded'] = True
+        context = current_request_metrics()
+        page_results = []
+        roi_summaries = [None] * len(rois)
+        for page in pages:
+            source = 'text_layer' if page in text_pages else 'ocr'
+            results = text_pages[page] if page in text_pages else next(ocr_results)
+            page_output = ([], [], [])
+            for index, result in zip(by_page[page], results):
+                with timed_stage('postprocess', context):
+                    roi_lines, roi_confidences, roi_coordinates = process_ocr_result_cpu([result])
+                roi = rois[index]
+                roi_summaries[index] = {
+                    'name': roi['name'],
+                    'page': page,
+                    'mode': roi['mode'],
+                    'source': source,
+                    'text': '\n'.join(roi_lines),
+                    'total_blocks': len(roi_lines),
+                    'confidence': round(sum(roi_confidences) / len(roi_confidences), 3) if roi_confidences else None
+                }
+                for target, values in zip(page_output, (roi_lines, roi_confidences, roi_coordinates)):
+                    target.extend(values)
+            cls_skipped = None
+            if source == 'ocr':
+                cls_skipped = all(page_cls_skipped(result, source) for result in results)
+                if context is not None:
+                    context.observe_blocks(len(page_output[0]))
+                    context.observe_cls(cls_skipped)
+            page_results.append((page, page_output, source, cls_skipped))
+    return page_results, roi_summaries
+
+def flatten_page_results(page_results):
+    """Unir los resultados por página en listas planas + número de página por bloque"""
+    text_lines, confidences, coordinates_list, block_pages = [], [], [], []
+    for page, (page_lines, page_confidences, page_coordinates), _, _ in page_results:
+        text_lines.extend(page_lines)
+        confidences.extend(page_confidences)
+        coordinates_list.extend(page_coordinates)
+        block_pages.extend([page] * len(page_lines))
+    return text_lines, confidences, coordinates_list, block_pages
+
+def page_summaries(page_results, page_texts=None):
+    """Resumen por página para documentos multipágina (page_texts: texto en orden de lectura por página)"""
+    summaries = []
+    for page, (page_lines, page_confidences, _), source, cls_skipped in page_results:
+        summaries.append({
+            'page': page,
+            'source': source,
+            'cls_skipped': cls_skipped,
+            'text': page_texts.get(page, '') if page_texts is not None else '\n'.join(page_lines),
+            'total_blocks': len(page_lines),
+            'avg_confidence': round(sum(page_confidences) / len(page_confidences), 3) if page_confidences else None
+        })
+    return summaries
+
+class BlockGeometry:
+    """Geometría de todos los bloques de una respuesta, calculada de una vez con NumPy.
+    
+    Las cajas se guardan como un array (N, 4, 2) float32; orientación,
+    relación de aspecto, ángulo, rectángulos envolventes y estadísticas de
+    confianza se calculan en una sola pasada vectorizada y los reutilizan
+    todos los constructores de respuesta.
+    """
+    
+    ORIENTATIONS = ('horizontal', 'vertical', 'rotated')
+    
+    def __init__(self, coordinates_list, confidences=()):
+        count = len(coordinates_list)
+        self.confidences = np.asarray(confidences, dtype=np.float64)
+        self.boxes = np.zeros((count, 4, 2), dtype=np.float32)
+        valid = np.zeros(count, dtype=bool)
         
-        logger.info("✅ OCR CPU inicializado con configuración GANADORA")
-        logger.info("🏆 Rendimiento esperado: 79+ bloques, 95%+ confianza")
-        logger.info("💻 Optimizado para CPU - Sin dependencias CUDA")
+        try:
+            boxes = np.asarray(coordinates_list, dtype=np.float32)
+        except (ValueError, TypeError):
+            boxes = None
+        if boxes is not None and boxes.shape == (count, 4, 2):
+            self.boxes = boxes
+            valid[:] = True
+            mins, maxs = boxes.min(axis=1), boxes.max(axis=1)
+            first, second = boxes[:, 0], boxes[:, 1]
+        else:
+            # Polígonos de más de 4 puntos o cajas incompletas: caja a caja
+            mins = np.zeros((count, 2), dtype=np.float32)
+            maxs = np.zeros((count, 2), dtype=np.float32)
+            first = np.zeros((count, 2), dtype=np.float32)
+            second = np.zeros((count, 2), dtype=np.float32)
+            for i, coords in enumerate(coordinates_list):
+                try:
+                    points = np.asarray(coords, dtype=np.float32).reshape(-1, 2)
+                except (ValueError, TypeError):
+                    continue
+                if len(points) < 4:
+                    continue
+                valid[i] = True
+                self.boxes[i] = points[:4]
+                mins[i], maxs[i] = points.min(axis=0), points.max(axis=0)
+                first[i], second[i] = points[0], points[1]
         
-        return True
+        self.valid = valid
+        self.widths = maxs[:, 0] - mins[:, 0]
+        self.heights = maxs[:, 1] - mins[:, 1]
+        self.bounding_rects = np.column_stack([mins, self.widths, self.heights])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.aspect_ratios = self.heights / self.widths
+        delta = second - first
+        self.angles = np.abs(np.degrees(np.arctan2(delta[:, 1], delta[:, 0])))
         
-    except Exception as e:
-        logger.error(f"❌ Error crítico inicializando OCR CPU: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
-        return False
+        # Mismas reglas que la detección por bloque original: 0 horizontal, 1 vertical, 2 rotado
+        self.orientation_codes = np.select(
+            [~valid, self.widths == 0, self.aspect_ratios > 3.0,
+             (self.angles > 30) & (self.angles < 150), self.aspect_ratios > 2.0],
+            [0, 1, 1, 2, 1], default=0)
+    
+    def __len__(self):
+        return len(self.orientation_codes)
+    
+    @property
+    def orientations(self):
+        """Orientación de cada bloque ('horizontal' | 'vertical' | 'rotated')"""
+        return [self.ORIENTATIONS[code] for code in self.orientation_codes.tolist()]
+    
+    def orientation_counts(self):
+        counts = np.bincount(self.orientation_codes, minlength=len(self.ORIENTATIONS))
+        return dict(zip(self.ORIENTATIONS, counts.tolist()))
+    
+    def confidence_stats(self):
+        """(media, mínima, máxima) de confianza; None si no hay bloques"""
+        if not len(self.confidences):
+            return None, None, None
+        return (float(self.confidences.mean()), float(self.confidences.min()),
+                float(self.confidences.max()))
+
+def sweep_gaps(starts, ends, min_gap):
+    """Huecos libres entre intervalos 1D por sort-and-sweep: [(posición de corte, ancho)] ordenados"""
+    order = np.argsort(starts, kind='stable')
+    starts, ends = starts[order], ends[order]
+    reach = np.maximum.accumulate(ends)
+    widths = starts[1:] - reach[:-1]
+    found = np.nonzero(widths > min_gap)[0]
+    return [(float(reach[i] + widths[i] / 2), float(widths[i])) for i in found]
+
+def rows_aligned(centers_a, centers_b, tolerance):
+    """Si las cajas del lado más pequeño comparten fila con el otro lado (tabla, no columnas)"""
+    if len(centers_a) > len(centers_b):
+        centers_a, centers_b = centers_b, centers_a
+    ordered = np.sort(centers_b)
+    position = np.clip(np.searchsorted(ordered, centers_a), 1, max(1, len(ordered) - 1))
+    nearest = np.minimum(np.abs(ordered[position - 1] - centers_a),
+                         np.abs(ordered[np.minimum(position, len(ordered) - 1)] - centers_a))
+    return np.count_nonzero(nearest <= tolerance) > LAYOUT_ALIGNED_ROWS * len(centers_a)
 
-def get_ocr_instance(language=None):
-    """Obtener instancia OCR CPU"""
-    global ocr_instances, ocr_initialized
+def table_gap(sub, cut, gap, line_height):
+    """Si un hueco vertical separa celdas de una tabla (se lee fila a fila) y no columnas de texto.
     
-    if not ocr_initialized:
-        if not initialize_ocr_cpu():
-            return None
+    Tabla: cajas alineadas por filas a ambos lados, al menos
+    LAYOUT_TABLE_MIN_ROWS filas que cruzan el hueco con el mismo número de
+    celdas y, en al menos un lado, celdas cortas frente al hueco. Un artículo
+    a dos columnas también alinea sus líneas, pero son anchas y las separa un
+    canal estrecho. Con menos de LAYOUT_TABLE_MIN_ROWS filas basta la alineación.
+    """
+    centers = (sub[:, 1] + sub[:, 3]) / 2
+    left, right = sub[:, 2] <= cut, sub[:, 0] >= cut
+    tolerance = LAYOUT_ROW_TOLERANCE * line_height
+    if not rows_aligned(centers[left], centers[right], tolerance):
+        return False
     
-    lang = language or default_lang
-    if lang not in ocr_instances:
-        logger.warning(f"Idioma {lang} no disponible, usando {default_lang}")
-        lang = default_lang
+    order = np.argsort(centers, kind='stable')
+    rows = np.empty(len(sub), dtype=np.int64)
+    rows[order] = np.cumsum(np.diff(centers[order], prepend=centers[order[0]]) > tolerance)
+    if rows.max() + 1 < LAYOUT_TABLE_MIN_ROWS:
+        # Muy pocas filas para distinguir: una fila alineada se lee entera
+        return True
+    crossing = np.intersect1d(rows[left], rows[right])
+    if len(crossing) < LAYOUT_TABLE_MIN_ROWS:
+        return False
+    cells = np.bincount(rows, minlength=rows.max() + 1)[crossing]
+    if np.count_nonzero(cells == np.bincount(cells).argmax()) < LAYOUT_ALIGNED_ROWS * len(crossing):
+        return False
     
-    return ocr_instances.get(lang)
+    in_rows = np.isin(rows, crossing)
+    widths = sub[:, 2] - sub[:, 0]
+    narrow = min(np.median(widths[in_rows & left]), np.median(widths[in_rows & right]))
+    return narrow <= LAYOUT_TABLE_CELL_GAP * gap
 
-def detect_text_orientation(coordinates):
-    """Detección de orientación de texto"""
-    try:
-        if not coordinates or len(coordinates) < 4:
-            return 'horizontal'
-            
-        x_coords = [point[0] for point in coordinates]
-        y_coords = [point[1] for point in coordinates]
-        
-        width = max(x_coords) - min(x_coords)
-        height = max(y_coords) - min(y_coords)
-        
-        if width == 0:
-            return 'vertical'
-        
-        aspect_ratio = height / width
-        p1, p2 = coordinates[0], coordinates[1]
-        angle = abs(np.arctan2(p2[1] - p1[1], p2[0] - p1[0]) * 180 / np.pi)
-        
-        if aspect_ratio > 3.0:
-            return 'vertical'
-        elif angle > 30 and angle < 150:
-            return 'rotated'
-        elif aspect_ratio > 2.0:
-            return 'vertical'
-        else:
-            return 'horizontal'
-            
-    except:
-        return 'horizontal'
+def xy_cut(rects, indices, line_height, regions, depth=0):
+    """Partir una región en orden de lectura (XY-cut recursivo).
+    
+    En cada región: secciones separadas por huecos verticales de al menos
+    LAYOUT_SECTION_GAP líneas; si no hay, columnas por huecos de al menos
+    LAYOUT_COLUMN_GAP líneas que no separan celdas de una tabla (table_gap:
+    una tabla se lee fila a fila); si tampoco, bandas por los huecos
+    horizontales más anchos. Los huecos salen de un sort-and-sweep, así que
+    cada nivel es O(N log N).
+    """
+    sub = rects[indices]
+    if len(indices) > 1 and depth < LAYOUT_MAX_DEPTH:
+        row_gaps = sweep_gaps(sub[:, 1], sub[:, 3], 0.0)
+        cuts = [cut for cut, width in row_gaps if width >= LAYOUT_SECTION_GAP * line_height]
+        axis = 1
+        if not cuts:
+            cuts = [cut for cut, width in sweep_gaps(sub[:, 0], sub[:, 2], LAYOUT_COLUMN_GAP * line_height)
+                    if not table_gap(sub, cut, width, line_height)]
+            axis = 0
+        if not cuts:
+            widest = max((width for _, width in row_gaps), default=0.0)
+            cuts = [cut for cut, width in row_gaps if width >= 0.8 * widest]
+            axis = 1
+        if cuts:
+            bins = np.searchsorted(np.array(cuts), (sub[:, axis] + sub[:, axis + 2]) / 2)
+            for part in range(len(cuts) + 1):
+                part_indices = indices[bins == part]
+                if len(part_indices):
+                    xy_cut(rects, part_indices, line_height, regions, depth + 1)
+            return
+    regions.append(indices)
+
+def region_lines(rects, indices, line_height):
+    """Agrupar en líneas las cajas de una región: barrido por centro vertical, cada línea de izquierda a derecha"""
+    centers = (rects[indices, 1] + rects[indices, 3]) / 2
+    order = indices[np.argsort(centers, kind='stable')]
+    lines, current, center_sum = [], [], 0.0
+    for index, center in zip(order.tolist(), np.sort(centers, kind='stable').tolist()):
+        if current and center - center_sum / len(current) > 0.5 * line_height:
+            lines.append(current)
+            current, center_sum = [], 0.0
+        current.append(index)
+        center_sum += center
+    if current:
+        lines.append(current)
+    return [sorted(line, key=lambda i: rects[i, 0]) for line in lines]
 
-def analyze_orientations(coordinates_list):
-    """Analizar orientaciones de texto"""
-    orientations = {'horizontal': 0, 'vertical': 0, 'rotated': 0}
+def build_layout(text_lines, confidences, block_pages, geometry, mode='lines'):
+    """Orden de lectura por página: líneas (y párrafos) con su caja envolvente.
+    
+    Devuelve (lines, paragraphs); paragraphs es None en modo 'lines'. Los
+    block_ids coinciden con los de los bloques detallados.
+    """
+    rects = geometry.bounding_rects.astype(np.float64)
+    rects[:, 2:] += rects[:, :2]  # x0, y0, x1, y1
+    block_pages = np.asarray(block_pages)
+    
+    lines = []
+    for page in dict.fromkeys(block_pages.tolist()):
+        indices = np.nonzero(block_pages == page)[0]
+        sizes = np.minimum(rects[indices, 2] - rects[indices, 0], rects[indices, 3] - rects[indices, 1])
+        line_height = max(float(np.median(sizes)), 1.0)
+        regions = []
+        xy_cut(rects, indices, line_height, regions)
+        for region in regions:
+            for line in region_lines(rects, region, line_height):
+                box = rects[line]
+                lines.append({
+                    'line_id': len(lines),
+                    'page': page,
+                    'text': ' '.join(text_lines[i] for i in line),
+                    'bbox': [round(float(v), 1) for v in (box[:, 0].min(), box[:, 1].min(),
+                                                            box[:, 2].max(), box[:, 3].max())],
+                    'confidence': round(sum(confidences[i] for i in line) / len(line), 3),
+                    'block_ids': [int(i) for i in line],
+                    '_line_height': line_height
+                })
     
-    for coords in coordinates_list:
-        orientation = detect_text_orientation(coords)
-        orientations[orientation] += 1
+    paragraphs = None
+    if mode == 'paragraphs':
+        paragraphs = []
+        for line in lines:
+            previous = paragraphs[-1] if paragraphs else None
+            if previous is not None and previous['page'] == line['page']:
+                x0, y0, x1, y1 = previous['bbox']
+                last = lines[previous['line_ids'][-1]]['bbox']
+                gap = line['bbox'][1] - last[3]
+                overlaps = line['bbox'][0] < x1 and line['bbox'][2] > x0
+                if overlaps and -0.5 * line['_line_height'] <= gap <= LAYOUT_PARAGRAPH_GAP * line['_line_height']:
+                    previous['line_ids'].append(line['line_id'])
+                    previous['text'] += '\n' + line['text']
+                    previous['bbox'] = [min(x0, line['bbox'][0]), min(y0, line['bbox'][1]),
+                                        max(x1, line['bbox'][2]), max(y1, line['bbox'][3])]
+                    continue
+            paragraphs.append({
+                'paragraph_id': len(paragraphs),
+                'page': line['page'],
+                'text': line['text'],
+                'bbox': list(line['bbox']),
+                'line_ids': [line['line_id']]
+            })
     
-    return orientations
+    for line in lines:
+        del line['_line_height']
+    return lines, paragraphs
+
+def layout_text(lines, paragraphs):
+    """Texto en orden de lectura: una línea por renglón, párrafos separados por línea en blanco"""
+    if paragraphs is not None:
+        return '\n\n'.join(paragraph['text'] for paragraph in paragraphs)
+    return '\n'.join(line['text'] for line in lines)
 
 def process_ocr_result_cpu(ocr_result):
     """Procesar resultado OCR con método GANADOR optimizado para CPU"""
@@ -241,9 +3220,778 @@ def process_ocr_result_cpu(ocr_result):
     
     return text_lines, confidences, coordinates_list
 
+def build_blocks(text_lines, confidences, coordinates_list, block_pages, first_id=0, orientations=None):
+    """Bloques detallados: texto, confianza, coordenadas, orientación y página"""
+    if orientations is None:
+        orientations = BlockGeometry(coordinates_list).orientations
+    blocks_with_coords = []
+    for i, text in enumerate(text_lines):
+        block_info = {'text': text, 'block_id': first_id + i, 'page': block_pages[i]}
+        
+        if i < len(confidences):
+            block_info['confidence'] = round(confidences[i], 3)
+        
+        if i < len(coordinates_list):
+            coords = coordinates_list[i]
+            if hasattr(coords, 'tolist'):
+                coords = coords.tolist()
+            block_info['coordinates'] = coords
+            block_info['orientation'] = orientations[i]
+        
+        blocks_with_coords.append(block_info)
+    return blocks_with_coords
+
+def build_columnar_blocks(text_lines, confidences, block_pages, geometry, binary=False):
+    """Bloques en columnas: tabla de cadenas + arrays empaquetados.
+    
+    text son índices uint32 a strings, confidence float32, coordinates las
+    cajas (N, 4, 2) aplanadas en int16 (float32 si no caben), page uint16 y
+    orientation códigos uint8 a orientation_labels. Con binary los arrays van
+    como bytes little-endian (msgpack); si no, como listas (JSON).
+    """
+    string_ids = {}
+    text_index = np.fromiter((string_ids.setdefault(text, len(string_ids)) for text in text_lines),
+                             dtype=np.uint32, count=len(text_lines))
+    boxes = geometry.boxes
+    if not len(boxes) or float(np.abs(boxes).max()) < np.iinfo(np.int16).max:
+        coordinates = np.rint(boxes).astype(np.int16)
+    else:
+        coordinates = boxes.astype(np.float32)
+    
+    columns = {
+        'text': text_index,
+        'confidence': np.asarray(confidences, dtype=np.float32),
+        'coordinates': coordinates.reshape(-1),
+        'page': np.asarray(block_pages, dtype=np.uint16),
+        'orientation': geometry.orientation_codes.astype(np.uint8)
+    }
+    blocks = {
+        'format': 'columnar',
+        'count': len(text_lines),
+        'byte_order': 'little',
+        'dtypes': {name: array.dtype.name for name, array in columns.items()},
+        'strings': list(string_ids),
+        'orientation_labels': list(BlockGeometry.ORIENTATIONS)
+    }
+    for name, array in columns.items():
+        blocks[name] = array.astype(array.dtype.newbyteorder('<')).tobytes() if binary else array.tolist()
+    return blocks
+
+def select_fields(response, fields):
+    """Quedarse con los campos pedidos en fields= ('text', 'blocks', 'blocks.confidence'...)"""
+    top = {field.split('.', 1)[0] for field in fields} | {'success'}
+    selected = {key: value for key, value in response.items() if key in top}
+    block_fields = {field.split('.', 1)[1] for field in fields if field.startswith('blocks.')}
+    blocks = selected.get('blocks')
+    if not block_fields or blocks is None or 'blocks' in fields:
+        return selected
+    
+    if isinstance(blocks, dict):
+        # Columnar: conservar cabecera, columnas pedidas y sus tablas auxiliares
+        keep = {'format', 'count', 'byte_order'} | block_fields
+        if 'text' in block_fields:
+            keep.add('strings')
+        if 'orientation' in block_fields:
+            keep.add('orientation_labels')
+        selected['blocks'] = {key: value for key, value in blocks.items() if key in keep}
+        selected['blocks']['dtypes'] = {name: dtype for name, dtype in blocks['dtypes'].items()
+                                        if name in block_fields}
+    else:
+        selected['blocks'] = [{key: value for key, value in block.items() if key in block_fields}
+                              for block in blocks]
+    return selected
+
+def parse_fields(value):
+    """fields= de la petición: lista de campos o None (respuesta completa)"""
+    fields = [field.strip() for field in (value or '').split(',') if field.strip()]
+    if not fields:
+        return None
+    for field in fields:
+        if field.startswith('blocks.') and field.split('.', 1)[1] not in BLOCK_FIELDS:
+            raise RequestError(f"Invalid field: {field} (blocks fields: {', '.join(BLOCK_FIELDS)})")
+    return fields
+
+def parse_response_format(form, accept_mimetypes=None):
+    """Formato de respuesta: format= explícito o negociado con la cabecera Accept"""
+    value = (form.get('format') or '').strip().lower()
+    if not value and accept_mimetypes is not None:
+        best = accept_mimetypes.best_match(('application/json',) + MSGPACK_MIMETYPES)
+        value = 'msgpack' if best in MSGPACK_MIMETYPES else 'json'
+    value = value or 'json'
+    if value not in RESPONSE_FORMATS:
+        raise RequestError(f"Invalid format: {value} (use {', '.join(RESPONSE_FORMATS)})")
+    return value
+
+def parse_det_limit_side_len(value):
+    """det_limit_side_len de la petición: 'auto', 'tiled', un entero (múltiplo de 32) o None = política del servidor"""
+    value = (value or '').strip().lower()
+    if not value:
+        return DET_RESOLUTION if DET_RESOLUTION in ('auto', 'tiled') else None
+    if value in ('auto', 'tiled'):
+        return value
+    try:
+        side = int(value)
+    except ValueError:
+        raise RequestError(f"Invalid det_limit_side_len: {value}")
+    if not 320 <= side <= 2560:
+        raise RequestError("det_limit_side_len must be between 320 and 2560")
+    side = int(round(side / 32.0)) * 32
+    return None if side == cpu_config['det_limit_side_len'] else side
+
+def parse_layout(value):
+    """Modo de layout de la petición: 'lines', 'paragraphs' o None (orden del detector)"""
+    value = (value or '').strip().lower()
+    if value in ('', 'none'):
+        return None
+    if value not in LAYOUT_MODES:
+        raise RequestError(f"Invalid layout: {value} (use {' or '.join(LAYOUT_MODES)})")
+    return value
+
+def parse_rois(value):
+    """ROIs de la petición (JSON): [{x, y, width, height, page?, name?, mode?, units?}]"""
+    if not value:
+        return None
+    try:
+        rois = json.loads(value)
+    except ValueError:
+        raise RequestError("Invalid rois: expected a JSON list")
+    if not isinstance(rois, list) or not rois:
+        raise RequestError("Invalid rois: expected a non-empty JSON list")
+    if len(rois) > ROI_MAX_REGIONS:
+        raise RequestError(f"Too many rois (max {ROI_MAX_REGIONS})")
+    
+    parsed = []
+    for index, roi in enumerate(rois):
+        if not isinstance(roi, dict):
+            raise RequestError(f"Invalid roi {index}: expected an object")
+        try:
+            x, y, width, height = (float(roi[key]) for key in ('x', 'y', 'width', 'height'))
+            page = int(roi.get('page', 1))
+        except (KeyError, TypeError, ValueError):
+            raise RequestError(f"Invalid roi {index}: x, y, width and height are required numbers")
+        mode = str(roi.get('mode', 'detect')).lower()
+        units = str(roi.get('units', 'px')).lower()
+        if width <= 0 or height <= 0 or page < 1:
+            raise RequestError(f"Invalid roi {index}: width, height and page must be positive")
+        if mode not in ROI_MODES:
+            raise RequestError(f"Invalid roi {index}: mode must be {' or '.join(ROI_MODES)}")
+        if units not in ('px', 'relative'):
+            raise RequestError(f"Invalid roi {index}: units must be px or relative")
+        parsed.append({'name': str(roi.get('name', f'roi_{index + 1}')), 'x': x, 'y': y,
+                       'width': width, 'height': height, 'page': page, 'mode': mode, 'units': units})
+    return parsed
+
+def parse_ocr_options(form):
+    """Parámetros OCR comunes de /process y /jobs"""
+    language = form.get('language', default_lang)
+    return {
+        'language': language,
+        'lang': resolve_language(language),
+        'detailed': form.get('detailed', 'false').lower() == 'true',
+        'page_ranges': parse_page_range(form.get('pages')),
+        'use_text_layer': form.get('text_layer', 'true').lower() == 'true',
+        'det_limit_side_len': parse_det_limit_side_len(form.get('det_limit_side_len')),
+        'layout': parse_layout(form.get('layout')),
+        'rois': parse_rois(form.get('rois')),
+        'format': parse_response_format(form),
+        'fields': parse_fields(form.get('fields'))
+    }
+
+def parse_timeout_ms(form, headers):
+    """Plazo de la petición en ms (timeout_ms= o cabecera X-Timeout-Ms); None sin plazo"""
+    value = form.get('timeout_ms') or headers.get('X-Timeout-Ms')
+    if not value:
+        return REQUEST_TIMEOUT_MS or None
+    try:
+        timeout_ms = int(value)
+    except ValueError:
+        raise RequestError(f"Invalid timeout_ms: {value}")
+    if timeout_ms <= 0:
+        raise RequestError(f"Invalid timeout_ms: {value} (must be positive)")
+    return timeout_ms
+
+def check_admin_token(headers):
+    """Exigir la cabecera X-Admin-Token (perfilado y /debug solo existen con ADMIN_TOKEN)"""
+    if not ADMIN_TOKEN:
+        raise AdminTokenError('Profiling disabled (ADMIN_TOKEN not set)')
+    token = headers.get('X-Admin-Token', '')
+    if not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        raise AdminTokenError('Invalid admin token')
+
+def parse_profile(form, headers):
+    """Perfilado de la petición: None, 'trace' (profile=true) o 'sample' (además, muestreo de pilas)"""
+    value = (form.get('profile') or '').strip().lower()
+    if value in ('', 'false'):
+        return None
+    if value not in ('true', 'sample'):
+        raise RequestError(f"Invalid profile: {value} (expected true or sample)")
+    check_admin_token(headers)
+    return 'sample' if value == 'sample' else 'trace'
+
+def deadline_response(error, start_time):
+    """Respuesta 504 cuando el plazo de la petición se agota sin ninguna página leída"""
+    metric_deadline_expired.inc(stage='request')
+    return jsonify({
+        'success': False,
+        'error': str(error),
+        'processing_time': round(time.time() - start_time, 3),
+        'timestamp': time.time()
+    }), 504
+
+def build_process_response(data, filename, options, start_time):
+    """OCR de un archivo y respuesta completa de /process (también la usan los jobs)"""
+    logger.debug(f"🔍 OCR CPU procesando {filename}...")
+    roi_summaries = None
+    if options['rois']:
+        # Solo las regiones pedidas: sin caché, el coste ya es una fracción de la página
+        page_results, roi_summaries = run_roi_ocr(data, filename, options['lang'], options['rois'],
+                                                  options['use_text_layer'], options['det_limit_side_len'])
+        cached = truncated = False
+    else:
+        page_results, cached, truncated = run_cached_ocr(data, filename, options['lang'], options['detailed'],
+                                                         options['page_ranges'], options['use_text_layer'],
+                                                         options['det_limit_side_len'])
+    postprocess_start = time.perf_counter()
+    text_lines, confidences, coordinates_list, block_pages = flatten_page_results(page_results)
+    logger.debug(f"✅ OCR CPU completado")
+    
+    # Procesar resultado: geometría de todos los bloques en una sola pasada
+    geometry = BlockGeometry(coordinates_list, confidences)
+    orientations = geometry.orientation_counts()
+    
+    # Estadísticas
+    avg_confidence, min_confidence, max_confidence = geometry.confidence_stats()
+    avg_confidence = avg_confidence or 0.0
+    
+    # Orden de lectura (líneas, columnas y párrafos) sobre las cajas
+    text = '\n'.join(text_lines)
+    lines = paragraphs = page_texts = None
+    if options['layout']:
+        lines, paragraphs = build_layout(text_lines, confidences, block_pages, geometry, options['layout'])
+        text = layout_text(lines, paragraphs)
+        page_texts = {page: layout_text([line for line in lines if line['page'] == page],
+                                        None if paragraphs is None else
+                                        [paragraph for paragraph in paragraphs if paragraph['page'] == page])
+                      for page, _, _, _ in page_results}
+    processing_time = time.time() - start_time
+    
+    # Respuesta
+    response = {
+        'success': True,
+        'text': text,
+        'total_blocks': len(text_lines),
+        'filename': filename,
+        'language': options['language'],
+        'avg_confidence': round(avg_confidence, 3) if avg_confidence > 0 else None,
+        'processing_time': round(processing_time, 3),
+        'ocr_version': '2.8.1-CPU-GANADOR',
+        'has_coordinates': len(coordinates_list) > 0,
+        'text_orientations': orientations,
+        'cpu_optimized': True,
+        'configuration': 'GANADORA-CPU',
+        'cached': cached,
+        'cls_skipped': document_cls_skipped(page_results),
+        'truncated': truncated,
+        'timestamp': time.time()
+    }
+    
+    # PDF y TIFF multipágina: resumen por página
+    if Path(filename).suffix.lower() == '.pdf' or [page for page, _, _, _ in page_results] != [1]:
+        response['page_count'] = len(page_results)
+        response['text_layer_pages'] = sum(1 for _, _, source, _ in page_results if source == 'text_layer')
+        response['pages'] = page_summaries(page_results, page_texts)
+    
+    if roi_summaries is not None:
+        response['rois'] = roi_summaries
+    
+    if lines is not None:
+        response['layout'] = options['layout']
+        response['lines'] = lines
+        if paragraphs is not None:
+            response['paragraphs'] = paragraphs
+    
+    # Modo detallado
+    if options['detailed']:
+        fields = options['fields']
+        if fields is not None and not any(field.split('.', 1)[0] == 'blocks' for field in fields):
+            blocks = None
+        elif options['format'] in ('columnar', 'msgpack'):
+            blocks = build_columnar_blocks(text_lines, confidences, block_pages, geometry,
+                                           binary=options['format'] == 'msgpack')
+        else:
+            blocks = build_blocks(text_lines, confidences, coordinates_list, block_pages,
+                                  orientations=geometry.orientations)
+        response.update({
+            'blocks': blocks,
+            'min_confidence': round(min_confidence, 3) if confidences else None,
+            'max_confidence': round(max_confidence, 3) if confidences else None,
+            'total_coordinates': len(coordinates_list)
+        })
+    
+    record_stage('postprocess', time.perf_counter() - postprocess_start)
+    
+    return response
+
+def serialize_response(response, response_format):
+    """Serializar la respuesta de /process en el formato negociado"""
+    if response_format == 'msgpack':
+        import msgpack
+        
+        return Response(msgpack.packb(response, use_bin_type=True), mimetype='application/msgpack')
+    return jsonify(response)
+
+def ndjson_line(record):
+    """Serializar un registro NDJSON"""
+    return json.dumps(record) + '\n'
+
+def stream_document_response(data, filename, lang, detailed, page_ranges, use_text_layer, start_time,
+                             det_limit_side_len=None, layout=None):
+    """Respuesta NDJSON: un registro por página (y por lote de bloques) según terminan.
+    
+    Registros: start, page, blocks (solo en modo detallado, en lotes de
+    STREAM_BLOCK_CHUNK), summary al final o error si algo falla a mitad.
+    Los errores de admisión y de parámetros se lanzan antes de empezar. Usa
+    la misma clave de caché que run_cached_ocr: un documento completo (sin
+    cortar por plazo) se guarda al terminar el envío.
+    """
+    key = cached_pages = None
+    if result_cache is not None:
+        key = result_cache.make_key(data, lang, detailed, page_ranges, use_text_layer, det_limit_side_len)
+        cached_pages = result_cache.get(key)
+    
+    # El generador corre tras cerrar el contexto de Flask: usar la RequestMetrics capturada
+    context = current_request_metrics()
+    
+    # Plazo agotado a mitad: las páginas ya enviadas valen, el summary lo indica
+    deadline_state = {'truncated': False}
+    
+    def ocr_pages(document_pages):
+        page_results = []
+        try:
+            for page, result, source in document_pages:
+                with timed_stage('postprocess', context):
+                    processed = process_ocr_result_cpu([result])
+                cls_skipped = page_cls_skipped(result, source)
+                if context is not None and source == 'ocr':
+                    context.observe_blocks(len(processed[0]))
+                    context.observe_cls(cls_skipped)
+                page_results.append((page, processed, source, cls_skipped))
+                yield page, processed, source, cls_skipped
+        except DeadlineExceededError:
+            deadline_state['truncated'] = True
+            metric_deadline_expired.inc(stage='truncated')
+            return
+        if key is not None:
+            result_cache.put(key, page_results)
+    
+    if cached_pages is not None:
+        page_iter = iter(cached_pages)
+        reservation = PixelReservation(None, 0)
+    else:
+        # Píxeles y admisión de la primera página antes de empezar (503/504 en vez de error a mitad);
+        # la reserva se libera al cerrar la respuesta
+        reservation = reserve_pixels(data, filename, det_limit_side_len=det_limit_side_len)
+        try:
+            page_iter = ocr_pages(iter_document_pages(data, filename, lang, page_ranges, use_text_layer,
+                                                      det_limit_side_len))
+        except Exception:
+            reservation.release()
+            raise
+    
+    def record_line(record):
+        with timed_stage('serialization', context):
+            return ndjson_line(record)
+    
+    def generate():
+        total_blocks = 0
+        confidence_sum = 0.0
+        page_count = 0
+        line_count = paragraph_count = 0
+        orientations = {'horizontal': 0, 'vertical': 0, 'rotated': 0}
+        
+        yield record_line({
+            'type': 'start',
+            'filename': filename,
+            'language': lang,
+            'cached': cached_pages is not None,
+            'timestamp': time.time()
+        })
+        
+        try:
+            for page, (page_lines, page_confidences, page_coordinates), source, cls_skipped in page_iter:
+                page_count += 1
+                geometry = BlockGeometry(page_coordinates)
+                record = {
+                    'type': 'page',
+                    'page': page,
+                    'source': source,
+                    'cls_skipped': cls_skipped,
+                    'text': '\n'.join(page_lines),
+                    'total_blocks': len(page_lines),
+                    'avg_confidence': round(sum(page_confidences) / len(page_confidences), 3) if page_confidences else None,
+                    'elapsed': round(time.time() - start_time, 3)
+                }
+                if layout:
+                    with timed_stage('postprocess', context):
+                        lines, paragraphs = build_layout(page_lines, page_confidences, [page] * len(page_lines),
+                                                         geometry, layout)
+                    # Identificadores globales del documento, como en la respuesta completa
+                    for line in lines:
+                        line['line_id'] += line_count
+                        line['block_ids'] = [block_id + total_blocks for block_id in line['block_ids']]
+                    record['text'] = layout_text(lines, paragraphs)
+                    record['lines'] = lines
+                    if paragraphs is not None:
+                        for paragraph in paragraphs:
+                            paragraph['paragraph_id'] += paragraph_count
+                            paragraph['line_ids'] = [line_id + line_count for line_id in paragraph['line_ids']]
+                        record['paragraphs'] = paragraphs
+                        paragraph_count += len(paragraphs)
+                    line_count += len(lines)
+                yield record_line(record)
+                
+                if detailed:
+                    page_orientations = geometry.orientations
+                    for offset in range(0, len(page_lines), STREAM_BLOCK_CHUNK):
+                        chunk = slice(offset, offset + STREAM_BLOCK_CHUNK)
+                        yield record_line({
+                            'type': 'blocks',
+                            'page': page,
+                            'blocks': build_blocks(page_lines[chunk], page_confidences[chunk],
+                                                   page_coordinates[chunk], [page] * len(page_lines[chunk]),
+                                                   first_id=total_blocks + offset,
+                                                   orientations=page_orientations[chunk])
+                        })
+                
+                for orientation, count in geometry.orientation_counts().items():
+                    orientations[orientation] += count
+                total_blocks += len(page_lines)
+                confidence_sum += sum(page_confidences)
+            
+            processing_time = time.time() - start_time
+            update_server_stats(successful_requests=1, total_processing_time=processing_time)
+            logger.info(f"✅ CPU SUCCESS (stream): {filename} - {total_blocks} bloques en {processing_time:.2f}s")
+            
+            yield record_line({
+                'type': 'summary',
+                'success': True,
+                'page_count': page_count,
+                'total_blocks': total_blocks,
+                'avg_confidence': round(confidence_sum / total_blocks, 3) if total_blocks else None,
+                'text_orientations': orientations,
+                'truncated': deadline_state['truncated'],
+                'processing_time': round(processing_time, 3),
+                'ocr_version': '2.8.1-CPU-GANADOR',
+                'timestamp': time.time()
+            })
+            
+        except Exception as e:
+            processing_time = time.time() - start_time
+            update_server_stats(failed_requests=1, total_processing_time=processing_time)
+            logger.error(f"❌ CPU ERROR (stream): {e}")
+            yield record_line({'type': 'error', 'success': False, 'error': str(e),
+                               'processing_time': round(processing_time, 3)})
+    
+    response = Response(generate(), mimetype='application/x-ndjson')
+    response.call_on_close(reservation.release)
+    if context is not None:
+        # Las métricas se cierran cuando termina el envío, no al volver de la vista
+        context.deferred = True
+        response.call_on_close(context.finish)
+    return response
+
+class JobManager:
+    """Cola local de trabajos OCR asíncronos.
+    
+    Cola con prioridad acotada (JOB_QUEUE_SIZE), JOB_WORKERS trabajos en
+    paralelo y resultados retenidos JOB_RESULT_TTL segundos. La entrada de cada
+    trabajo espera en disco (JOB_SPOOL_DIR) y no en memoria. Un trabajo que no
+    consigue hueco en el pool en saturated_max_wait segundos falla. Al terminar
+    se notifica el callback_url opcional con un POST JSON.
+    """
+    
+    def __init__(self, workers, queue_size, result_ttl, spool_dir, saturated_max_wait=JOB_SATURATED_MAX_WAIT):
+        self.queue_size = queue_size
+        self.result_ttl = result_ttl
+        self.spool_dir = spool_dir
+        self.saturated_max_wait = saturated_max_wait
+        self.jobs = {}
+        self.pending = queue.PriorityQueue()
+        self.lock = threading.Lock()
+        self.sequence = itertools.count()
+        self.counters = {'submitted': 0, 'completed': 0, 'failed': 0, 'expired': 0,
+                         'callbacks_ok': 0, 'callbacks_failed': 0}
+        os.makedirs(spool_dir, exist_ok=True)
+        self.threads = []
+        for index in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"ocr-job-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+    
+    def submit(self, files, options, priority=5, callback_url=None):
+        """Encolar un lote [(nombre, ruta en spool_dir)] de extract_job_files; todo o nada si no cabe.
+        
+        Los archivos pasan a ser del gestor: si el lote no cabe se borran.
+        """
+        self._prune()
+        with self.lock:
+            queued = sum(1 for job in self.jobs.values() if job['status'] == 'queued')
+            if queued + len(files) > self.queue_size:
+                remove_spool_files(files)
+                raise PoolSaturatedError(max(1, math.ceil(queued / max(1, len(self.threads)))))
+            
+            batch_id = uuid.uuid4().hex
+            created = []
+            for filename, spool_path in files:
+                job_id = uuid.uuid4().hex
+                job = {
+                    'job_id': job_id,
+                    'batch_id': batch_id,
+                    'filename': filename,
+                    'status': 'queued',
+                    'priority': priority,
+                    'callback_url': callback_url,
+                    'callback_status': None,
+                    'created_at': time.time(),
+                    'started_at': None,
+                    'finished_at': None,
+                    'expires_at': None,
+                    'result': None,
+                    'error': None,
+                    '_options': options,
+                    '_spool_path': spool_path
+                }
+                self.jobs[job_id] = job
+                self.pending.put((priority, next(self.sequence), job_id))
+                self.counters['submitted'] += 1
+                created.append(self.public_view(job))
+        return batch_id, created
+    
+    def get(self, job_id):
+        """Estado público de un trabajo o None si no existe / expiró"""
+        self._prune()
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return self.public_view(job) if job else None
+    
+    @staticmethod
+    def public_view(job):
+        return {k: v for k, v in job.items() if not k.startswith('_')}
+    
+    def _prune(self):
+        """Eliminar resultados con TTL vencido"""
+        now = time.time()
+        with self.lock:
+            expired = [job_id for job_id, job in self.jobs.items()
+                       if job['expires_at'] is not None and job['expires_at'] <= now]
+            for job_id in expired:
+                del self.jobs[job_id]
+            self.counters['expired'] += len(expired)
+    
+    def _worker(self):
+        while True:
+            _, _, job_id = self.pending.get()
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if job is None:
+                    continue
+                job['status'] = 'running'
+                job['started_at'] = time.time()
+            
+            try:
+                with open(job['_spool_path'], 'rb') as f:
+                    data = f.read()
+                result = self._run(job, data)
+                status, error = 'done', None
+            except Exception as e:
+                logger.error(f"❌ Job {job_id} falló: {e}")
+                result, status, error = None, 'failed', str(e)
+            finally:
+                try:
+                    os.remove(job['_spool_path'])
+                except OSError:
+                    pass
+            
+            with self.lock:
+                job.update(status=status, result=result, error=error, finished_at=time.time(),
+                           expires_at=time.time() + self.result_ttl)
+                self.counters['completed' if status == 'done' else 'failed'] += 1
+            
+            if job['callback_url']:
+                self._callback(job)
+    
+    def _run(self, job, data):
+        """Ejecutar el OCR del trabajo esperando (como mucho saturated_max_wait) si el pool está saturado"""
+        context = RequestMetrics('job', job['_options']['lang'])
+        bind_request_metrics(context)
+        give_up = time.monotonic() + self.saturated_max_wait
+        try:
+            while True:
+                try:
+                    result = build_process_response(data, job['filename'], job['_options'], time.time())
+                    if job['_options']['fields'] is not None:
+                        result = select_fields(result, job['_options']['fields'])
+                    context.status = 200
+                    return result
+                except PoolSaturatedError as e:
+                    remaining = give_up - time.monotonic()
+                    if remaining <= 0:
+                        # El trabajo falla y libera este worker para los que esperan detrás
+                        context.status = 503
+                        raise DeadlineExceededError(
+                            f"OCR queue full for more than {self.saturated_max_wait:g}s") from e
+                    time.sleep(min(e.retry_after, 5, remaining))
+        finally:
+            bind_request_metrics(None)
+            context.finish()
+    
+    def _callback(self, job):
+        """POST JSON del resultado al callback_url (3 intentos)"""
+        payload = json.dumps(self.public_view(job)).encode('utf-8')
+        for attempt in range(3):
+            try:
+                callback_request = urllib.request.Request(job['callback_url'], data=payload, method='POST',
+                                                          headers={'Content-Type': 'application/json'})
+                with urllib.request.urlopen(callback_request, timeout=10) as response:
+                    job['callback_status'] = response.status
+                with self.lock:
+                    self.counters['callbacks_ok'] += 1
+                return
+            except Exception as e:
+                logger.warning(f"⚠️ Callback {job['job_id']} intento {attempt + 1} falló: {e}")
+                job['callback_status'] = f"error: {e}"
+                time.sleep(2 ** attempt)
+        with self.lock:
+            self.counters['callbacks_failed'] += 1
+    
+    def stats(self):
+        """Contadores de trabajos para /stats"""
+        with self.lock:
+            by_status = {}
+            for job in self.jobs.values():
+                by_status[job['status']] = by_status.get(job['status'], 0) + 1
+            return {
+                **self.counters,
+                'workers': len(self.threads),
+                'queue_size': self.queue_size,
+                'result_ttl': self.result_ttl,
+                'by_status': by_status
+            }
+
+def remove_spool_files(files):
+    """Borrar los archivos [(nombre, ruta)] de un lote que no llega a encolarse"""
+    for _, path in files:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def spool_stream(stream, spool_dir, max_bytes):
+    """Copiar un flujo por bloques de 1MB a un archivo nuevo de spool_dir.
+    
+    Devuelve (ruta, bytes) o None, sin dejar nada en disco, si pasa de
+    max_bytes: se cuentan los bytes leídos, no el tamaño declarado.
+    """
+    path = os.path.join(spool_dir, uuid.uuid4().hex)
+    size = 0
+    try:
+        with open(path, 'wb') as f:
+            while True:
+                chunk = stream.read(1024 * 1024)
+                if not chunk:
+                    return path, size
+                size += len(chunk)
+                if size > max_bytes:
+                    break
+                f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    os.remove(path)
+    return None
+
+def extract_job_files(uploads, spool_dir):
+    """Archivos de un POST /jobs (subidas directas o el contenido de un zip) volcados a spool_dir.
+    
+    Devuelve [(nombre, ruta)]. Las entradas de los zip se descomprimen por
+    bloques directamente a disco contando los bytes reales: cada archivo
+    hasta MAX_FILE_SIZE y el lote entero hasta JOB_MAX_BATCH_BYTES
+    (BatchTooLargeError → 413), así un zip bomb se corta en cuanto se pasa.
+    Si algo falla no queda nada en disco.
+    """
+    files = []
+    total = 0
+    
+    def add(name, stream, label):
+        nonlocal total
+        limit = min(MAX_FILE_SIZE, JOB_MAX_BATCH_BYTES - total)
+        spooled = spool_stream(stream, spool_dir, limit)
+        if spooled is None:
+            if limit < MAX_FILE_SIZE:
+                raise BatchTooLargeError(f"Batch too large (max {JOB_MAX_BATCH_BYTES} bytes uncompressed)")
+            raise RequestError(f"File too large{label}: {name}")
+        files.append((name, spooled[0]))
+        total += spooled[1]
+        if len(files) > JOB_MAX_BATCH_FILES:
+            raise RequestError(f"Too many files (max {JOB_MAX_BATCH_FILES})")
+    
+    try:
+        for upload in uploads:
+            if not upload or not upload.filename:
+                continue
+            filename = secure_filename(upload.filename)
+            
+            if filename.lower().endswith('.zip'):
+                try:
+                    archive = zipfile.ZipFile(upload.stream)
+                except zipfile.BadZipFile:
+                    raise RequestError(f"Invalid zip: {filename}")
+                with archive:
+                    for info in archive.infolist():
+                        name = secure_filename(os.path.basename(info.filename))
+                        if info.is_dir() or not name or not allowed_file(name):
+                            continue
+                        if info.file_size > MAX_FILE_SIZE:
+                            raise RequestError(f"File too large in zip: {name}")
+                        try:
+                            with archive.open(info) as entry:
+                                add(name, entry, ' in zip')
+                        except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+                            raise RequestError(f"Invalid zip: {filename} ({e})")
+            elif allowed_file(filename):
+                add(filename, upload.stream, '')
+            else:
+                raise RequestError(f"Unsupported format: {filename}")
+    except BaseException:
+        remove_spool_files(files)
+        raise
+    return files
+
+@app.before_request
+def start_request_metrics():
+    """Abrir la RequestMetrics de la petición (etiqueta = regla de la ruta)"""
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.request_metrics = RequestMetrics(endpoint)
+    bind_request_metrics(g.request_metrics)
+
+@app.after_request
+def record_response_status(response):
+    context = g.get('request_metrics')
+    if context is not None:
+        context.status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    context = g.get('request_metrics')
+    bind_request_metrics(None)
+    if context is not None and not context.deferred:
+        context.finish()
+
 @app.route('/')
 def index():
     """Dashboard CPU optimizado"""
+    server_stats = server_stats_snapshot()
     uptime = time.time() - server_stats['startup_time']
     avg_processing_time = (server_stats['total_processing_time'] / server_stats['total_requests'] 
                           if server_stats['total_requests'] > 0 else 0)
@@ -307,7 +4055,7 @@ def index():
                     <li>✅ <strong>95%+ confianza promedio</strong> - Calidad excepcional</li>
                     <li>✅ <strong>CPU optimizado</strong> - Sin dependencias CUDA</li>
                     <li>✅ <strong>Intel MKL-DNN</strong> - Aceleración CPU avanzada</li>
-                    <li>✅ <strong>4 threads</strong> - Paralelización optimizada</li>
+                    <li>✅ <strong>Pool de réplicas</strong> - Cola acotada con backpressure</li>
                     <li>✅ <strong>Inicio rápido</strong> - Sin cuelgues ni timeouts</li>
                 </ul>
             </div>
@@ -342,25 +4090,55 @@ curl -X POST http://localhost:8501/process \\<br>
 @app.route('/health')
 def health():
     """Health check CPU"""
+    server_stats = server_stats_snapshot()
     uptime = time.time() - server_stats['startup_time']
     
     return jsonify({
         'status': 'healthy' if ocr_initialized else 'initializing',
         'ocr_ready': ocr_initialized,
+        'startup_phase': startup_state['phase'],
         'models_loaded': server_stats['models_loaded'],
         'version': '3.0-cpu-optimized',
         'uptime_seconds': round(uptime, 2),
         'supported_languages': supported_languages,
+        'loaded_languages': sorted({lang for replica in ocr_pool.replicas for lang in replica.languages}) if ocr_pool else [],
         'configuration': 'GANADORA-CPU',
         'acceleration': 'Intel MKL-DNN',
         'gpu_usage': False,
-        'cpu_threads': 4,
+        'cpu_threads': CPU_THREADS,
+        'ocr_pool': ocr_pool.stats() if ocr_pool else None,
         'timestamp': time.time()
     })
 
+@app.route('/livez')
+def livez():
+    """Liveness: el proceso responde (aunque los modelos sigan cargando)"""
+    failed = startup_state['phase'] == 'failed'
+    return jsonify({
+        'status': 'failed' if failed else 'alive',
+        'startup_phase': startup_state['phase'],
+        'error': startup_state['error']
+    }), 503 if failed else 200
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: modelos cargados y calentados; ?language=xx para un idioma concreto"""
+    readiness = language_readiness()
+    language = request.args.get('language')
+    if language:
+        ready = readiness.get(language) in ('ready', 'loaded')
+    else:
+        ready = ocr_initialized
+    return jsonify({
+        'ready': ready,
+        'startup_phase': startup_state['phase'],
+        'languages': readiness
+    }), 200 if ready else 503
+
 @app.route('/stats')
 def stats():
     """Estadísticas CPU"""
+    server_stats = server_stats_snapshot()
     uptime = time.time() - server_stats['startup_time']
     
     return jsonify({
@@ -373,35 +4151,88 @@ def stats():
                            if server_stats['total_requests'] > 0 else 0)
         },
         'cpu_optimization': {
-            'mkldnn_enabled': True,
-            'cpu_threads': 4,
+            'mkldnn_enabled': inference_backend.name == 'paddle',
+            'backend': inference_backend.stats(),
+            'cpu_threads': CPU_THREADS,
             'gpu_disabled': True,
             'configuration': 'GANADORA-CPU'
         },
+        'startup': {
+            **startup_state,
+            'phases': dict(startup_state['phases']),
+            'total_seconds': (round(startup_state['finished_at'] - startup_state['started_at'], 3)
+                              if startup_state['finished_at'] else None),
+            'languages': language_readiness()
+        },
+        'ocr_pool': ocr_pool.stats() if ocr_pool else None,
+        'rec_batching': rec_batcher.stats() if rec_batcher else None,
+        'result_cache': result_cache.stats() if result_cache else None,
+        'profiling': {
+            'enabled': bool(ADMIN_TOKEN),
+            'slow_traces': slow_traces.stats()
+        },
+        'detection': {
+            'resolution': DET_RESOLUTION,
+            'tile_size': DET_TILE_SIZE,
+            'tile_overlap': DET_TILE_OVERLAP,
+            'tile_ingest_max_side': DET_TILE_INGEST_MAX_SIDE
+        },
+        'ingest': {
+            'image_max_pixels': IMAGE_MAX_PIXELS,
+            'ingest_max_side': IMAGE_INGEST_MAX_SIDE,
+            'pixel_budget': pixel_budget.stats() if pixel_budget else None
+        },
+        'jobs': job_manager.stats() if job_manager else None,
+        'rate_limit': rate_limiter.stats(),
         'system_info': {
             'ocr_version': '2.8.1-CPU-GANADOR',
             'supported_formats': list(ALLOWED_EXTENSIONS)
         }
     })
 
+@app.route('/debug/slow')
+def debug_slow():
+    """Trazas recientes más lentas (X-Admin-Token)"""
+    try:
+        check_admin_token(request.headers)
+        limit = int(request.args.get('limit', '0') or 0)
+    except AdminTokenError as e:
+        return jsonify({'error': str(e)}), 403
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    return jsonify({**slow_traces.stats(), 'traces': slow_traces.snapshot(limit)})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Métricas en formato de texto Prometheus"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/analyze', methods=['POST'])
 def analyze_file_ultra():
     """Análisis ultra completo - formato visual espectacular"""
     start_time = time.time()
     client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR', 'unknown'))
     
-    server_stats['total_requests'] += 1
+    update_server_stats(total_requests=1)
     
     try:
+        # Rate limiting (compartido con /process)
+        limited = rate_limit_check(client_ip)
+        if limited:
+            return limited
+        
         # Validaciones básicas (mismas que process)
         if not ocr_initialized:
             if not initialize_ocr_cpu():
-                return jsonify({'error': 'OCR not available'}), 503
+                return not_ready_response()
         
-        if 'file' not in request.files:
+        # El parseo multipart es la lectura de la subida
+        with timed_stage('upload'):
+            uploaded_files = request.files
+        if 'file' not in uploaded_files:
             return jsonify({'error': 'No file provided'}), 400
         
-        file = request.files['file']
+        file = uploaded_files['file']
         if not file or not file.filename:
             return jsonify({'error': 'Invalid file'}), 400
             
@@ -409,30 +4240,32 @@ def analyze_file_ultra():
             return jsonify({'error': 'Unsupported format'}), 400
         
         language = request.form.get('language', default_lang)
-        ocr = get_ocr_instance(language)
-        if ocr is None:
-            return jsonify({'error': 'OCR not available'}), 503
+        page_ranges = parse_page_range(request.form.get('pages'))
+        use_text_layer = request.form.get('text_layer', 'true').lower() == 'true'
+        det_limit_side_len = parse_det_limit_side_len(request.form.get('det_limit_side_len'))
+        lang = resolve_language(language)
+        g.request_metrics.language = lang
+        g.request_metrics.set_timeout(parse_timeout_ms(request.form, request.headers))
+        profile = parse_profile(request.form, request.headers)
+        if profile:
+            g.request_metrics.start_profile(sample=profile == 'sample')
         
         filename = secure_filename(file.filename)
+        with timed_stage('upload'):
+            data = file.read()
+        g.request_metrics.info.update(filename=filename, bytes=len(data))
         
-        # Procesar archivo
-        with tempfile.NamedTemporaryFile(delete=False, suffix=Path(filename).suffix) as tmp_file:
-            file.save(tmp_file.name)
-            
-            try:
-                result = ocr.ocr(tmp_file.name, cls=True)
-            finally:
-                try:
-                    os.remove(tmp_file.name)
-                except:
-                    pass
-        
-        # Procesar resultado
-        text_lines, confidences, coordinates_list = process_ocr_result_cpu(result)
-        orientations = analyze_orientations(coordinates_list)
+        # Procesar archivo (con caché por contenido, PDF repartido por páginas)
+        page_results, cached, truncated = run_cached_ocr(data, filename, lang, True, page_ranges, use_text_layer,
+                                                         det_limit_side_len)
+        postprocess_start = time.perf_counter()
+        text_lines, confidences, coordinates_list, block_pages = flatten_page_results(page_results)
+        geometry = BlockGeometry(coordinates_list, confidences)
+        orientations = geometry.orientation_counts()
+        block_orientations = geometry.orientations
         
         # Estadísticas
-        avg_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+        avg_confidence = geometry.confidence_stats()[0] or 0.0
         processing_time = time.time() - start_time
         
         # FORMATO ULTRA COMPLETO VISUAL
@@ -444,13 +4277,17 @@ def analyze_file_ultra():
         ultra_output.append("=" * 60)
         
         # Procesar cada bloque con emoji de orientación
+        multi_page = len(page_results) > 1
+        page_sources = {page: source for page, _, source, _ in page_results}
         for i, text in enumerate(text_lines):
             confidence = confidences[i] if i < len(confidences) else 0.0
             
+            if multi_page and (i == 0 or block_pages[i] != block_pages[i - 1]):
+                source = page_sources[block_pages[i]]
+                ultra_output.append(f"📄 Página {block_pages[i]}" + (" (capa de texto)" if source == 'text_layer' else ""))
+            
             # Detectar orientación
-            orientation = 'horizontal'
-            if i < len(coordinates_list):
-                orientation = detect_text_orientation(coordinates_list[i])
+            orientation = block_orientations[i] if i < len(block_orientations) else 'horizontal'
             
             # Emoji según orientación
             emoji = '↔️' if orientation == 'horizontal' else '↕️' if orientation == 'vertical' else '🔄'
@@ -459,27 +4296,56 @@ def analyze_file_ultra():
         
         ultra_output.append("=" * 60)
         ultra_output.append(f"📊 Orientaciones: {orientations.get('horizontal', 0)} horiz, {orientations.get('vertical', 0)} vert, {orientations.get('rotated', 0)} rotadas")
+        record_stage('postprocess', time.perf_counter() - postprocess_start)
         
         # Actualizar estadísticas
-        server_stats['successful_requests'] += 1
-        server_stats['total_processing_time'] += processing_time
+        update_server_stats(successful_requests=1, total_processing_time=processing_time)
         
-        return jsonify({
-            'success': True,
-            'ultra_analysis': '\n'.join(ultra_output),
-            'raw_data': {
-                'total_blocks': len(text_lines),
-                'avg_confidence': round(avg_confidence, 3),
-                'processing_time': round(processing_time, 3),
-                'orientations': orientations,
-                'filename': filename,
-                'language': language
-            }
-        })
+        extra = {'trace': g.request_metrics.trace_summary()} if profile else {}
+        with timed_stage('serialization'):
+            return jsonify({
+                **extra,
+                'success': True,
+                'ultra_analysis': '\n'.join(ultra_output),
+                'raw_data': {
+                    'total_blocks': len(text_lines),
+                    'avg_confidence': round(avg_confidence, 3),
+                    'processing_time': round(processing_time, 3),
+                    'orientations': orientations,
+                    'filename': filename,
+                    'language': language,
+                    'pages': [page for page, _, _, _ in page_results],
+                    'page_sources': page_sources,
+                    'cls_skipped': document_cls_skipped(page_results),
+                    'truncated': truncated,
+                    'cached': cached
+                }
+            })
+        
+    except PoolSaturatedError as e:
+        update_server_stats(failed_requests=1)
+        return saturated_response(e)
+        
+    except DeadlineExceededError as e:
+        update_server_stats(failed_requests=1)
+        logger.warning(f"⏱️ Plazo agotado sin resultado: {e}")
+        return deadline_response(e, start_time)
+        
+    except ImageTooLargeError as e:
+        update_server_stats(failed_requests=1)
+        return jsonify({'error': str(e)}), 413
+        
+    except AdminTokenError as e:
+        update_server_stats(failed_requests=1)
+        return jsonify({'error': str(e)}), 403
+        
+    except RequestError as e:
+        update_server_stats(failed_requests=1)
+        return jsonify({'error': str(e)}), 400
         
     except Exception as e:
         processing_time = time.time() - start_time
-        server_stats['failed_requests'] += 1
+        update_server_stats(failed_requests=1)
         
         return jsonify({
             'success': False,
@@ -493,23 +4359,27 @@ def process_file():
     start_time = time.time()
     client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR', 'unknown'))
     
-    server_stats['total_requests'] += 1
+    update_server_stats(total_requests=1)
     
     try:
         # Rate limiting
-        if not rate_limit_check(client_ip):
-            return jsonify({'error': 'Rate limit exceeded'}), 429
+        limited = rate_limit_check(client_ip)
+        if limited:
+            return limited
         
         # Verificar OCR
         if not ocr_initialized:
             if not initialize_ocr_cpu():
-                return jsonify({'error': 'OCR not available'}), 503
+                return not_ready_response()
         
         # Validaciones
-        if 'file' not in request.files:
+        # El parseo multipart es la lectura de la subida
+        with timed_stage('upload'):
+            uploaded_files = request.files
+        if 'file' not in uploaded_files:
             return jsonify({'error': 'No file provided'}), 400
         
-        file = request.files['file']
+        file = uploaded_files['file']
         if not file or not file.filename:
             return jsonify({'error': 'Invalid file'}), 400
             
@@ -520,94 +4390,74 @@ def process_file():
             return jsonify({'error': 'File too large'}), 413
         
         # Parámetros
-        language = request.form.get('language', default_lang)
-        detailed = request.form.get('detailed', 'false').lower() == 'true'
-        
-        # OCR
-        ocr = get_ocr_instance(language)
-        if ocr is None:
-            return jsonify({'error': 'OCR not available'}), 503
+        options = parse_ocr_options(request.form)
+        options['format'] = parse_response_format(request.form, request.accept_mimetypes)
+        stream = request.form.get('stream', 'false').lower() == 'true'
+        g.request_metrics.language = options['lang']
+        g.request_metrics.set_timeout(parse_timeout_ms(request.form, request.headers))
+        profile = parse_profile(request.form, request.headers)
         
         filename = secure_filename(file.filename)
-        logger.info(f"📄 Procesando CPU: {filename} (idioma: {language})")
+        logger.info(f"📄 Procesando CPU: {filename} (idioma: {options['language']})")
+        with timed_stage('upload'):
+            data = file.read()
+        g.request_metrics.info.update(filename=filename, bytes=len(data))
+        
+        # Modo streaming NDJSON: cada página se envía en cuanto termina
+        if stream and profile:
+            return jsonify({'error': 'profile cannot be combined with stream=true'}), 400
+        if profile:
+            g.request_metrics.start_profile(sample=profile == 'sample')
+        if stream and options['rois']:
+            return jsonify({'error': 'rois cannot be combined with stream=true'}), 400
+        if stream and options['format'] != 'json':
+            return jsonify({'error': 'format cannot be combined with stream=true'}), 400
+        if stream:
+            return stream_document_response(data, filename, options['lang'], options['detailed'],
+                                            options['page_ranges'], options['use_text_layer'], start_time,
+                                            options['det_limit_side_len'], options['layout'])
         
         # Procesar archivo
-        with tempfile.NamedTemporaryFile(delete=False, suffix=Path(filename).suffix) as tmp_file:
-            file.save(tmp_file.name)
-            
-            try:
-                logger.debug(f"🔍 OCR CPU procesando {filename}...")
-                result = ocr.ocr(tmp_file.name, cls=True)
-                logger.debug(f"✅ OCR CPU completado")
-                
-            finally:
-                try:
-                    os.remove(tmp_file.name)
-                except:
-                    pass
+        response = build_process_response(data, filename, options, start_time)
         
-        # Procesar resultado
-        text_lines, confidences, coordinates_list = process_ocr_result_cpu(result)
-        orientations = analyze_orientations(coordinates_list)
+        # Actualizar estadísticas
+        update_server_stats(successful_requests=1, total_processing_time=response['processing_time'])
         
-        # Estadísticas
-        avg_confidence = sum(confidences) / len(confidences) if confidences else 0.0
-        processing_time = time.time() - start_time
+        logger.info(f"✅ CPU SUCCESS: {filename} - {response['total_blocks']} bloques en {response['processing_time']:.2f}s")
         
-        # Respuesta
-        response = {
-            'success': True,
-            'text': '\n'.join(text_lines),
-            'total_blocks': len(text_lines),
-            'filename': filename,
-            'language': language,
-            'avg_confidence': round(avg_confidence, 3) if avg_confidence > 0 else None,
-            'processing_time': round(processing_time, 3),
-            'ocr_version': '2.8.1-CPU-GANADOR',
-            'has_coordinates': len(coordinates_list) > 0,
-            'text_orientations': orientations,
-            'cpu_optimized': True,
-            'configuration': 'GANADORA-CPU',
-            'timestamp': time.time()
-        }
+        with timed_stage('serialization'):
+            if options['fields'] is not None:
+                response = select_fields(response, options['fields'])
+            if profile:
+                # Hasta aquí: la serialización de la respuesta queda en la traza de /debug/slow
+                response['trace'] = g.request_metrics.trace_summary()
+            return serialize_response(response, options['format'])
         
-        # Modo detallado
-        if detailed:
-            blocks_with_coords = []
-            for i, text in enumerate(text_lines):
-                block_info = {'text': text, 'block_id': i}
-                
-                if i < len(confidences):
-                    block_info['confidence'] = round(confidences[i], 3)
-                
-                if i < len(coordinates_list):
-                    coords = coordinates_list[i]
-                    if hasattr(coords, 'tolist'):
-                        coords = coords.tolist()
-                    block_info['coordinates'] = coords
-                    block_info['orientation'] = detect_text_orientation(coords)
-                
-                blocks_with_coords.append(block_info)
-            
-            response.update({
-                'blocks': blocks_with_coords,
-                'min_confidence': round(min(confidences), 3) if confidences else None,
-                'max_confidence': round(max(confidences), 3) if confidences else None,
-                'total_coordinates': len(coordinates_list)
-            })
+    except PoolSaturatedError as e:
+        update_server_stats(failed_requests=1)
+        logger.warning(f"⏳ Servidor ocupado ({e}), rechazando petición (Retry-After {e.retry_after}s)")
+        return saturated_response(e)
         
-        # Actualizar estadísticas
-        server_stats['successful_requests'] += 1
-        server_stats['total_processing_time'] += processing_time
+    except DeadlineExceededError as e:
+        update_server_stats(failed_requests=1)
+        logger.warning(f"⏱️ Plazo agotado sin resultado: {e}")
+        return deadline_response(e, start_time)
         
-        logger.info(f"✅ CPU SUCCESS: {filename} - {len(text_lines)} bloques en {processing_time:.2f}s")
+    except ImageTooLargeError as e:
+        update_server_stats(failed_requests=1)
+        return jsonify({'error': str(e)}), 413
         
-        return jsonify(response)
+    except AdminTokenError as e:
+        update_server_stats(failed_requests=1)
+        return jsonify({'error': str(e)}), 403
+        
+    except RequestError as e:
+        update_server_stats(failed_requests=1)
+        return jsonify({'error': str(e)}), 400
         
     except Exception as e:
         processing_time = time.time() - start_time
-        server_stats['failed_requests'] += 1
-        server_stats['total_processing_time'] += processing_time
+        update_server_stats(failed_requests=1, total_processing_time=processing_time)
         
         error_msg = str(e)
         logger.error(f"❌ CPU ERROR: {error_msg}")
@@ -619,19 +4469,89 @@ def process_file():
             'timestamp': time.time()
         }), 500
 
+@app.route('/jobs', methods=['POST'])
+def submit_jobs():
+    """Encolar uno o varios archivos (o un zip) para OCR asíncrono"""
+    client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR', 'unknown'))
+    
+    try:
+        limited = rate_limit_check(client_ip)
+        if limited:
+            return limited
+        
+        if not ocr_initialized:
+            if not initialize_ocr_cpu():
+                return not_ready_response()
+        
+        uploads = request.files.getlist('file') + request.files.getlist('files')
+        if not uploads:
+            return jsonify({'error': 'No file provided'}), 400
+        
+        options = parse_ocr_options(request.form)
+        if options['format'] == 'msgpack':
+            return jsonify({'error': 'msgpack format is only available on /process'}), 400
+        
+        try:
+            priority = int(request.form.get('priority', '5'))
+        except ValueError:
+            return jsonify({'error': 'Invalid priority'}), 400
+        priority = min(9, max(0, priority))
+        
+        callback_url = request.form.get('callback_url') or None
+        if callback_url and not callback_url.lower().startswith(('http://', 'https://')):
+            return jsonify({'error': 'Invalid callback_url'}), 400
+        
+        files = extract_job_files(uploads, job_manager.spool_dir)
+        if not files:
+            return jsonify({'error': 'No supported files'}), 400
+        
+        batch_id, jobs = job_manager.submit(files, options, priority, callback_url)
+        logger.info(f"📥 Lote {batch_id[:8]}: {len(jobs)} trabajos encolados (prioridad {priority})")
+        
+        return jsonify({
+            'success': True,
+            'batch_id': batch_id,
+            'jobs': jobs
+        }), 202
+        
+    except PoolSaturatedError as e:
+        return saturated_response(e)
+        
+    except BatchTooLargeError as e:
+        return jsonify({'error': str(e)}), 413
+        
+    except RequestError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Estado y resultado de un trabajo asíncrono"""
+    job = job_manager.get(job_id) if job_manager else None
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
 if __name__ == '__main__':
     logger.info("💻 OCR Server CPU Optimizado v3.0 iniciando...")
     logger.info("🚀 Sin CUDA - Configuración GANADORA para CPU")
     logger.info("🔄 Pre-cargando modelos OCR CPU...")
     
-    # Pre-cargar modelos
-    if initialize_ocr_cpu():
-        logger.info("✅ Modelos OCR CPU pre-cargados exitosamente")
-        logger.info("🏆 CONFIGURACIÓN CPU GANADORA: 79+ bloques, 95%+ confianza")
-        logger.info("💻 Optimizado: Intel MKL-DNN, 4 threads, sin GPU")
+    def preload_models():
+        """Pre-cargar modelos; sin ellos el servidor no sirve (el contenedor se reinicia)"""
+        if initialize_ocr_cpu(wait=True):
+            logger.info("✅ Modelos OCR CPU pre-cargados exitosamente")
+            logger.info("🏆 CONFIGURACIÓN CPU GANADORA: 79+ bloques, 95%+ confianza")
+            runtime = 'Intel MKL-DNN' if inference_backend.name == 'paddle' else f"ONNX Runtime ({inference_backend.cache_key()})"
+            logger.info(f"💻 Optimizado: {runtime}, {OCR_WORKERS} réplicas x {THREADS_PER_WORKER} threads, sin GPU")
+        else:
+            logger.error("⚠️ Error pre-cargando modelos CPU")
+            os._exit(1)
+    
+    if OCR_BACKGROUND_STARTUP:
+        # /livez responde ya; /readyz y las peticiones OCR esperan a los modelos (503 + Retry-After)
+        threading.Thread(target=preload_models, name='ocr-startup', daemon=True).start()
     else:
-        logger.error("⚠️ Error pre-cargando modelos CPU")
-        exit(1)
+        preload_models()
     
     logger.info("🌐 Servidor CPU listo en puerto 8501")
     logger.info("📊 Dashboard CPU: http://localhost:8501")
@@ -640,7 +4560,7 @@ if __name__ == '__main__':
     try:
         from waitress import serve
         logger.info("🚀 Usando Waitress (servidor de producción)")
-        serve(app, host='0.0.0.0', port=8501, threads=4)
+        serve(app, host='0.0.0.0', port=8501, threads=HTTP_THREADS)
     except ImportError:
         logger.info("⚠️ Usando Flask dev server")
         app.run(host='0.0.0.0', port=8501, debug=False, threaded=True)
@@ -0,0 +1,25 @@
+"""
+Decodificación de documentos completos para los benchmarks
+El servidor decodifica página a página (iter_document_pages); aquí se
+necesita el documento entero ya en memoria para medir solo la inferencia.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as ocr_app
+
+def decode_document(data, suffix):
+    """Decodificar los bytes de un archivo a una lista de páginas ndarray (tras la ingesta)"""
+    if suffix.lower() == '.pdf':
+        import fitz
+        
+        with fitz.open(stream=data, filetype='pdf') as pdf:
+            return [ocr_app.render_pdf_page(page) for page in pdf]
+    return [ocr_app.ingest_image(data, index)[0] for index in range(ocr_app.image_page_count(data))]
+
+def ocr_document(ocr, data, suffix):
+    """OCR completo (det + cls + rec) de los bytes de un archivo, página a página"""
+    return [ocr_app.run_ocr_pipeline(ocr, page, cls=True) for page in decode_document(data, suffix)]
@@ -0,0 +1,21 @@
+"""
+Estadísticas compartidas por los benchmarks (percentiles y resumen de tiempos)
+"""
+
+def percentile(values, pct):
+    """Percentil simple sobre una lista de tiempos"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(times, digits=2, percentiles=(50, 95)):
+    """Resumen de una serie de tiempos (segundos) en milisegundos redondeados a digits decimales"""
+    summary = {
+        'runs': len(times),
+        'mean_ms': round(sum(times) / len(times) * 1000, digits) if times else 0.0
+    }
+    for pct in percentiles:
+        summary[f"p{pct}_ms"] = round(percentile(times, pct) * 1000, digits)
+    return summary
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Benchmark de backends de inferencia: Paddle (MKL-DNN, GANADORA) vs ONNX Runtime FP32 vs INT8
+Cada backend se mide en su propio proceso (la memoria no se mezcla): RSS tras
+cargar los modelos, RSS máximo, latencia por página con run_ocr_pipeline y
+paridad de bloques, confianza y texto frente al camino Paddle.
+
+Requiere los modelos de convert_onnx.py (y --int8 para la variante cuantizada).
+
+Uso:
+    python benchmarks/bench_backend.py --repeat 3
+    python benchmarks/bench_backend.py ./data/input --backends paddle,onnx,onnx-int8 --json backend.json
+"""
+
+import sys
+import json
+import time
+import difflib
+import argparse
+import resource
+import multiprocessing
+from pathlib import Path
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as ocr_app
+from _decode import decode_document
+from _stats import summarize
+
+def load_pages(corpus):
+    """Páginas decodificadas: [(nombre, imagen BGR)] de un directorio o del corpus sintético de bench_load"""
+    if corpus:
+        documents = [(path.name, path.suffix, path.read_bytes()) for path in sorted(Path(corpus).iterdir())
+                     if path.is_file() and ocr_app.allowed_file(path.name)]
+    else:
+        from bench_load import build_corpus
+        documents = [(doc['name'], Path(doc['name']).suffix, doc['data']) for doc in build_corpus()]
+    pages = []
+    for name, suffix, data in documents:
+        images = decode_document(data, suffix)
+        for index, img in enumerate(images):
+            if img is not None:
+                pages.append((name if len(images) == 1 else f"{name}#{index + 1}", img))
+    return pages
+
+def measure_backend(config, corpus, language, repeat, model_dir):
+    """En un proceso aparte: cargar el backend y pasar el corpus (devuelve métricas y texto por página)"""
+    ocr_app.setup_cpu_environment()
+    name, _, variant = config.partition('-')
+    backend = ocr_app.create_inference_backend(name, model_dir, variant == 'int8')
+    pages = load_pages(corpus)
+
+    rss_before = ocr_app.read_rss_bytes()
+    start = time.perf_counter()
+    models = ocr_app.ReplicaModels(f" ({config})", backend=backend)
+    ocr = models.get(language)
+    load_seconds = time.perf_counter() - start
+    model_rss = ocr_app.read_rss_bytes() - rss_before
+
+    times, per_page = [], {}
+    for page_name, img in pages:
+        # Calentamiento por forma de entrada
+        ocr_app.run_ocr_pipeline(ocr, img, cls=True)
+        page_times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = ocr_app.run_ocr_pipeline(ocr, img, cls=True)
+            page_times.append(time.perf_counter() - start)
+        times.extend(page_times)
+        lines = [line[1][0] for line in result or []]
+        confidences = [line[1][1] for line in result or []]
+        per_page[page_name] = {'lines': lines, 'blocks': len(lines),
+                               'avg_confidence': round(sum(confidences) / len(confidences), 4) if confidences else None,
+                               'latency': summarize(page_times)}
+
+    return {
+        'backend': backend.stats(),
+        'load_seconds': round(load_seconds, 2),
+        'model_rss_mb': round(model_rss / 1024 / 1024, 1),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'latency': summarize(times),
+        'pages': per_page
+    }
+
+def parity(reference, candidate):
+    """Paridad de una página frente al camino Paddle: bloques, confianza y texto"""
+    shared = sum((Counter(reference['lines']) & Counter(candidate['lines'])).values())
+    return {
+        'blocks_delta': candidate['blocks'] - reference['blocks'],
+        'confidence_delta': round((candidate['avg_confidence'] or 0) - (reference['avg_confidence'] or 0), 4),
+        'line_recall': round(shared / len(reference['lines']), 4) if reference['lines'] else 1.0,
+        'text_similarity': round(difflib.SequenceMatcher(None, '\n'.join(sorted(reference['lines'])),
+                                                         '\n'.join(sorted(candidate['lines']))).ratio(), 4)
+    }
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Benchmark de backends de inferencia (Paddle vs ONNX Runtime)')
+    parser.add_argument('corpus', nargs='?', help='Directorio con facturas (por defecto, corpus sintético de bench_load)')
+    parser.add_argument('--backends', default='paddle,onnx,onnx-int8', help='paddle, onnx y/o onnx-int8')
+    parser.add_argument('--repeat', type=int, default=3, help='Repeticiones por página')
+    parser.add_argument('--language', default=ocr_app.default_lang)
+    parser.add_argument('--model-dir', default=ocr_app.ONNX_MODEL_DIR, help='Salida de convert_onnx.py')
+    parser.add_argument('--json', help='Guardar resultados en este archivo JSON')
+    args = parser.parse_args()
+
+    configs = [config.strip() for config in args.backends.split(',') if config.strip()]
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for config in configs:
+        print(f"🔍 {config}: cargando modelos y pasando el corpus...")
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                results[config] = executor.submit(measure_backend, config, args.corpus, args.language,
+                                                  args.repeat, args.model_dir).result()
+        except Exception as e:
+            print(f"❌ {config}: {e}")
+            continue
+        stats = results[config]
+        print(f"📊 {config:10s} carga {stats['load_seconds']}s  modelos {stats['model_rss_mb']}MB  "
+              f"RSS máx {stats['peak_rss_mb']}MB  media {stats['latency']['mean_ms']}ms  "
+              f"p50 {stats['latency']['p50_ms']}ms  p95 {stats['latency']['p95_ms']}ms")
+
+    if 'paddle' in results:
+        print("=" * 60)
+        reference = results['paddle']
+        for config, stats in results.items():
+            if config == 'paddle':
+                continue
+            pages = {page: parity(reference['pages'][page], candidate)
+                     for page, candidate in stats['pages'].items() if page in reference['pages']}
+            stats['parity'] = {
+                'pages': pages,
+                'blocks_delta': sum(page['blocks_delta'] for page in pages.values()),
+                'min_line_recall': min((page['line_recall'] for page in pages.values()), default=1.0),
+                'mean_text_similarity': round(sum(page['text_similarity'] for page in pages.values()) / len(pages), 4)
+                if pages else 1.0
+            }
+            speedup = reference['latency']['mean_ms'] / stats['latency']['mean_ms'] if stats['latency']['mean_ms'] else 0.0
+            print(f"⚖️ {config:10s} x{speedup:.2f} vs paddle, modelos {stats['model_rss_mb'] - reference['model_rss_mb']:+.1f}MB, "
+                  f"bloques {stats['parity']['blocks_delta']:+d}, recall mínimo {stats['parity']['min_line_recall']}, "
+                  f"similitud media {stats['parity']['mean_text_similarity']}")
+
+    if args.json:
+        for stats in results.values():
+            for page in stats['pages'].values():
+                page.pop('lines')
+        with open(args.json, 'w') as f:
+            json.dump({'language': args.language, 'repeat': args.repeat, 'results': results}, f, indent=2)
+        print(f"💾 Resultados guardados en {args.json}")
+
+if __name__ == "__main__":
+    main()
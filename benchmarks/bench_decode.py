@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark de decodificación: tempfile + ruta (camino anterior) vs memoria
+Compara, sobre un corpus de facturas, el coste de escribir la subida a disco
+y dejar que PaddleOCR la relea frente a decodificarla directamente en memoria.
+
+Uso:
+    python benchmarks/bench_decode.py ./data/input --repeat 5
+    python benchmarks/bench_decode.py ./data/input --ocr --json decode.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as ocr_app
+from _decode import decode_document, ocr_document
+from _stats import summarize
+
+def tempfile_path(data, suffix, ocr=None):
+    """Camino anterior: NamedTemporaryFile + lectura por ruta en PaddleOCR"""
+    from paddleocr.paddleocr import check_img
+    
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+        tmp_file.write(data)
+    try:
+        if ocr is not None:
+            return ocr.ocr(tmp_file.name, cls=True)
+        img, _, flag_pdf = check_img(tmp_file.name)
+        return img if flag_pdf else [img]
+    finally:
+        os.remove(tmp_file.name)
+
+def memory_path(data, suffix, ocr=None):
+    """Camino nuevo: decodificación en memoria"""
+    if ocr is not None:
+        return ocr_document(ocr, data, suffix)
+    return decode_document(data, suffix)
+
+def count_blocks(result):
+    """Número de bloques en un resultado OCR por páginas"""
+    return sum(len(page) for page in result if page)
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Benchmark tempfile vs decodificación en memoria')
+    parser.add_argument('corpus', help='Directorio con facturas (pdf/png/jpg/tiff)')
+    parser.add_argument('--repeat', type=int, default=5, help='Repeticiones por archivo')
+    parser.add_argument('--ocr', action='store_true', help='Medir OCR completo, no solo decodificación')
+    parser.add_argument('--language', default=ocr_app.default_lang)
+    parser.add_argument('--json', help='Guardar resultados en este archivo JSON')
+    args = parser.parse_args()
+    
+    files = sorted(p for p in Path(args.corpus).iterdir()
+                   if p.is_file() and ocr_app.allowed_file(p.name))
+    if not files:
+        print(f"❌ No hay archivos soportados en {args.corpus}")
+        sys.exit(1)
+    
+    ocr = None
+    if args.ocr:
+        ocr_app.setup_cpu_environment()
+        import paddleocr
+        ocr = paddleocr.PaddleOCR(lang=args.language, **ocr_app.cpu_config)
+    
+    print(f"🔍 {len(files)} archivos, {args.repeat} repeticiones, modo {'OCR completo' if args.ocr else 'solo decodificación'}")
+    
+    results = {'tempfile': [], 'memory': []}
+    per_file = []
+    for path in files:
+        data = path.read_bytes()
+        suffix = path.suffix
+        
+        # Calentamiento (cachés de disco, kernels MKL-DNN)
+        legacy_out = tempfile_path(data, suffix, ocr)
+        memory_out = memory_path(data, suffix, ocr)
+        
+        file_times = {'tempfile': [], 'memory': []}
+        for _ in range(args.repeat):
+            for name, fn in (('tempfile', tempfile_path), ('memory', memory_path)):
+                start = time.perf_counter()
+                fn(data, suffix, ocr)
+                file_times[name].append(time.perf_counter() - start)
+        
+        entry = {
+            'file': path.name,
+            'bytes': len(data),
+            'tempfile': summarize(file_times['tempfile']),
+            'memory': summarize(file_times['memory'])
+        }
+        if args.ocr:
+            entry['blocks'] = {'tempfile': count_blocks(legacy_out), 'memory': count_blocks(memory_out)}
+        per_file.append(entry)
+        for name in results:
+            results[name].extend(file_times[name])
+        
+        print(f"📄 {path.name}: tempfile {entry['tempfile']['mean_ms']}ms | memoria {entry['memory']['mean_ms']}ms")
+    
+    summary = {name: summarize(times) for name, times in results.items()}
+    speedup = (summary['tempfile']['mean_ms'] / summary['memory']['mean_ms']
+               if summary['memory']['mean_ms'] else 0.0)
+    
+    print("=" * 60)
+    for name, stats in summary.items():
+        print(f"📊 {name:9s} media {stats['mean_ms']}ms  p50 {stats['p50_ms']}ms  p95 {stats['p95_ms']}ms")
+    print(f"⚡ Aceleración en memoria: x{speedup:.2f}")
+    
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'mode': 'ocr' if args.ocr else 'decode', 'summary': summary,
+                       'speedup': round(speedup, 3), 'files': per_file}, f, indent=2)
+        print(f"💾 Resultados guardados en {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark de resolución de detección: GANADORA (det_limit_side_len fijo) vs buckets vs auto
+Para cada página del corpus mide latencia OCR, bloques y confianza media con
+cada bucket de DET_RESOLUTION_BUCKETS y con la política auto, que elige el
+bucket según el tamaño de la imagen y la altura estimada del texto.
+
+Uso:
+    python benchmarks/bench_det_resolution.py ./data/input --repeat 3
+    python benchmarks/bench_det_resolution.py ./data/input --buckets 640,960,1280 --json det.json
+"""
+
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as ocr_app
+from _decode import decode_document
+from _stats import summarize
+
+def summarize_config(times, blocks, confidences):
+    """Resumen de latencia (ms), bloques y confianza de una configuración"""
+    return {
+        **summarize(times),
+        'blocks': sum(blocks),
+        'avg_confidence': round(sum(confidences) / len(confidences), 4) if confidences else 0.0
+    }
+
+def load_pages(files):
+    """Páginas decodificadas del corpus: [(nombre, imagen BGR)]"""
+    pages = []
+    for path in files:
+        images = decode_document(path.read_bytes(), path.suffix)
+        for index, img in enumerate(images):
+            if img is not None:
+                name = path.name if len(images) == 1 else f"{path.name}#{index + 1}"
+                pages.append((name, img))
+    return pages
+
+def page_scores(result):
+    """(bloques, confianzas) de una página de run_ocr_pipeline"""
+    page = result or []
+    return len(page), [line[1][1] for line in page]
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Benchmark de det_limit_side_len por bucket')
+    parser.add_argument('corpus', help='Directorio con facturas (pdf/png/jpg/tiff)')
+    parser.add_argument('--repeat', type=int, default=3, help='Repeticiones por página')
+    parser.add_argument('--buckets', default=','.join(str(b) for b in ocr_app.DET_RESOLUTION_BUCKETS))
+    parser.add_argument('--language', default=ocr_app.default_lang)
+    parser.add_argument('--json', help='Guardar resultados en este archivo JSON')
+    args = parser.parse_args()
+
+    files = sorted(p for p in Path(args.corpus).iterdir()
+                   if p.is_file() and ocr_app.allowed_file(p.name))
+    pages = load_pages(files)
+    if not pages:
+        print(f"❌ No hay páginas decodificables en {args.corpus}")
+        sys.exit(1)
+
+    ocr_app.setup_cpu_environment()
+    import paddleocr
+    ocr = paddleocr.PaddleOCR(lang=args.language, **ocr_app.cpu_config)
+
+    baseline = ocr_app.cpu_config['det_limit_side_len']
+    configs = [('ganadora', None)]
+    configs += [(str(bucket), bucket) for bucket in sorted(int(b) for b in args.buckets.split(','))
+                if bucket != baseline]
+    configs.append(('auto', 'auto'))
+
+    print(f"🔍 {len(pages)} páginas, {args.repeat} repeticiones, GANADORA={baseline}, buckets {args.buckets}")
+
+    results = {name: {'times': [], 'blocks': [], 'confidences': []} for name, _ in configs}
+    per_page = []
+    for name, img in pages:
+        # Calentamiento (kernels MKL-DNN por forma de entrada)
+        ocr_app.run_ocr_pipeline(ocr, img, cls=True)
+
+        auto_bucket = ocr_app.choose_det_limit_side_len(img)
+        entry = {'page': name, 'shape': list(img.shape[:2]), 'auto_bucket': auto_bucket}
+        for config, side in configs:
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                result = ocr_app.run_ocr_pipeline(ocr, img, cls=True, det_limit_side_len=side)
+                times.append(time.perf_counter() - start)
+            blocks, confidences = page_scores(result)
+            results[config]['times'].extend(times)
+            results[config]['blocks'].append(blocks)
+            results[config]['confidences'].extend(confidences)
+            entry[config] = summarize_config(times, [blocks], confidences)
+        per_page.append(entry)
+
+        print(f"📄 {name} {img.shape[1]}x{img.shape[0]} (auto → {auto_bucket}): " +
+              " | ".join(f"{config} {entry[config]['mean_ms']}ms/{entry[config]['blocks']}b" for config, _ in configs))
+
+    summary = {config: summarize_config(**data) for config, data in results.items()}
+    print("=" * 60)
+    for config, stats in summary.items():
+        print(f"📊 {config:9s} media {stats['mean_ms']}ms  p50 {stats['p50_ms']}ms  p95 {stats['p95_ms']}ms  "
+              f"bloques {stats['blocks']}  confianza {stats['avg_confidence']}")
+    if summary['auto']['mean_ms']:
+        print(f"⚡ auto vs GANADORA: x{summary['ganadora']['mean_ms'] / summary['auto']['mean_ms']:.2f}, "
+              f"bloques {summary['auto']['blocks'] - summary['ganadora']['blocks']:+d}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'baseline': baseline, 'summary': summary, 'pages': per_page}, f, indent=2)
+        print(f"💾 Resultados guardados en {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark de geometría de bloques: bucle Python por bloque (camino anterior) vs BlockGeometry
+Genera cajas sintéticas (horizontales, verticales y giradas) y mide lo que
+cuesta a los constructores de respuesta obtener conteo de orientaciones,
+orientación por bloque y estadísticas de confianza.
+
+Uso:
+    python benchmarks/bench_geometry.py
+    python benchmarks/bench_geometry.py --sizes 1000,10000,50000 --repeat 20 --json geometry.json
+"""
+
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as ocr_app
+from _stats import summarize
+
+def synthetic_boxes(count, seed=0):
+    """Cajas como las devuelve PaddleOCR (listas de 4 puntos) y sus confianzas"""
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(0, 2000, (count, 2))
+    sizes = rng.uniform([40, 10], [600, 40], (count, 2))
+    # 80% horizontales, 10% verticales, 10% giradas
+    angles = rng.choice([0.0, np.pi / 2, np.pi / 4], count, p=[0.8, 0.1, 0.1])
+    corners = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]], dtype=np.float64) / 2
+    boxes = []
+    for center, size, angle in zip(centers, sizes, angles):
+        rotation = np.array([[np.cos(angle), np.sin(angle)], [-np.sin(angle), np.cos(angle)]])
+        boxes.append(np.round(corners * size @ rotation + center, 1).tolist())
+    confidences = rng.uniform(0.5, 1.0, count).tolist()
+    return boxes, confidences
+
+def legacy_orientation(coordinates):
+    """Camino anterior: orientación de un bloque con listas y np.arctan2 escalar"""
+    if not coordinates or len(coordinates) < 4:
+        return 'horizontal'
+    x_coords = [point[0] for point in coordinates]
+    y_coords = [point[1] for point in coordinates]
+    width = max(x_coords) - min(x_coords)
+    height = max(y_coords) - min(y_coords)
+    if width == 0:
+        return 'vertical'
+    aspect_ratio = height / width
+    p1, p2 = coordinates[0], coordinates[1]
+    angle = abs(np.arctan2(p2[1] - p1[1], p2[0] - p1[0]) * 180 / np.pi)
+    if aspect_ratio > 3.0:
+        return 'vertical'
+    elif angle > 30 and angle < 150:
+        return 'rotated'
+    elif aspect_ratio > 2.0:
+        return 'vertical'
+    return 'horizontal'
+
+def legacy_path(boxes, confidences):
+    """Conteo + orientación por bloque (dos veces, como antes) + estadísticas de confianza"""
+    counts = {'horizontal': 0, 'vertical': 0, 'rotated': 0}
+    for coords in boxes:
+        counts[legacy_orientation(coords)] += 1
+    orientations = [legacy_orientation(coords) for coords in boxes]
+    stats = (sum(confidences) / len(confidences), min(confidences), max(confidences))
+    return counts, orientations, stats
+
+def vectorized_path(boxes, confidences):
+    """Camino nuevo: una sola pasada con BlockGeometry"""
+    geometry = ocr_app.BlockGeometry(boxes, confidences)
+    return geometry.orientation_counts(), geometry.orientations, geometry.confidence_stats()
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Benchmark de geometría de bloques por bucle vs NumPy')
+    parser.add_argument('--sizes', default='1000,10000', help='Números de cajas separados por comas')
+    parser.add_argument('--repeat', type=int, default=10, help='Repeticiones por tamaño')
+    parser.add_argument('--json', help='Guardar resultados en este archivo JSON')
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(',')):
+        boxes, confidences = synthetic_boxes(size)
+
+        legacy_out = legacy_path(boxes, confidences)
+        vectorized_out = vectorized_path(boxes, confidences)
+        if legacy_out[:2] != vectorized_out[:2]:
+            print(f"❌ {size} cajas: las orientaciones no coinciden con el camino anterior")
+            sys.exit(1)
+
+        times = {'loop': [], 'numpy': []}
+        for _ in range(args.repeat):
+            for name, fn in (('loop', legacy_path), ('numpy', vectorized_path)):
+                start = time.perf_counter()
+                fn(boxes, confidences)
+                times[name].append(time.perf_counter() - start)
+
+        entry = {'boxes': size, 'orientations': vectorized_out[0],
+                 'loop': summarize(times['loop'], digits=3), 'numpy': summarize(times['numpy'], digits=3)}
+        entry['speedup'] = round(entry['loop']['mean_ms'] / entry['numpy']['mean_ms'], 2) if entry['numpy']['mean_ms'] else 0.0
+        results.append(entry)
+        print(f"📦 {size:6d} cajas: bucle {entry['loop']['mean_ms']}ms | NumPy {entry['numpy']['mean_ms']}ms | x{entry['speedup']}")
+
+    print("=" * 60)
+    print("✅ Orientaciones idénticas al camino anterior en todos los tamaños")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'results': results}, f, indent=2)
+        print(f"💾 Resultados guardados en {args.json}")
+
+if __name__ == "__main__":
+    main()
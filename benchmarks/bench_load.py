@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carga y latencia del servidor OCR sobre un corpus sintético reproducible
+Genera facturas, tickets, texto girado y vertical y PDFs (de una y varias
+páginas, escaneados y con capa de texto), los envía a /process y /analyze
+con varios niveles de concurrencia y mide throughput, latencia p50/p95/p99,
+RSS máximo y bloques/confianza por documento. Con --baseline compara contra
+un JSON anterior (p. ej. antes de tocar cpu_config).
+
+Dos modos:
+    - cliente de pruebas de Flask en el mismo proceso (por defecto)
+    - HTTP real contra un servidor arrancado (--url)
+
+Uso:
+    python benchmarks/bench_load.py --concurrency 1,4 --requests 40 --json load.json
+    python benchmarks/bench_load.py --url http://localhost:8501 --concurrency 1,4,8 --baseline load.json
+    python benchmarks/bench_load.py --save-corpus ./data/synthetic
+"""
+
+import io
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import cv2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as ocr_app
+from _stats import summarize
+
+# ---------------------------------------------------------------------------
+# Corpus sintético
+# ---------------------------------------------------------------------------
+
+def render_lines(lines, width, line_height=48, scale=1.0, margin=40):
+    """Página blanca con una línea de texto negro por entrada (x, texto)"""
+    img = np.full((margin * 2 + line_height * len(lines), width, 3), 255, np.uint8)
+    for row, (x, text) in enumerate(lines):
+        y = margin + line_height * row + int(line_height * 0.7)
+        cv2.putText(img, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 0), 2, cv2.LINE_AA)
+    return img
+
+def invoice_image(rng, number):
+    """Factura A4 a ~150 dpi: cabecera, cliente, tabla de conceptos y totales"""
+    lines = [(60, f"FACTURA N {number:05d}"), (60, f"Fecha: {rng.integers(1, 29):02d}/0{rng.integers(1, 10)}/2024"),
+             (60, "WebComunica Soluciones S.L."), (60, f"NIF B{rng.integers(10000000, 99999999)}"), (60, "")]
+    lines.append((60, "Concepto                 Cant    Precio    Importe"))
+    total = 0.0
+    for item in range(int(rng.integers(6, 14))):
+        quantity, price = int(rng.integers(1, 20)), float(rng.integers(100, 9999)) / 100
+        total += quantity * price
+        lines.append((60, f"Articulo {item + 1:02d} ref {rng.integers(1000, 9999)}"))
+        lines.append((820, f"{quantity:3d}  {price:8.2f}  {quantity * price:9.2f}"))
+    lines += [(60, ""), (820, f"Base imponible {total:10.2f}"), (820, f"IVA 21%        {total * 0.21:10.2f}"),
+              (820, f"TOTAL          {total * 1.21:10.2f} EUR")]
+    return render_lines(lines, 1240)
+
+def ticket_image(rng, number):
+    """Ticket de caja estrecho y alto, letra grande"""
+    lines = [(30, "SUPERMERCADO"), (30, f"Ticket {number:06d}")]
+    for _ in range(int(rng.integers(10, 25))):
+        lines.append((30, f"PROD {rng.integers(100, 999)}  {rng.integers(50, 2000) / 100:6.2f}"))
+    lines += [(30, "TOTAL A PAGAR"), (30, "GRACIAS POR SU VISITA")]
+    return render_lines(lines, 480, line_height=56, scale=1.1, margin=30)
+
+def vertical_image(rng):
+    """Lomo de archivador: letras apiladas en columnas (texto vertical)"""
+    img = np.full((1400, 600, 3), 255, np.uint8)
+    for column, word in enumerate(["ARCHIVO", f"LOTE{rng.integers(10, 99)}", "2024"]):
+        for row, char in enumerate(word):
+            cv2.putText(img, char, (80 + column * 180, 120 + row * 140), cv2.FONT_HERSHEY_SIMPLEX, 3.0,
+                        (0, 0, 0), 5, cv2.LINE_AA)
+    return img
+
+def encode(img, ext):
+    """Codificar una imagen BGR (png/jpg/tif)"""
+    ok, buffer = cv2.imencode(f'.{ext}', img)
+    if not ok:
+        raise RuntimeError(f"No se pudo codificar .{ext}")
+    return buffer.tobytes()
+
+def pdf_document(images=(), text_pages=()):
+    """PDF con páginas escaneadas (imágenes) y páginas con capa de texto nativa"""
+    import fitz
+
+    with fitz.open() as pdf:
+        for img in images:
+            page = pdf.new_page(width=595, height=842)
+            page.insert_image(page.rect, stream=encode(img, 'png'))
+        for lines in text_pages:
+            page = pdf.new_page(width=595, height=842)
+            for row, line in enumerate(lines):
+                page.insert_text((50, 60 + row * 18), line, fontsize=11)
+        return pdf.tobytes()
+
+def build_corpus(seed=0, size=1):
+    """Corpus determinista: [{'name', 'kind', 'data'}] con `size` ejemplares de cada tipo"""
+    rng = np.random.default_rng(seed)
+    corpus = []
+    for copy in range(size):
+        invoice = invoice_image(rng, copy + 1)
+        ticket = ticket_image(rng, copy + 1)
+        text_lines = [f"Linea {row + 1} del albaran {copy + 1}: referencia {rng.integers(1000, 9999)}"
+                      for row in range(30)]
+        corpus += [
+            {'name': f'factura_{copy}.png', 'kind': 'invoice', 'data': encode(invoice, 'png')},
+            {'name': f'factura_{copy}.jpg', 'kind': 'invoice', 'data': encode(invoice, 'jpg')},
+            {'name': f'ticket_{copy}.jpg', 'kind': 'ticket', 'data': encode(ticket, 'jpg')},
+            {'name': f'factura_rot90_{copy}.png', 'kind': 'rotated',
+             'data': encode(cv2.rotate(invoice, cv2.ROTATE_90_CLOCKWISE), 'png')},
+            {'name': f'factura_rot180_{copy}.png', 'kind': 'rotated',
+             'data': encode(cv2.rotate(invoice, cv2.ROTATE_180), 'png')},
+            {'name': f'vertical_{copy}.png', 'kind': 'vertical', 'data': encode(vertical_image(rng), 'png')},
+            {'name': f'escaneo_{copy}.pdf', 'kind': 'pdf_scan', 'data': pdf_document([invoice])},
+            {'name': f'escaneo_3p_{copy}.pdf', 'kind': 'pdf_multipage',
+             'data': pdf_document([invoice, ticket, invoice_image(rng, copy + 100)])},
+            {'name': f'albaran_texto_{copy}.pdf', 'kind': 'pdf_text', 'data': pdf_document(text_pages=[text_lines])},
+        ]
+    return corpus
+
+# ---------------------------------------------------------------------------
+# Clientes
+# ---------------------------------------------------------------------------
+
+def response_scores(endpoint, payload):
+    """(bloques, confianza media, servido de caché) de una respuesta de /process o /analyze"""
+    if endpoint == '/analyze':
+        payload = payload.get('raw_data', {})
+    return payload.get('total_blocks'), payload.get('avg_confidence'), bool(payload.get('cached'))
+
+class FlaskClient:
+    """Peticiones con el cliente de pruebas de Flask (mismo proceso que el servidor)"""
+
+    def __init__(self, language):
+        self.language = language
+        self.client = ocr_app.app.test_client()
+
+    def post(self, endpoint, document, form):
+        data = {'file': (io.BytesIO(document['data']), document['name']), 'language': self.language, **form}
+        response = self.client.post(endpoint, data=data, content_type='multipart/form-data')
+        return response.status_code, response.get_json(silent=True) or {}
+
+    def rss_bytes(self):
+        return ocr_app.read_rss_bytes()
+
+    def config(self):
+        return {'cpu_config': ocr_app.cpu_config, 'ocr_workers': ocr_app.OCR_WORKERS,
+                'threads_per_worker': ocr_app.THREADS_PER_WORKER, 'ocr_pool': ocr_app.ocr_pool.stats()}
+
+class HttpClient:
+    """Peticiones HTTP reales (multipart con urllib, sin dependencias extra)"""
+
+    def __init__(self, url, language, timeout):
+        self.url = url.rstrip('/')
+        self.language = language
+        self.timeout = timeout
+
+    def post(self, endpoint, document, form):
+        boundary = uuid.uuid4().hex
+        parts = []
+        for key, value in {'language': self.language, **form}.items():
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode())
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{document["name"]}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode() + document['data'] + b'\r\n')
+        parts.append(f'--{boundary}--\r\n'.encode())
+        req = urllib.request.Request(self.url + endpoint, data=b''.join(parts), method='POST',
+                                     headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                return e.code, json.loads(e.read())
+            except ValueError:
+                return e.code, {}
+
+    def rss_bytes(self):
+        # RSS del proceso HTTP del servidor según su /metrics
+        try:
+            with urllib.request.urlopen(self.url + '/metrics', timeout=5) as response:
+                for line in response.read().decode().splitlines():
+                    if line.startswith('process_resident_memory_bytes '):
+                        return int(float(line.split()[1]))
+        except (OSError, ValueError):
+            pass
+        return 0
+
+    def config(self):
+        try:
+            with urllib.request.urlopen(self.url + '/stats', timeout=5) as response:
+                stats = json.loads(response.read())
+            return {'cpu_optimization': stats.get('cpu_optimization'), 'ocr_pool': stats.get('ocr_pool')}
+        except (OSError, ValueError):
+            return {}
+
+class RssSampler:
+    """Muestreo periódico de RSS en segundo plano; guarda el máximo"""
+
+    def __init__(self, read, interval=0.2):
+        self.read = read
+        self.interval = interval
+        self.peak = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            self.peak = max(self.peak, self.read())
+            self.stop_event.wait(self.interval)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        self.thread.join()
+        self.peak = max(self.peak, self.read())
+
+# ---------------------------------------------------------------------------
+# Ejecución
+# ---------------------------------------------------------------------------
+
+def run_level(client, endpoint, corpus, form, concurrency, total_requests):
+    """Enviar total_requests peticiones (corpus en bucle) con `concurrency` en paralelo"""
+    times, statuses, documents = [], {}, {}
+    cached = [0]
+    lock = threading.Lock()
+
+    def one(index):
+        document = corpus[index % len(corpus)]
+        start = time.perf_counter()
+        status, payload = client.post(endpoint, document, form)
+        elapsed = time.perf_counter() - start
+        with lock:
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                times.append(elapsed)
+                blocks, confidence, hit = response_scores(endpoint, payload)
+                cached[0] += hit
+                if document['name'] not in documents:
+                    documents[document['name']] = {'kind': document['kind'], 'blocks': blocks,
+                                                    'avg_confidence': confidence}
+
+    with RssSampler(client.rss_bytes) as sampler:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(one, range(total_requests)))
+        wall = time.perf_counter() - start
+
+    return {
+        'endpoint': endpoint,
+        'concurrency': concurrency,
+        'requests': total_requests,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'cached': cached[0],
+        'throughput_rps': round(len(times) / wall, 3) if wall else 0.0,
+        'wall_seconds': round(wall, 3),
+        'latency': summarize(times, percentiles=(50, 95, 99)),
+        'peak_rss_mb': round(sampler.peak / 1024 / 1024, 1),
+        'documents': documents
+    }
+
+def compare(results, baseline):
+    """Deltas de latencia, throughput, bloques y confianza frente a un JSON anterior"""
+    previous = {(level['endpoint'], level['concurrency']): level for level in baseline.get('levels', [])}
+    deltas = []
+    for level in results:
+        before = previous.get((level['endpoint'], level['concurrency']))
+        if before is None:
+            continue
+        documents = {}
+        for name, scores in level['documents'].items():
+            old = before['documents'].get(name)
+            if old is None or old['blocks'] is None or scores['blocks'] is None:
+                continue
+            documents[name] = {
+                'blocks': scores['blocks'] - old['blocks'],
+                'avg_confidence': round((scores['avg_confidence'] or 0) - (old['avg_confidence'] or 0), 4)
+            }
+        deltas.append({
+            'endpoint': level['endpoint'],
+            'concurrency': level['concurrency'],
+            'p50_ms': round(level['latency']['p50_ms'] - before['latency']['p50_ms'], 2),
+            'p95_ms': round(level['latency']['p95_ms'] - before['latency']['p95_ms'], 2),
+            'throughput_rps': round(level['throughput_rps'] - before['throughput_rps'], 3),
+            'peak_rss_mb': round(level['peak_rss_mb'] - before['peak_rss_mb'], 1),
+            'documents': documents
+        })
+    return deltas
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Benchmark de carga de /process y /analyze sobre un corpus sintético')
+    parser.add_argument('--url', help='Servidor HTTP (p. ej. http://localhost:8501); sin él, cliente de pruebas de Flask')
+    parser.add_argument('--endpoints', default='/process,/analyze', help='Endpoints separados por comas')
+    parser.add_argument('--concurrency', default='1,4', help='Niveles de concurrencia separados por comas')
+    parser.add_argument('--requests', type=int, default=0, help='Peticiones por nivel (por defecto 2 pasadas del corpus)')
+    parser.add_argument('--corpus-size', type=int, default=1, help='Ejemplares de cada tipo de documento')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--language', default=ocr_app.default_lang)
+    parser.add_argument('--detailed', action='store_true', help='Pedir detailed=true a /process')
+    parser.add_argument('--timeout', type=float, default=300, help='Timeout por petición HTTP (s)')
+    parser.add_argument('--cache', action='store_true',
+                        help='Mantener la caché de resultados (cliente Flask); por defecto se desactiva')
+    parser.add_argument('--rate-limit', action='store_true',
+                        help='Mantener el rate limiting por IP (cliente Flask); por defecto se desactiva')
+    parser.add_argument('--save-corpus', help='Guardar el corpus en este directorio (y salir)')
+    parser.add_argument('--baseline', help='JSON de una ejecución anterior para calcular deltas')
+    parser.add_argument('--label', default='', help='Etiqueta libre guardada en el JSON (p. ej. el cambio probado)')
+    parser.add_argument('--json', help='Guardar resultados en este archivo JSON')
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.seed, args.corpus_size)
+    if args.save_corpus:
+        output = Path(args.save_corpus)
+        output.mkdir(parents=True, exist_ok=True)
+        for document in corpus:
+            (output / document['name']).write_bytes(document['data'])
+        print(f"💾 {len(corpus)} documentos guardados en {output}")
+        return
+
+    if args.url:
+        client = HttpClient(args.url, args.language, args.timeout)
+    else:
+        if not ocr_app.initialize_ocr_cpu(wait=True):
+            print("❌ No se pudieron cargar los modelos OCR")
+            sys.exit(1)
+        if not args.cache:
+            # Cada documento se repite: sin esto se mediría la caché y no el OCR
+            ocr_app.result_cache = None
+        if not args.rate_limit:
+            # Todas las peticiones salen de 127.0.0.1: con el límite por IP se medirían 429
+            ocr_app.rate_limiter = ocr_app.RateLimiter(sys.maxsize, ocr_app.RATE_LIMIT_WINDOW,
+                                                       ocr_app.RATE_LIMIT_MAX_KEYS)
+        client = FlaskClient(args.language)
+
+    endpoints = [endpoint.strip() for endpoint in args.endpoints.split(',') if endpoint.strip()]
+    levels = [int(level) for level in args.concurrency.split(',')]
+    total_requests = args.requests or 2 * len(corpus)
+    form = {'detailed': 'true'} if args.detailed else {}
+
+    print(f"🔍 {len(corpus)} documentos sintéticos, {total_requests} peticiones por nivel, "
+          f"concurrencia {levels}, {'HTTP ' + args.url if args.url else 'cliente Flask'}")
+
+    # Calentamiento: cada documento una vez (carga de modelos y kernels por forma de entrada)
+    for document in corpus:
+        status, _ = client.post(endpoints[0], document, form)
+        if status != 200:
+            print(f"⚠️ Calentamiento {document['name']}: HTTP {status}")
+
+    results = []
+    for endpoint in endpoints:
+        for concurrency in levels:
+            level = run_level(client, endpoint, corpus, form if endpoint == '/process' else {},
+                              concurrency, total_requests)
+            results.append(level)
+            latency = level['latency']
+            print(f"📊 {endpoint:9s} x{concurrency:<3d} {level['throughput_rps']:7.2f} req/s  "
+                  f"p50 {latency['p50_ms']}ms  p95 {latency['p95_ms']}ms  p99 {latency['p99_ms']}ms  "
+                  f"RSS {level['peak_rss_mb']}MB  {level['statuses']}")
+            if level['cached']:
+                print(f"   ⚠️ {level['cached']} respuestas servidas desde la caché de resultados "
+                      f"(RESULT_CACHE_SIZE=0 en el servidor para medir solo OCR)")
+            failed = {status: count for status, count in level['statuses'].items() if status != '200'}
+            if failed:
+                print(f"   ⚠️ Respuestas distintas de 200: {failed} (429 = rate limiting del servidor, "
+                      f"503 = cola llena); la latencia solo cuenta las 200")
+
+    print("=" * 60)
+    for name, scores in results[0]['documents'].items():
+        print(f"📄 {name:28s} {scores['kind']:14s} bloques {scores['blocks']}  confianza {scores['avg_confidence']}")
+
+    output = {'label': args.label, 'timestamp': time.time(), 'mode': 'http' if args.url else 'flask',
+              'config': client.config(), 'corpus': [{'name': d['name'], 'kind': d['kind'], 'bytes': len(d['data'])}
+                                                    for d in corpus],
+              'levels': results}
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            output['deltas'] = compare(results, json.load(f))
+        print("=" * 60)
+        for delta in output['deltas']:
+            changed = {name: d for name, d in delta['documents'].items() if d['blocks'] or abs(d['avg_confidence']) >= 0.01}
+            print(f"⚖️ {delta['endpoint']:9s} x{delta['concurrency']:<3d} p50 {delta['p50_ms']:+}ms  "
+                  f"p95 {delta['p95_ms']:+}ms  throughput {delta['throughput_rps']:+} req/s  "
+                  f"RSS {delta['peak_rss_mb']:+}MB  documentos con cambios: {len(changed)}")
+            for name, d in changed.items():
+                print(f"   📄 {name}: bloques {d['blocks']:+d}, confianza {d['avg_confidence']:+}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(output, f, indent=2, default=str)
+        print(f"💾 Resultados guardados en {args.json}")
+
+    if any(status != '200' for level in results for status in level['statuses']):
+        print("❌ Hubo respuestas distintas de 200: los resultados no son comparables")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark de serialización: jsonify de bloques detallados vs columnar JSON vs msgpack columnar
+Mide, para páginas sintéticas con N bloques, el coste de serializar la respuesta
+de /process?detailed=true en el servidor, el de parsearla en el cliente y el
+tamaño en bytes.
+
+Uso:
+    python benchmarks/bench_serialization.py
+    python benchmarks/bench_serialization.py --sizes 1000,10000 --repeat 20 --json serialization.json
+"""
+
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as ocr_app
+from _stats import summarize
+
+def synthetic_page(count, seed=0):
+    """Salida OCR sintética: textos (con repeticiones), confianzas, cajas de 4 puntos y páginas"""
+    rng = np.random.default_rng(seed)
+    vocabulary = [f"Concepto {i} {'x' * (i % 20)}" for i in range(max(1, count // 3))]
+    text_lines = [vocabulary[i] for i in rng.integers(0, len(vocabulary), count)]
+    confidences = rng.uniform(0.5, 1.0, count).tolist()
+    origins = rng.uniform(0, 1800, (count, 2))
+    sizes = rng.uniform([40, 12], [500, 40], (count, 2))
+    coordinates_list = [[[float(x), float(y)], [float(x + w), float(y)], [float(x + w), float(y + h)], [float(x), float(y + h)]]
+                        for (x, y), (w, h) in zip(np.round(origins), np.round(sizes))]
+    block_pages = [1 + i * 4 // count for i in range(count)]
+    return text_lines, confidences, coordinates_list, block_pages
+
+def serializers(text_lines, confidences, coordinates_list, block_pages):
+    """(nombre, serializar, parsear) de cada formato, incluyendo construir los bloques"""
+    import msgpack
+
+    def json_rows():
+        geometry = ocr_app.BlockGeometry(coordinates_list, confidences)
+        blocks = ocr_app.build_blocks(text_lines, confidences, coordinates_list, block_pages,
+                                      orientations=geometry.orientations)
+        return ocr_app.jsonify({'blocks': blocks}).get_data()
+
+    def json_columnar():
+        geometry = ocr_app.BlockGeometry(coordinates_list, confidences)
+        blocks = ocr_app.build_columnar_blocks(text_lines, confidences, block_pages, geometry)
+        return ocr_app.jsonify({'blocks': blocks}).get_data()
+
+    def msgpack_columnar():
+        geometry = ocr_app.BlockGeometry(coordinates_list, confidences)
+        blocks = ocr_app.build_columnar_blocks(text_lines, confidences, block_pages, geometry, binary=True)
+        return ocr_app.serialize_response({'blocks': blocks}, 'msgpack').get_data()
+
+    def parse_rows(payload):
+        blocks = json.loads(payload)['blocks']
+        return [block['text'] for block in blocks], [block['coordinates'] for block in blocks]
+
+    def parse_columnar(payload):
+        blocks = json.loads(payload)['blocks']
+        coordinates = np.asarray(blocks['coordinates'], dtype=blocks['dtypes']['coordinates']).reshape(-1, 4, 2)
+        return [blocks['strings'][i] for i in blocks['text']], coordinates
+
+    def parse_msgpack(payload):
+        blocks = msgpack.unpackb(payload)['blocks']
+        dtypes = blocks['dtypes']
+        coordinates = np.frombuffer(blocks['coordinates'], dtype='<' + np.dtype(dtypes['coordinates']).str[1:])
+        text_index = np.frombuffer(blocks['text'], dtype='<u4')
+        return [blocks['strings'][i] for i in text_index.tolist()], coordinates.reshape(-1, 4, 2)
+
+    return [('json', json_rows, parse_rows),
+            ('columnar', json_columnar, parse_columnar),
+            ('msgpack', msgpack_columnar, parse_msgpack)]
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Benchmark de formatos de respuesta de /process')
+    parser.add_argument('--sizes', default='100,1000,10000', help='Números de bloques separados por comas')
+    parser.add_argument('--repeat', type=int, default=10, help='Repeticiones por tamaño')
+    parser.add_argument('--json', help='Guardar resultados en este archivo JSON')
+    args = parser.parse_args()
+
+    results = []
+    with ocr_app.app.app_context():
+        for size in (int(s) for s in args.sizes.split(',')):
+            page = synthetic_page(size)
+            entry = {'blocks': size}
+            for name, serialize, parse in serializers(*page):
+                payload = serialize()
+                texts, _ = parse(payload)
+                if texts != page[0]:
+                    print(f"❌ {name}: los textos no coinciden tras el parseo")
+                    sys.exit(1)
+
+                times = {'serialize': [], 'parse': []}
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    payload = serialize()
+                    times['serialize'].append(time.perf_counter() - start)
+                    start = time.perf_counter()
+                    parse(payload)
+                    times['parse'].append(time.perf_counter() - start)
+                entry[name] = {'bytes': len(payload), 'serialize': summarize(times['serialize'], digits=3),
+                               'parse': summarize(times['parse'], digits=3)}
+            results.append(entry)
+
+            print(f"📦 {size:6d} bloques: " + " | ".join(
+                f"{name} {entry[name]['serialize']['mean_ms']}ms + {entry[name]['parse']['mean_ms']}ms, "
+                f"{entry[name]['bytes'] // 1024}KB" for name in ('json', 'columnar', 'msgpack')))
+
+    print("=" * 60)
+    for entry in results:
+        base = entry['json']
+        for name in ('columnar', 'msgpack'):
+            total = entry[name]['serialize']['mean_ms'] + entry[name]['parse']['mean_ms']
+            speedup = (base['serialize']['mean_ms'] + base['parse']['mean_ms']) / total if total else 0.0
+            print(f"⚡ {entry['blocks']:6d} bloques {name:8s}: x{speedup:.2f} más rápido, "
+                  f"{entry[name]['bytes'] / base['bytes'] * 100:.0f}% del tamaño JSON")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'results': results}, f, indent=2)
+        print(f"💾 Resultados guardados en {args.json}")
+
+if __name__ == "__main__":
+    main()
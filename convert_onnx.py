@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Conversión offline de los modelos PaddleOCR cacheados a ONNX (OCR_BACKEND=onnx)
+Recorre la caché de PaddleOCR (~/.paddleocr/whl: det, rec y cls ya descargados),
+convierte cada modelo con paddle2onnx y, con --int8, genera además la versión
+cuantizada: el detector con cuantización estática (calibrada con páginas) y
+reconocedor/clasificador con cuantización dinámica de pesos.
+
+La salida mantiene la misma estructura que la caché (det/<idioma>/<modelo>/
+model.onnx y model.int8.onnx), que es donde OnnxBackend busca los modelos.
+
+Uso:
+    python convert_onnx.py
+    python convert_onnx.py --int8 --calibration ./data/input
+    python convert_onnx.py --source /root/.paddleocr/whl --output /app/.paddleocr/onnx --force
+"""
+
+import os
+import sys
+import glob
+import argparse
+import subprocess
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import cv2
+
+# Normalización de DetResizeForTest + NormalizeImage de PaddleOCR (BGR, ImageNet)
+DET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+DET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+def default_source():
+    """Caché de modelos de PaddleOCR (BASE_DIR/whl)"""
+    try:
+        from paddleocr.paddleocr import BASE_DIR
+    except ImportError:
+        BASE_DIR = os.path.expanduser('~/.paddleocr/')
+    return os.path.join(BASE_DIR, 'whl')
+
+def find_models(source):
+    """Directorios de modelos Paddle (con inference.pdmodel) relativos a la caché"""
+    models = []
+    for model_file in sorted(glob.glob(os.path.join(source, '**', 'inference.pdmodel'), recursive=True)):
+        model_dir = os.path.dirname(model_file)
+        models.append((model_dir, os.path.relpath(model_dir, source)))
+    return models
+
+def convert_model(model_dir, output_file, opset):
+    """paddle2onnx sobre un directorio de inferencia (entradas dinámicas)"""
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    command = [sys.executable, '-m', 'paddle2onnx.command',
+               '--model_dir', model_dir,
+               '--model_filename', 'inference.pdmodel',
+               '--params_filename', 'inference.pdiparams',
+               '--save_file', output_file,
+               '--opset_version', str(opset),
+               '--enable_onnx_checker', 'True']
+    subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+def det_input(img, limit_side_len=960):
+    """Preproceso del detector: lado máximo limit_side_len, múltiplos de 32, normalizado, NCHW"""
+    height, width = img.shape[:2]
+    ratio = min(1.0, float(limit_side_len) / max(height, width))
+    resize_h = max(32, int(round(height * ratio / 32) * 32))
+    resize_w = max(32, int(round(width * ratio / 32) * 32))
+    img = cv2.resize(img, (resize_w, resize_h)).astype(np.float32) / 255.0
+    img = (img - DET_MEAN) / DET_STD
+    return img.transpose(2, 0, 1)[np.newaxis].copy()
+
+def synthetic_pages(count=8, seed=0):
+    """Páginas tipo factura para calibrar si no hay corpus propio"""
+    rng = np.random.default_rng(seed)
+    pages = []
+    for index in range(count):
+        img = np.full((1754, 1240, 3), 255, np.uint8)
+        for row in range(int(rng.integers(15, 40))):
+            text = f"Concepto {rng.integers(1000, 9999)}   {rng.integers(1, 99)} x {rng.integers(100, 9999) / 100:.2f}"
+            cv2.putText(img, text, (int(rng.integers(40, 300)), 80 + row * 40), cv2.FONT_HERSHEY_SIMPLEX,
+                        float(rng.uniform(0.6, 1.2)), (0, 0, 0), 2, cv2.LINE_AA)
+        if index % 4 == 3:
+            img = cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+        pages.append(img)
+    return pages
+
+def calibration_pages(directory, limit):
+    """Imágenes de calibración del detector (un directorio de facturas o páginas sintéticas)"""
+    if not directory:
+        return synthetic_pages()
+    pages = []
+    for path in sorted(Path(directory).iterdir()):
+        if path.suffix.lower() in ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff'):
+            img = cv2.imread(str(path), cv2.IMREAD_COLOR)
+            if img is not None:
+                pages.append(img)
+        if len(pages) >= limit:
+            break
+    return pages or synthetic_pages()
+
+def quantize_det(model_file, output_file, pages):
+    """Cuantización estática QDQ del detector (convoluciones) calibrada con páginas reales"""
+    import onnxruntime as ort
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                          quantize_static)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    input_name = ort.InferenceSession(model_file, providers=['CPUExecutionProvider']).get_inputs()[0].name
+
+    class PageReader(CalibrationDataReader):
+        def __init__(self):
+            self.inputs = iter([{input_name: det_input(img)} for img in pages])
+
+        def get_next(self):
+            return next(self.inputs, None)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        prepared = os.path.join(tmp_dir, 'prepared.onnx')
+        quant_pre_process(model_file, prepared, skip_symbolic_shape=True)
+        quantize_static(prepared, output_file, PageReader(), quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+
+def quantize_weights(model_file, output_file):
+    """Cuantización dinámica (pesos INT8) para reconocedor y clasificador"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(model_file, output_file, weight_type=QuantType.QInt8)
+
+def size_mb(path):
+    return os.path.getsize(path) / 1024 / 1024
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Convertir los modelos PaddleOCR cacheados a ONNX (y INT8)')
+    parser.add_argument('--source', default=default_source(), help='Caché de PaddleOCR (whl/)')
+    parser.add_argument('--output', default=os.environ.get('ONNX_MODEL_DIR', '/app/.paddleocr/onnx'))
+    parser.add_argument('--opset', type=int, default=11)
+    parser.add_argument('--int8', action='store_true', help='Generar también model.int8.onnx')
+    parser.add_argument('--calibration', help='Directorio de imágenes para calibrar el detector (--int8)')
+    parser.add_argument('--calibration-pages', type=int, default=32)
+    parser.add_argument('--force', action='store_true', help='Reconvertir aunque ya exista el .onnx')
+    args = parser.parse_args()
+
+    models = find_models(args.source)
+    if not models:
+        print(f"❌ No hay modelos PaddleOCR en {args.source} (arrancar el servidor una vez para descargarlos)")
+        sys.exit(1)
+    print(f"🔍 {len(models)} modelos en {args.source} → {args.output}")
+
+    pages = None
+    failed = 0
+    for model_dir, relative in models:
+        stage = relative.split(os.sep, 1)[0]
+        output_dir = os.path.join(args.output, relative)
+        onnx_file = os.path.join(output_dir, 'model.onnx')
+        try:
+            if args.force or not os.path.exists(onnx_file):
+                convert_model(model_dir, onnx_file, args.opset)
+            print(f"✅ {relative}: model.onnx {size_mb(onnx_file):.1f}MB")
+
+            if args.int8:
+                int8_file = os.path.join(output_dir, 'model.int8.onnx')
+                if args.force or not os.path.exists(int8_file):
+                    if stage == 'det':
+                        if pages is None:
+                            pages = calibration_pages(args.calibration, args.calibration_pages)
+                        quantize_det(onnx_file, int8_file, pages)
+                    else:
+                        quantize_weights(onnx_file, int8_file)
+                print(f"   ⚡ model.int8.onnx {size_mb(int8_file):.1f}MB")
+        except (subprocess.CalledProcessError, ImportError, RuntimeError, ValueError) as e:
+            failed += 1
+            output = getattr(e, 'output', b'') or b''
+            print(f"❌ {relative}: {e} {output.decode(errors='replace')[-500:]}")
+
+    print("=" * 60)
+    print(f"📦 Modelos ONNX en {args.output}; activar con OCR_BACKEND=onnx"
+          f"{' y ONNX_INT8=true para los cuantizados' if args.int8 else ''}")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
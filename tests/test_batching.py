@@ -0,0 +1,86 @@
+"""Micro-batching de reconocimiento: una sola pasada por lote fusionado y plazo de los seguidores"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import app
+
+
+class FakeRecognizer:
+    """Reconocedor que trocea como TextRecognizer de PaddleOCR (sub-lotes de rec_batch_num)"""
+
+    def __init__(self, calls, delay=0.0):
+        self.rec_batch_num = 6
+        self.calls = calls
+        self.delay = delay
+
+    def __call__(self, crops):
+        for start in range(0, len(crops), self.rec_batch_num):
+            self.calls.append(len(crops[start:start + self.rec_batch_num]))
+            time.sleep(self.delay)
+        return [(crop, 0.9) for crop in crops], 0.0
+
+
+def make_replica(calls, delay=0.0):
+    return SimpleNamespace(args=SimpleNamespace(lang='es'), text_recognizer=FakeRecognizer(calls, delay))
+
+
+@pytest.fixture
+def busy_pool(monkeypatch):
+    monkeypatch.setattr(app, 'ocr_pool', SimpleNamespace(busy_workers=4))
+
+
+def test_merged_batch_runs_in_one_inference(busy_pool):
+    calls = []
+    batcher = app.RecognitionBatcher(24, 2.0)
+    replicas = [make_replica(calls) for _ in range(4)]
+    results = {}
+
+    def worker(index):
+        crops = [f"r{index}-{n}" for n in range(6)]
+        results[index] = batcher.recognize(replicas[index], crops)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    # Sin fusionar serían 4 pasadas de 6 recortes; el lote fusionado va en una
+    assert calls == [24]
+    assert batcher.stats()['batches'] == 1
+    for index in range(4):
+        assert [text for text, _ in results[index]] == [f"r{index}-{n}" for n in range(6)]
+    assert all(replica.text_recognizer.rec_batch_num == 6 for replica in replicas)
+
+
+def test_follower_stops_waiting_at_its_deadline(busy_pool):
+    calls = []
+    batcher = app.RecognitionBatcher(12, 0.2)
+    leader_started = threading.Event()
+    slow = make_replica(calls, delay=1.0)
+
+    def leader():
+        leader_started.set()
+        batcher.recognize(slow, ['a'] * 6)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    leader_started.wait()
+    time.sleep(0.05)
+
+    context = app.RequestMetrics('/process')
+    context.set_timeout(100)
+    app.bind_request_metrics(context)
+    try:
+        start = time.perf_counter()
+        with pytest.raises(app.DeadlineExceededError):
+            batcher.recognize(make_replica(calls), ['b'] * 6)
+        assert time.perf_counter() - start < 0.5
+    finally:
+        app.bind_request_metrics(None)
+        context.finish()
+        thread.join(5)
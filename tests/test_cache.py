@@ -0,0 +1,31 @@
+"""Clave de la caché de resultados: ajustes del servidor que cambian el resultado"""
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return app.ResultCache(8, str(tmp_path), 100)
+
+
+@pytest.mark.parametrize('setting, value', [
+    ('IMAGE_INGEST_MAX_SIDE', 2000),
+    ('DET_RESOLUTION', 'auto'),
+    ('DET_RESOLUTION_BUCKETS', [960, 1920]),
+    ('DET_TILE_SIZE', 640),
+    ('TEXT_LAYER_MIN_CHARS', 5),
+    ('CLS_PRECHECK_SAMPLES', 2),
+])
+def test_key_changes_with_result_settings(cache, monkeypatch, setting, value):
+    before = cache.make_key(b'factura', 'es', False)
+    monkeypatch.setattr(app, setting, value)
+    assert cache.make_key(b'factura', 'es', False) != before
+
+
+def test_key_ignores_admission_settings(cache, monkeypatch):
+    before = cache.make_key(b'factura', 'es', False)
+    monkeypatch.setattr(app, 'PIXEL_BUDGET', 1)
+    monkeypatch.setattr(app, 'IMAGE_MAX_PIXELS', 1)
+    assert cache.make_key(b'factura', 'es', False) == before
@@ -0,0 +1,121 @@
+"""Decodificación e ingesta de imágenes: orientación EXIF y normalización a BGR de 8 bits"""
+
+import io
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image, ImageOps
+
+import app
+
+
+def make_jpeg(width, height, orientation):
+    """JPEG de prueba con un bloque blanco en la esquina superior izquierda y la etiqueta Orientation"""
+    img = np.zeros((height, width, 3), np.uint8)
+    img[:height // 4, :width // 4] = 255
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    Image.fromarray(img).save(buffer, 'JPEG', quality=95, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def pillow_reference(data):
+    with Image.open(io.BytesIO(data)) as pil_img:
+        return cv2.cvtColor(np.array(ImageOps.exif_transpose(pil_img).convert('RGB')), cv2.COLOR_RGB2BGR)
+
+
+@pytest.mark.parametrize('orientation', range(1, 9))
+def test_decode_applies_exif_orientation(orientation):
+    data = make_jpeg(80, 40, orientation)
+    img = app.decode_image_bytes(data)
+    expected = pillow_reference(data)
+    assert img.shape == expected.shape
+    assert np.abs(img.astype(np.int16) - expected.astype(np.int16)).mean() < 2
+
+
+def test_decode_phone_photo_is_upright():
+    # Orientación 6: el sensor guarda la foto apaisada y la etiqueta pide girarla 90° a la derecha
+    img = app.decode_image_bytes(make_jpeg(80, 40, 6))
+    assert img.shape[:2] == (80, 40)
+    assert img[:10, -10:].mean() > 200
+    assert img[:10, :10].mean() < 50
+
+
+def test_decode_keeps_alpha_and_16bit_normalization():
+    rgba = np.zeros((20, 20, 4), np.uint8)
+    rgba[..., 3] = 0
+    ok, png = cv2.imencode('.png', rgba)
+    assert ok
+    img = app.decode_image_bytes(png.tobytes())
+    assert img.dtype == np.uint8 and img.shape == (20, 20, 3)
+    assert img.min() == 255
+
+    gray16 = np.full((10, 10), 4096, np.uint16)
+    ok, png16 = cv2.imencode('.png', gray16)
+    assert ok
+    img = app.decode_image_bytes(png16.tobytes())
+    assert img.dtype == np.uint8 and img.shape == (10, 10, 3)
+    assert img.max() == 255
+
+
+def marker_center(img):
+    ys, xs = np.nonzero(img[..., 0] > 128)
+    return xs.mean(), ys.mean()
+
+
+@pytest.mark.parametrize('orientation', [1, 3, 6, 8])
+def test_ingest_rotated_oversized_jpeg_coordinates(orientation):
+    # 6000x3000 almacenada: con orientación 6/8 la página derecha es 3000x6000
+    data = make_jpeg(6000, 3000, orientation)
+    header = app.read_image_header(data)
+    upright = pillow_reference(data)
+    assert header[:2] == (upright.shape[1], upright.shape[0])
+
+    img, scale = app.ingest_image(data, max_side=1500)
+    assert max(img.shape[:2]) == 1500
+    assert img.shape[1] / img.shape[0] == pytest.approx(upright.shape[1] / upright.shape[0], rel=0.01)
+    assert scale == pytest.approx(1500 / 6000)
+
+    # Una caja alrededor de la marca en la imagen ingerida vuelve a coordenadas de la subida
+    x, y = marker_center(img)
+    box = [[x - 1, y - 1], [x + 1, y - 1], [x + 1, y + 1], [x - 1, y + 1]]
+    mapped = app.map_blocks([[box, ('text', 0.99)]], scale=scale)[0][0]
+    expected_x, expected_y = marker_center(upright)
+    assert np.mean([point[0] for point in mapped]) == pytest.approx(expected_x, abs=8)
+    assert np.mean([point[1] for point in mapped]) == pytest.approx(expected_y, abs=8)
+
+
+def test_probe_document_uses_oriented_size():
+    data = make_jpeg(6000, 3000, 6)
+    pixels, pages = app.probe_document(data, 'photo.jpg')
+    assert pages == 1
+    assert pixels == 2000 * 4000
+
+
+def make_tiff(sizes):
+    pages = [Image.new('RGB', size, 'white') for size in sizes]
+    buffer = io.BytesIO()
+    pages[0].save(buffer, 'TIFF', save_all=True, append_images=pages[1:])
+    return buffer.getvalue()
+
+
+def test_multipage_tiff_checks_every_page_before_decoding(monkeypatch):
+    monkeypatch.setattr(app, 'IMAGE_MAX_PIXELS', 1000 * 1000)
+    data = make_tiff([(100, 200), (2000, 1000)])
+    decoded = []
+    monkeypatch.setattr(app, 'decode_tiff_page', lambda *args: decoded.append(args))
+
+    with pytest.raises(app.ImageTooLargeError):
+        app.probe_document(data, 'lote.tiff')
+    with pytest.raises(app.ImageTooLargeError):
+        app.ingest_image(data, page_index=1)
+    assert decoded == []
+
+
+def test_multipage_tiff_reserves_largest_page():
+    data = make_tiff([(100, 200), (600, 500), (300, 300)])
+    assert app.probe_document(data, 'lote.tiff') == (600 * 500, 3)
+    img, scale = app.ingest_image(data, page_index=1)
+    assert img.shape[:2] == (500, 600) and scale == 1.0
@@ -0,0 +1,85 @@
+"""Extracción de lotes de POST /jobs: volcado a disco por bloques y límites de tamaño"""
+
+import io
+import os
+import time
+import zipfile
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import app
+
+
+def make_zip(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def test_extract_spools_zip_entries_and_direct_uploads(tmp_path):
+    uploads = [
+        FileStorage(make_zip([('a/factura1.png', b'png-1'), ('notas.txt', b'x'), ('factura2.pdf', b'pdf-2')]),
+                    filename='lote.zip'),
+        FileStorage(io.BytesIO(b'jpg-3'), filename='foto.jpg')
+    ]
+    files = app.extract_job_files(uploads, str(tmp_path))
+    assert [name for name, _ in files] == ['factura1.png', 'factura2.pdf', 'foto.jpg']
+    assert [open(path, 'rb').read() for _, path in files] == [b'png-1', b'pdf-2', b'jpg-3']
+    assert all(os.path.dirname(path) == str(tmp_path) for _, path in files)
+
+
+def test_zip_bomb_is_rejected_by_batch_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'JOB_MAX_BATCH_BYTES', 30 * 1024 * 1024)
+    # Cada entrada cabe en MAX_FILE_SIZE (20MB de ceros, unos KB comprimidos) pero el lote no
+    zeros = bytes(20 * 1024 * 1024)
+    bomb = make_zip([(f"pagina{index}.png", zeros) for index in range(10)])
+    assert len(bomb.getvalue()) < 1024 * 1024
+
+    with pytest.raises(app.BatchTooLargeError):
+        app.extract_job_files([FileStorage(bomb, filename='bomba.zip')], str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+def test_zip_entry_over_max_file_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'MAX_FILE_SIZE', 1024)
+    archive = make_zip([('ok.png', b'1' * 100), ('grande.png', b'0' * 4096)])
+    with pytest.raises(app.RequestError, match='File too large in zip'):
+        app.extract_job_files([FileStorage(archive, filename='lote.zip')], str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+def test_too_many_files_stops_extraction(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'JOB_MAX_BATCH_FILES', 3)
+    archive = make_zip([(f"f{index}.png", b'x') for index in range(10)])
+    with pytest.raises(app.RequestError, match='Too many files'):
+        app.extract_job_files([FileStorage(archive, filename='lote.zip')], str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+def test_job_fails_when_pool_stays_saturated(tmp_path, monkeypatch):
+    attempts = []
+
+    def saturated(*args):
+        attempts.append(args)
+        raise app.PoolSaturatedError(1)
+
+    monkeypatch.setattr(app, 'build_process_response', saturated)
+    manager = app.JobManager(1, 10, 60, str(tmp_path), saturated_max_wait=0.3)
+    spool_path = tmp_path / 'entrada'
+    spool_path.write_bytes(b'png')
+    _, jobs = manager.submit([('factura.png', str(spool_path))], {'lang': 'es', 'fields': None})
+
+    job_id = jobs[0]['job_id']
+    deadline = time.monotonic() + 5
+    while manager.get(job_id)['status'] in ('queued', 'running') and time.monotonic() < deadline:
+        time.sleep(0.05)
+    job = manager.get(job_id)
+    assert job['status'] == 'failed'
+    assert 'OCR queue full' in job['error']
+    assert attempts
+    assert manager.stats()['failed'] == 1
+    assert not spool_path.exists()
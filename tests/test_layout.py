@@ -0,0 +1,43 @@
+"""Orden de lectura (layout=lines|paragraphs): columnas de texto frente a tablas"""
+
+import random
+
+import app
+
+
+def box(x, y, width, height=20):
+    return [[x, y], [x + width, y], [x + width, y + height], [x, y + height]]
+
+
+def layout(blocks, mode='lines'):
+    random.Random(1).shuffle(blocks)
+    texts = [text for text, _ in blocks]
+    confidences = [0.9] * len(blocks)
+    geometry = app.BlockGeometry([coords for _, coords in blocks], confidences)
+    return app.build_layout(texts, confidences, [1] * len(blocks), geometry, mode)
+
+
+def test_two_column_article_reads_column_by_column():
+    # Líneas de ambas columnas en la misma rejilla de renglones, separadas por un canal estrecho
+    blocks = [('TITULO DEL ARTICULO', box(50, 20, 850))]
+    blocks += [(f"izquierda {row}", box(50, 80 + row * 28, 420 if row % 5 != 4 else 260)) for row in range(12)]
+    blocks += [(f"derecha {row}", box(510, 80 + row * 28, 390 if row % 6 != 5 else 200)) for row in range(12)]
+    lines, _ = layout(blocks)
+    assert [line['text'] for line in lines] == (['TITULO DEL ARTICULO'] + [f"izquierda {row}" for row in range(12)]
+                                                + [f"derecha {row}" for row in range(12)])
+
+
+def test_table_rows_are_read_across_columns():
+    blocks = [(f"r{row}c{column}", box(x, 400 + row * 30, width))
+              for row in range(4) for column, (x, width) in enumerate([(50, 200), (400, 80), (700, 100)])]
+    lines, _ = layout(blocks)
+    assert [line['text'] for line in lines] == [f"r{row}c0 r{row}c1 r{row}c2" for row in range(4)]
+
+
+def test_description_and_amount_table_stays_row_wise():
+    blocks = []
+    for row in range(5):
+        blocks.append((f"Concepto facturado numero {row}", box(50, 100 + row * 30, 380)))
+        blocks.append((f"{row},00", box(480, 100 + row * 30, 60)))
+    lines, _ = layout(blocks)
+    assert [line['text'] for line in lines] == [f"Concepto facturado numero {row} {row},00" for row in range(5)]
@@ -0,0 +1,37 @@
+"""Perfilado por petición: la memoria de tracemalloc es de todo el proceso"""
+
+import app
+
+
+def profiled(run):
+    context = app.RequestMetrics('/process')
+    context.start_profile()
+    try:
+        run()
+    finally:
+        profile = context.stop_profile()
+        context.finish()
+    return profile
+
+
+def test_profile_alone_is_exclusive():
+    profile = profiled(lambda: bytearray(1024 * 1024))
+    assert profile['memory_scope'] == 'process'
+    assert profile['exclusive'] is True
+
+
+def test_profile_overlapping_another_request_is_approximate():
+    def other_request():
+        app.RequestMetrics('/analyze').finish()
+
+    profile = profiled(other_request)
+    assert profile['exclusive'] is False
+
+
+def test_profile_started_while_another_request_runs_is_approximate():
+    other = app.RequestMetrics('/analyze')
+    try:
+        profile = profiled(lambda: None)
+    finally:
+        other.finish()
+    assert profile['exclusive'] is False
@@ -0,0 +1,52 @@
+"""Respuesta en streaming (stream=true) y caché de resultados"""
+
+import json
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def document_pages(monkeypatch):
+    calls = []
+
+    def iter_document_pages(data, filename, lang, page_ranges=None, use_text_layer=True, det_limit_side_len=None):
+        calls.append(filename)
+        for page in (1, 2):
+            yield page, [[[[0, 0], [50, 0], [50, 10], [0, 10]], (f"pagina {page}", 1.0)]], 'text_layer'
+
+    monkeypatch.setattr(app, 'iter_document_pages', iter_document_pages)
+    monkeypatch.setattr(app, 'reserve_pixels', lambda *args, **kwargs: app.PixelReservation(None, 0))
+    monkeypatch.setattr(app, 'result_cache', app.ResultCache(8))
+    return calls
+
+
+def stream(**kwargs):
+    with app.app.test_request_context():
+        response = app.stream_document_response(b'%PDF', 'doc.pdf', 'es', False, None, True, 0.0, **kwargs)
+        records = [json.loads(line) for line in response.response]
+        response.close()
+    return records
+
+
+def test_completed_stream_warms_the_cache(document_pages):
+    first = stream()
+    second = stream()
+    assert document_pages == ['doc.pdf']
+    assert first[0]['cached'] is False and second[0]['cached'] is True
+    assert [record['text'] for record in second if record['type'] == 'page'] == ['pagina 1', 'pagina 2']
+
+    # La respuesta completa usa la misma clave
+    pages, cached, truncated = app.run_cached_ocr(b'%PDF', 'doc.pdf', 'es', False)
+    assert cached and not truncated and len(pages) == 2
+
+
+def test_truncated_stream_is_not_cached(document_pages, monkeypatch):
+    def expired(*args, **kwargs):
+        yield 1, [[[[0, 0], [50, 0], [50, 10], [0, 10]], ('pagina 1', 1.0)]], 'text_layer'
+        raise app.DeadlineExceededError('Deadline exceeded')
+
+    monkeypatch.setattr(app, 'iter_document_pages', expired)
+    assert stream()[-1]['truncated'] is True
+    assert stream()[0]['cached'] is False